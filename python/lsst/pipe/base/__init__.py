@@ -11,3 +11,14 @@ from .pipelineBuilder import *
 from .graph import *
 from .graphBuilder import *
 from .taskFactory import *
+from .localExecutor import *
+from .resources import *
+from .structTransport import *
+from .timingTree import *
+from .profiler import *
+from .memoryTracker import *
+from .metrics import *
+from .threadSafeMetadata import *
+from .metadataStore import *
+from .fusedTask import *
+from .queryCache import *
@@ -475,12 +475,30 @@ class ArgumentParser(argparse.ArgumentParser):
         self.add_argument("--noExit", action="store_true",
                           help="Do not exit even upon failure (i.e. return a struct to the calling script)")
         self.add_argument("--profile", help="Dump cProfile statistics to filename")
+        self.add_argument("--profile-mode", dest="profileMode", choices=("cprofile", "sampling"),
+                          default="cprofile",
+                          help="Profiler used by --profile: deterministic cProfile of the main process, or "
+                               "statistical sampling of each data reference in the process which runs it")
+        self.add_argument("--profile-interval", dest="profileInterval", type=float, default=0.005,
+                          help="Sampling interval (sec) for --profile-mode=sampling")
+        self.add_argument("--metrics-file", dest="metricsFile", metavar="FILENAME",
+                          help="Write metrics of this run (target counts, method timing, memory) to filename "
+                               "in OpenMetrics text format, updated while the task runs")
+        self.add_argument("--metadata-store", dest="metadataStore", metavar="FILENAME",
+                          help="Write task metadata of all data references to a single SQLite database "
+                               "filename instead of one metadata dataset per data reference")
+        self.add_argument("--timing-stacks", dest="timingStacks", metavar="FILENAME",
+                          help="Write timing of task methods, aggregated over all data references, "
+                               "to filename in collapsed stack format for flame graph tools")
         self.add_argument("--show", nargs="+", default=(),
                           help="display the specified information to stdout and quit "
                                "(unless run is specified).")
         self.add_argument("-j", "--processes", type=int, default=1, help="Number of processes to use")
         self.add_argument("-t", "--timeout", type=float,
                           help="Timeout for multiprocessing; maximum wall time (sec)")
+        self.add_argument("--max-memory", dest="maxMemoryMB", type=int,
+                          help="Memory (MB) available for multiprocessing; limits number of processes "
+                               "according to task resource requirements")
         self.add_argument("--clobber-output", action="store_true", dest="clobberOutput", default=False,
                           help=("remove and re-create the output directory if it already exists "
                                 "(safe with -j, but not all other forms of parallel execution)"))
@@ -21,7 +21,11 @@
 #
 __all__ = ["CmdLineTask", "TaskRunner", "ButlerInitializedTaskRunner", "LegacyTaskRunner"]
 
+import os
+import io
 import sys
+import hashlib
+import tempfile
 import traceback
 import functools
 import contextlib
@@ -32,6 +36,12 @@ import lsst.afw.table as afwTable
 from .task import Task, TaskError
 from .struct import Struct
 from .argumentParser import ArgumentParser
+from .resources import ResourceBudget
+from .structTransport import SharedMemoryStruct
+from .timingTree import TimingTree
+from .profiler import SamplingProfiler
+from .metrics import MetricsSink, TaskMetrics
+from .metadataStore import MetadataStore
 from lsst.base import Packages
 from lsst.log import Log
 
@@ -45,6 +55,183 @@ def _runPool(pool, timeout, function, iterable):
     return pool.map_async(function, iterable).get(timeout)
 
 
+def _runPoolIter(pool, timeout, function, iterable):
+    """Wrapper around ``pool.imap``, yielding results in order as soon as they are available.
+
+    Timeout applies to each result separately, see `_runPool`.
+    """
+    iterator = pool.imap(function, iterable)
+    while True:
+        try:
+            yield iterator.next(timeout)
+        except StopIteration:
+            return
+
+
+def _configHash(config):
+    """Return canonical hash of a configuration.
+
+    The hash is a SHA-256 digest of the configuration saved as Python code
+    without comments and blank lines, so that it does not depend on the
+    documentation of configuration fields.
+    """
+    stream = io.StringIO()
+    config.saveToStream(stream)
+    lines = [line for line in stream.getvalue().splitlines()
+             if line.strip() and not line.lstrip().startswith("#")]
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def _configHashPath(butler, configName):
+    """Return name of the file with the hash of a persisted configuration,
+    or `None` if configuration is not stored in a local file.
+    """
+    try:
+        paths = butler.get(configName + "_filename")
+    except Exception:
+        return None
+    if not paths or not os.path.isfile(paths[0]):
+        return None
+    return paths[0] + ".sha256"
+
+
+def _readConfigHash(hashPath):
+    """Return hash of a persisted configuration, or `None` if it is not
+    known.
+
+    The hash file also records size and modification time of the
+    configuration file; the hash is ignored if the configuration file was
+    replaced after the hash was written.
+    """
+    try:
+        with open(hashPath) as hashFile:
+            configHash, size, mtime = hashFile.read().split()
+        stat = os.stat(hashPath[:-len(".sha256")])
+    except (OSError, ValueError):
+        return None
+    if (int(size), int(mtime)) != (stat.st_size, stat.st_mtime_ns):
+        return None
+    return configHash
+
+
+def _writeConfigHash(hashPath, configHash):
+    """Write hash of a persisted configuration, errors are ignored.
+    """
+    try:
+        stat = os.stat(hashPath[:-len(".sha256")])
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(hashPath), suffix=".tmp")
+        with os.fdopen(fd, "w") as hashFile:
+            hashFile.write("{} {} {}\n".format(configHash, stat.st_size, stat.st_mtime_ns))
+        os.replace(tmpName, hashPath)
+    except OSError:
+        pass
+
+
+# Task runner of a worker process, set by `_initWorker`
+_workerRunner = None
+
+
+def _initWorker(runner):
+    """Initialize worker process of a pool which keeps its task runner.
+    """
+    global _workerRunner
+    _workerRunner = runner
+
+
+class _WorkerRunnerCall:
+    """Call task runner of a worker process, which is set by `_initWorker`.
+
+    Task runner is sent to each worker process only once, so that it can
+    keep its state (e.g. a task which is cloned for each target) between
+    targets, instead of being sent with each target.
+    """
+
+    def __call__(self, args):
+        return _workerRunner(args)
+
+
+class _SharedMemoryCall:
+    """Wrapper for a task runner which returns `Struct` results from
+    worker processes via shared memory.
+
+    Parameters
+    ----------
+    runner : callable
+        Task runner (or a wrapper of it) to call.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def __call__(self, args):
+        result = self.runner(args)
+        if isinstance(result, Struct):
+            result = SharedMemoryStruct(result)
+        return result
+
+    @staticmethod
+    def unpack(result):
+        """Return result as it was returned by task runner.
+        """
+        if isinstance(result, SharedMemoryStruct):
+            result = result.unpack()
+        return result
+
+
+class _SamplingProfileCall:
+    """Wrapper for a task runner which profiles each call with
+    `SamplingProfiler`.
+
+    Parameters
+    ----------
+    runner : callable
+        Task runner (or a wrapper of it) to call.
+    filename : `str`
+        Base name of profile files, profile of a target with index ``i`` in
+        the target list is written to ``filename.i``.
+    interval : `float`
+        Sampling interval in seconds.
+    """
+
+    def __init__(self, runner, filename, interval):
+        self.runner = runner
+        self.filename = filename
+        self.interval = interval
+
+    def getFilename(self, index):
+        """Return name of the profile file for a given target index.
+        """
+        return "{}.{}".format(self.filename, index)
+
+    def __call__(self, indexedArgs):
+        index, args = indexedArgs
+        profiler = SamplingProfiler(self.interval)
+        try:
+            with profiler:
+                return self.runner(args)
+        finally:
+            profiler.writeCollapsedStacks(self.getFilename(index))
+
+    def merge(self, count, log=None):
+        """Merge profiles of all targets into a single profile.
+
+        Parameters
+        ----------
+        count : `int`
+            Number of targets.
+        log : `lsst.log.Log`, optional
+            Log object for logging the profile summary.
+        """
+        profiler = SamplingProfiler(self.interval)
+        for index in range(count):
+            filename = self.getFilename(index)
+            if os.path.exists(filename):
+                profiler.merge(SamplingProfiler.readCollapsedStacks(filename))
+        profiler.writeCollapsedStacks(self.filename)
+        if log is not None:
+            log.info("Sampling profile written to %s:\n%s", self.filename, profiler.formatSummary())
+
+
 @contextlib.contextmanager
 def profile(filename, log=None):
     """Context manager for profiling with cProfile.
@@ -140,6 +327,23 @@ class TaskRunner:
     timeout (in sec) can be specified as the ``timeout`` element in the output from
     `~lsst.pipe.base.ArgumentParser` (the ``parsedCmd``), if available, otherwise we use `TaskRunner.TIMEOUT`.
 
+    If the task config has a ``resources`` field (see `~lsst.pipe.base.ResourceConfig`) then the number of
+    processes is limited so that the cores (the ``processes`` element of ``parsedCmd``) and memory (the
+    ``maxMemoryMB`` element of ``parsedCmd``, if available) needed by all processes fit on the node.
+
+    If the task class sets ``canCloneTask`` then the task is constructed only once per process and each
+    target is processed by a clone of it (see `Task.clone`). When multiprocessing, worker processes of
+    such tasks are then kept for all targets; otherwise each target is processed in a new worker process.
+
+    When multiprocessing with ``doReturnResults`` set, results are returned from worker processes via
+    shared memory if `TaskRunner.useSharedMemory` is `True` and Python supports it: large buffers (e.g.
+    NumPy arrays) in the returned `Struct` are pickled out-of-band and copied into shared memory segments
+    instead of being serialized through the pool's pipe.
+
+    If the ``metadataStore`` element of ``parsedCmd`` is set then task metadata is not written with the
+    butler for each data reference; instead it is returned to the main process, which writes the metadata
+    of all data references to a single `MetadataStore` database file of that name.
+
     By default, we disable "implicit" threading -- ie, as provided by underlying numerical libraries such as
     MKL or BLAS. This is designed to avoid thread contention both when a single command line task spawns
     multiple processes and when multiple users are running on a shared system. Users can override this
@@ -152,6 +356,10 @@ class TaskRunner:
     TIMEOUT = 3600*24*30
     """Default timeout (seconds) for multiprocessing."""
 
+    useSharedMemory = True
+    """Return results from worker processes via shared memory, if
+    possible."""
+
     def __init__(self, TaskClass, parsedCmd, doReturnResults=False):
         self.TaskClass = TaskClass
         self.doReturnResults = bool(doReturnResults)
@@ -161,6 +369,12 @@ class TaskRunner:
         self.clobberConfig = bool(parsedCmd.clobberConfig)
         self.doBackup = not bool(parsedCmd.noBackupConfig)
         self.numProcesses = int(getattr(parsedCmd, 'processes', 1))
+        self.timingStacks = getattr(parsedCmd, 'timingStacks', None)
+        self.metricsFile = getattr(parsedCmd, 'metricsFile', None)
+        self.metadataStore = getattr(parsedCmd, 'metadataStore', None)
+        self._prototypeTask = None
+        self.timingTree = TimingTree()
+        self.taskMetrics = {}
 
         self.timeout = getattr(parsedCmd, 'timeout', None)
         if self.timeout is None or self.timeout <= 0:
@@ -171,6 +385,20 @@ class TaskRunner:
                 self.log.warn("This task does not support multiprocessing; using one process")
                 self.numProcesses = 1
 
+        if self.numProcesses > 1:
+            # do not run more processes than cores and memory allow
+            budget = ResourceBudget(self.numProcesses, getattr(parsedCmd, "maxMemoryMB", None))
+            maxProcesses = budget.maxConcurrent(*ResourceBudget.getRequirements(self.config))
+            if maxProcesses < self.numProcesses:
+                self.log.info("Resources needed by this task limit number of processes to %d", maxProcesses)
+                self.numProcesses = maxProcesses
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # cached task is not sent to other processes
+        state["_prototypeTask"] = None
+        return state
+
     def prepareForMultiProcessing(self):
         """Prepare this instance for multiprocessing
 
@@ -199,14 +427,43 @@ class TaskRunner:
         -----
         The task is run under multiprocessing if `TaskRunner.numProcesses` is more than 1; otherwise
         processing is serial.
+
+        If the ``profileMode`` element of ``parsedCmd`` is ``"sampling"`` then each target is profiled with
+        `SamplingProfiler` in the process which runs it and the profile is written to the file given by the
+        ``profile`` element of ``parsedCmd`` with the target index appended; after all targets are done
+        these profiles are merged into a single file named by the ``profile`` element.
+
+        If the ``metadataStore`` element of ``parsedCmd`` is set then metadata records returned by
+        `TaskRunner.__call__` are written to that `MetadataStore` file as results arrive, also when
+        multiprocessing, so records of the targets which finished are kept if a later target fails or
+        times out.
+
+        Task metrics returned by `TaskRunner.__call__` are merged into `TaskRunner.taskMetrics` (a `dict`
+        indexed by full task name). Timing trees are only recorded if ``timingStacks`` or ``metricsFile``
+        is set (see `Task.enableTimingTree`), they are merged into `TaskRunner.timingTree`, which is
+        written in collapsed stack format to the file given by the ``timingStacks`` element of
+        ``parsedCmd``, if set.
+
+        If the ``metricsFile`` element of ``parsedCmd`` is set then `MetricsSink` metrics (target counts,
+        method timing and memory use) are written to that file in OpenMetrics text format while targets
+        are processed and after all of them are done.
         """
         resultList = []
         disableImplicitThreading()  # To prevent thread contention
         if self.numProcesses > 1:
             import multiprocessing
             self.prepareForMultiProcessing()
-            pool = multiprocessing.Pool(processes=self.numProcesses, maxtasksperchild=1)
-            mapFunc = functools.partial(_runPool, pool, self.timeout)
+            if getattr(self.TaskClass, "canCloneTask", False):
+                # workers keep the task runner and its prototype task
+                pool = multiprocessing.Pool(processes=self.numProcesses, initializer=_initWorker,
+                                            initargs=(self,))
+            else:
+                pool = multiprocessing.Pool(processes=self.numProcesses, maxtasksperchild=1)
+            if self.metricsFile or self.metadataStore:
+                # process each result as soon as it arrives
+                mapFunc = functools.partial(_runPoolIter, pool, self.timeout)
+            else:
+                mapFunc = functools.partial(_runPool, pool, self.timeout)
         else:
             pool = None
             mapFunc = map
@@ -216,9 +473,49 @@ class TaskRunner:
             log = parsedCmd.log
             targetList = self.getTargetList(parsedCmd)
             if len(targetList) > 0:
+                function = self
+                if pool is not None and getattr(self.TaskClass, "canCloneTask", False):
+                    function = _WorkerRunnerCall()
+                samplingProfile = None
+                if profileName and getattr(parsedCmd, "profileMode", "cprofile") == "sampling":
+                    # profile each target in the process which runs it
+                    samplingProfile = _SamplingProfileCall(function, profileName,
+                                                           getattr(parsedCmd, "profileInterval", 0.005))
+                    function = samplingProfile
+                    targetList = list(enumerate(targetList))
+                    profileName = None
+                useSharedMemory = pool is not None and self.doReturnResults and self.useSharedMemory and \
+                    SharedMemoryStruct.isSupported()
+                if useSharedMemory:
+                    function = _SharedMemoryCall(function)
+                metricsSink = None
+                if self.metricsFile:
+                    metricsSink = MetricsSink(self.metricsFile, self.TaskClass._DefaultName)
+                    metricsSink.write()
+                metadataStore = None
+                if self.metadataStore:
+                    metadataStore = MetadataStore(self.metadataStore)
                 with profile(profileName, log):
                     # Run the task using self.__call__
-                    resultList = list(mapFunc(self, targetList))
+                    try:
+                        for result in mapFunc(function, targetList):
+                            if useSharedMemory:
+                                result = _SharedMemoryCall.unpack(result)
+                            if metricsSink is not None:
+                                metricsSink.update(result)
+                            if metadataStore is not None:
+                                metadataRecord = getattr(result, "metadataRecord", None)
+                                if metadataRecord is not None:
+                                    metadataStore.put(*metadataRecord)
+                                    del result.metadataRecord
+                            resultList.append(result)
+                    finally:
+                        if metricsSink is not None:
+                            metricsSink.write()
+                        if metadataStore is not None:
+                            metadataStore.close()
+                if samplingProfile is not None:
+                    samplingProfile.merge(len(targetList), log)
             else:
                 log.warn("Not running the task because there is no data to process; "
                          "you may preview data using \"--show data\"")
@@ -227,6 +524,15 @@ class TaskRunner:
             pool.close()
             pool.join()
 
+        for result in resultList:
+            timingTree = getattr(result, "timingTree", None)
+            if timingTree is not None:
+                self.timingTree.merge(timingTree)
+            for fullName, metrics in getattr(result, "taskMetrics", {}).items():
+                self.taskMetrics.setdefault(fullName, TaskMetrics()).merge(metrics)
+        if self.timingStacks:
+            self.timingTree.writeCollapsedStacks(self.timingStacks)
+
         return resultList
 
     @staticmethod
@@ -299,6 +605,24 @@ class TaskRunner:
         """
         return self.TaskClass(config=self.config, log=self.log)
 
+    def _makeOrCloneTask(self, args):
+        """Return a Task instance for a single target.
+
+        If the task supports cloning (``TaskClass.canCloneTask`` is `True`) then the task is made with
+        `makeTask` on the first call and clones of it are returned by all calls, otherwise `makeTask` is
+        called every time.
+
+        Parameters
+        ----------
+        args
+            Args tuple passed to `TaskRunner.__call__`.
+        """
+        if not getattr(self.TaskClass, "canCloneTask", False):
+            return self.makeTask(args=args)
+        if self._prototypeTask is None:
+            self._prototypeTask = self.makeTask(args=args)
+        return self._prototypeTask.clone()
+
     def _precallImpl(self, task, parsedCmd):
         """The main work of `precall`.
 
@@ -355,10 +679,18 @@ class TaskRunner:
             - ``metadata``: task metadata after execution of run.
             - ``result``: result returned by task run, or `None` if the task fails.
             - ``exitStatus``: 0 if the task completed successfully, 1 otherwise.
+            - ``timingTree``: `TimingTree` of the task, `None` unless ``timingStacks`` or ``metricsFile``
+              is set.
+            - ``taskMetrics``: metrics of the task and its subtasks, see `Task.getFullMetrics`.
 
             If ``doReturnResults`` is `False` the struct contains:
 
             - ``exitStatus``: 0 if the task completed successfully, 1 otherwise.
+            - ``timingTree``, ``taskMetrics``: as above, only if ``timingStacks`` or ``metricsFile`` is set.
+
+            If ``metadataStore`` is set the struct also contains ``metadataRecord``, the arguments of
+            `MetadataStore.put` returned by `CmdLineTask.getMetadataRecord`, unless it is `None`; `run`
+            removes it after writing it to the store.
 
         Notes
         -----
@@ -378,7 +710,9 @@ class TaskRunner:
             self.log.MDC("LABEL", str(dataRef.dataId))
         elif isinstance(dataRef, (list, tuple)):
             self.log.MDC("LABEL", str([ref.dataId for ref in dataRef if hasattr(ref, "dataId")]))
-        task = self.makeTask(args=args)
+        task = self._makeOrCloneTask(args)
+        if self.timingStacks or self.metricsFile:
+            task.enableTimingTree()
         result = None                   # in case the task fails
         exitStatus = 0                  # exit status for the shell
         if self.doRaise:
@@ -408,22 +742,38 @@ class TaskRunner:
         sys.stdout.flush()
         sys.stderr.flush()
 
-        task.writeMetadata(dataRef)
+        metadataRecord = None
+        if self.metadataStore:
+            metadataRecord = task.getMetadataRecord(dataRef)
+        else:
+            task.writeMetadata(dataRef)
 
         # remove MDC so it does not show up outside of task context
         self.log.MDCRemove("LABEL")
 
         if self.doReturnResults:
-            return Struct(
+            struct = Struct(
                 exitStatus=exitStatus,
                 dataRef=dataRef,
                 metadata=task.metadata,
                 result=result,
+                timingTree=task.getTimingTree(),
+                taskMetrics=task.getFullMetrics(),
+            )
+        elif self.timingStacks or self.metricsFile:
+            struct = Struct(
+                exitStatus=exitStatus,
+                timingTree=task.getTimingTree(),
+                taskMetrics=task.getFullMetrics(),
             )
         else:
-            return Struct(
+            struct = Struct(
                 exitStatus=exitStatus,
             )
+        if metadataRecord is not None:
+            # removed by run after it is written to the metadata store
+            struct.metadataRecord = metadataRecord
+        return struct
 
     def runTask(self, task, dataRef, kwargs):
         """Make the actual call to `runDataRef` for this task.
@@ -510,6 +860,9 @@ class CmdLineTask(Task):
       not meet this requirement then you must supply a variant of ``TaskRunner``; see ``TaskRunner``
       for more information.
     - ``canMultiprocess``: the default is `True`; set `False` if your task does not support multiprocessing.
+    - ``canCloneTask``: the default is `False`; set `True` if your task does not modify its attributes other
+      than metadata while running, then `TaskRunner` constructs the task once and runs each data reference
+      on a `~Task.clone` of it, which is much cheaper than constructing a task hierarchy.
 
     Subclasses must specify a method named ``runDataRef``:
 
@@ -522,6 +875,7 @@ class CmdLineTask(Task):
     """
     RunnerClass = TaskRunner
     canMultiprocess = True
+    canCloneTask = False
 
     @classmethod
     def applyOverrides(cls, config):
@@ -661,14 +1015,24 @@ class CmdLineTask(Task):
             - `False`: raise `TaskError` if this config does not match the existing config.
         doBackup : bool, optional
             Set to `True` to backup the config files if clobbering.
+
+        Notes
+        -----
+        A hash of the config (see `_configHash`) is written next to the config file.
+        If an existing config has a hash equal to the hash of this config then configs
+        are not compared, otherwise the existing config is read and compared in full.
         """
         configName = self._getConfigName()
         if configName is None:
             return
+        configHash = _configHash(self.config)
         if clobber:
             butler.put(self.config, configName, doBackup=doBackup)
         elif butler.datasetExists(configName, write=True):
             # this may be subject to a race condition; see #2789
+            hashPath = _configHashPath(butler, configName)
+            if hashPath is not None and _readConfigHash(hashPath) == configHash:
+                return
             try:
                 oldConfig = butler.get(configName, immediate=True)
             except Exception as exc:
@@ -685,6 +1049,10 @@ class CmdLineTask(Task):
                     (configName,))
         else:
             butler.put(self.config, configName)
+        # hash of the persisted config makes later checks cheap
+        hashPath = _configHashPath(butler, configName)
+        if hashPath is not None:
+            _writeConfigHash(hashPath, configHash)
 
     def writeSchemas(self, butler, clobber=False, doBackup=True):
         """Write the schemas returned by `lsst.pipe.base.Task.getAllSchemaCatalogs`.
@@ -737,6 +1105,39 @@ class CmdLineTask(Task):
         except Exception as e:
             self.log.warn("Could not persist metadata for dataId=%s: %s", dataRef.dataId, e)
 
+    def getMetadataRecord(self, dataRef):
+        """Get the metadata produced from processing the data as a record for a `MetadataStore`.
+
+        Parameters
+        ----------
+        dataRef
+            Butler data reference, or a list of them, whose data ID is used as the key of the record.
+
+        Returns
+        -------
+        record : `tuple` or `None`
+            Name of the metadata dataset type (see `CmdLineTask._getMetadataName`), data ID key (see
+            `MetadataStore.makeKey`) and full metadata (see `Task.getFullMetadata`), or `None` if metadata
+            is not to be persisted.
+
+        Notes
+        -----
+        This is used instead of `writeMetadata` if metadata is written to a single file for all data
+        references (the ``--metadata-store`` command-line option).
+        """
+        try:
+            metadataName = self._getMetadataName()
+            if metadataName is None:
+                return None
+            if isinstance(dataRef, (list, tuple)):
+                dataId = [ref.dataId for ref in dataRef]
+            else:
+                dataId = dataRef.dataId
+            return metadataName, MetadataStore.makeKey(dataId), self.getFullMetadata()
+        except Exception as e:
+            self.log.warn("Could not make metadata record for dataRef=%s: %s", dataRef, e)
+            return None
+
     def writePackageVersions(self, butler, clobber=False, doBackup=True, dataset="packages"):
         """Compare and write package versions.
 
@@ -0,0 +1,321 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining FusedPipelineTask class and related methods.
+"""
+
+__all__ = ["FusedPipelineTaskConfig", "FusedPipelineTask"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import functools
+from itertools import chain
+
+# -----------------------------
+#  Imports for other modules --
+# -----------------------------
+import lsst.pex.config as pexConfig
+from lsst.daf.butler import DatasetRef, Quantum
+from .config import PipelineTaskConfig, ResourceConfig
+from .localExecutor import InMemoryDatasetCache, _CachingButler, _datasetKey
+from .pipeline import TaskDef, _importName, _loadConfig
+from .pipelineTask import PipelineTask
+from .resources import ResourceBudget
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+
+@functools.lru_cache(maxsize=None)
+def _loadMembers(taskNames, labels, configClasses, configs):
+    """Make task definitions of the tasks in a chain, with frozen
+    configurations.
+
+    Results are cached, so that configurations are only made once per
+    process for each chain.
+    """
+    members = []
+    for taskName, label, configClass, delta in zip(taskNames, labels, configClasses, configs):
+        config = _loadConfig(configClass, delta)
+        config.freeze()
+        members.append(TaskDef(taskName, config, _importName(taskName), label))
+    return tuple(members)
+
+
+def _fullName(obj):
+    """Return full name of a class.
+    """
+    return obj.__module__ + "." + obj.__qualname__
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class FusedPipelineTaskConfig(PipelineTaskConfig):
+    """Configuration for `FusedPipelineTask`.
+
+    Tasks of a chain are stored by name together with their configuration,
+    so that this configuration can be pickled or saved like any other.
+    Instances are made by `FusedPipelineTask.makeTaskDef`.
+    """
+    taskNames = pexConfig.ListField(dtype=str, default=[],
+                                    doc="Full names of the task classes in the chain, in execution order")
+    labels = pexConfig.ListField(dtype=str, default=[],
+                                 doc="Labels of the tasks in the chain")
+    configClasses = pexConfig.ListField(dtype=str, default=[],
+                                        doc="Full names of the configuration classes of the tasks")
+    configs = pexConfig.ListField(dtype=str, default=[],
+                                  doc="Configuration of each task, as Python code which is applied "
+                                      "to the default configuration of its class")
+    keepOutputs = pexConfig.ListField(dtype=str, default=[],
+                                      doc="Names of the dataset types which are passed between tasks "
+                                          "of the chain and are also written to butler")
+    resources = pexConfig.ConfigField(dtype=ResourceConfig,
+                                      doc="Resources needed by the chain, largest of all its tasks")
+
+
+class FusedPipelineTask(PipelineTask):
+    """PipelineTask which runs a chain of other PipelineTasks on the same
+    quantum.
+
+    Tasks in a chain have identical quantum dimensions and each one
+    consumes outputs of the previous one. Running the whole chain as a
+    single quantum avoids writing and re-reading intermediate datasets, they
+    are passed between tasks in memory. Intermediate datasets are only
+    written to butler if they are listed in ``config.keepOutputs``. All
+    consumers of an intermediate dataset get the same object, so tasks must
+    not modify their inputs. Chains
+    are normally made by `pipeTools.fusePipeline`.
+
+    Input and output dataset types of this task are those of the tasks in
+    the chain except intermediate ones, the keys of the dictionaries
+    returned by ``get*DatasetTypes`` methods are made from a task label and
+    its own key, e.g. ``"isr.exposure"``. Init-inputs produced by a task in
+    the chain as init-outputs are passed directly to later tasks.
+
+    Tasks of the chain are made as subtasks of this task, their names are
+    task labels.
+    """
+    ConfigClass = FusedPipelineTaskConfig
+    _DefaultName = "fused"
+
+    def __init__(self, *, config=None, log=None, initInputs=None, **kwargs):
+        super().__init__(config=config, log=log, initInputs=initInputs, **kwargs)
+        initInputs = initInputs or {}
+        produced = {}   # init-outputs of tasks made so far, by dataset type name
+        self._initOutputs = {}
+        self.members = []
+        for member in self.getMembers(self.config):
+            memberInitInputs = {}
+            for key, descr in member.taskClass.getInitInputDatasetTypes(member.config).items():
+                if descr.name in produced:
+                    memberInitInputs[key] = produced[descr.name]
+                elif member.label + "." + key in initInputs:
+                    memberInitInputs[key] = initInputs[member.label + "." + key]
+            task = member.taskClass(config=member.config, name=member.label, parentTask=self,
+                                    initInputs=memberInitInputs)
+            descriptors = member.taskClass.getInitOutputDatasetTypes(member.config)
+            for key, obj in task.getInitOutputDatasets().items():
+                produced[descriptors[key].name] = obj
+                self._initOutputs[member.label + "." + key] = obj
+            self.members.append(task)
+
+    @staticmethod
+    def makeTaskDef(taskDefs, keepOutputs=()):
+        """Make task definition for a chain of tasks.
+
+        Parameters
+        ----------
+        taskDefs : sequence of `TaskDef`
+            Definitions of the tasks in execution order, their task classes
+            have to be loaded.
+        keepOutputs : iterable of `str`, optional
+            Names of the intermediate dataset types which have to be written
+            to butler.
+
+        Returns
+        -------
+        taskDef : `TaskDef`
+            Definition of the `FusedPipelineTask`, its label is made of the
+            labels of all tasks joined with ``+``.
+        """
+        config = FusedPipelineTaskConfig()
+        config.quantum.dimensions = list(taskDefs[0].config.quantum.dimensions)
+        configSources = [taskDef._getConfigSource() for taskDef in taskDefs]
+        config.taskNames = [_fullName(taskDef.taskClass) for taskDef in taskDefs]
+        config.labels = [taskDef.label for taskDef in taskDefs]
+        config.configClasses = [configClass for configClass, _ in configSources]
+        config.configs = [delta for _, delta in configSources]
+        config.keepOutputs = sorted(keepOutputs)
+        requirements = [ResourceBudget.getRequirements(taskDef.config) for taskDef in taskDefs]
+        config.resources.minNumCores = max(numCores for numCores, _ in requirements)
+        config.resources.minMemoryMB = max(memoryMB for _, memoryMB in requirements) or None
+        label = "+".join(taskDef.label for taskDef in taskDefs)
+        return TaskDef(_fullName(FusedPipelineTask), config, FusedPipelineTask, label)
+
+    @classmethod
+    def getMembers(cls, config):
+        """Return definitions of the tasks in a chain.
+
+        Parameters
+        ----------
+        config : `FusedPipelineTaskConfig`
+            Configuration of this task.
+
+        Returns
+        -------
+        taskDefs : `tuple` [`TaskDef`]
+            Task definitions in execution order, with loaded task classes
+            and frozen configurations.
+        """
+        return _loadMembers(tuple(config.taskNames), tuple(config.labels),
+                            tuple(config.configClasses), tuple(config.configs))
+
+    @classmethod
+    def _getIntermediateNames(cls, config):
+        """Return names of the dataset types which are produced by one task
+        in a chain and consumed by a later one.
+        """
+        produced = set()
+        intermediates = set()
+        for member in cls.getMembers(config):
+            inputs = member.taskClass.getInputDatasetTypes(member.config)
+            intermediates.update(descr.name for descr in inputs.values() if descr.name in produced)
+            outputs = member.taskClass.getOutputDatasetTypes(member.config)
+            produced.update(descr.name for descr in outputs.values())
+        return intermediates
+
+    @classmethod
+    def _collectDatasetTypes(cls, config, getterName, exclude=()):
+        """Return dataset types of all tasks in a chain with keys made from
+        task labels, skipping dataset types with names in ``exclude``.
+        """
+        dsTypes = {}
+        for member in cls.getMembers(config):
+            getter = getattr(member.taskClass, getterName)
+            for key, descr in (getter(member.config) or {}).items():
+                if descr.name not in exclude:
+                    dsTypes[member.label + "." + key] = descr
+        return dsTypes
+
+    @classmethod
+    def getInputDatasetTypes(cls, config):
+        # Docstring inherited from PipelineTask.getInputDatasetTypes
+        return cls._collectDatasetTypes(config, "getInputDatasetTypes", cls._getIntermediateNames(config))
+
+    @classmethod
+    def getOutputDatasetTypes(cls, config):
+        # Docstring inherited from PipelineTask.getOutputDatasetTypes
+        exclude = cls._getIntermediateNames(config) - set(config.keepOutputs)
+        return cls._collectDatasetTypes(config, "getOutputDatasetTypes", exclude)
+
+    @classmethod
+    def getPrerequisiteDatasetTypes(cls, config):
+        # Docstring inherited from PipelineTask.getPrerequisiteDatasetTypes
+        return frozenset(member.label + "." + key for member in cls.getMembers(config)
+                         for key in member.taskClass.getPrerequisiteDatasetTypes(member.config))
+
+    @classmethod
+    def getInitInputDatasetTypes(cls, config):
+        # Docstring inherited from PipelineTask.getInitInputDatasetTypes
+        produced = set()
+        dsTypes = {}
+        for member in cls.getMembers(config):
+            inputs = member.taskClass.getInitInputDatasetTypes(member.config) or {}
+            for key, descr in inputs.items():
+                if descr.name not in produced:
+                    dsTypes[member.label + "." + key] = descr
+            outputs = member.taskClass.getInitOutputDatasetTypes(member.config) or {}
+            produced.update(descr.name for descr in outputs.values())
+        return dsTypes
+
+    @classmethod
+    def getInitOutputDatasetTypes(cls, config):
+        # Docstring inherited from PipelineTask.getInitOutputDatasetTypes
+        return cls._collectDatasetTypes(config, "getInitOutputDatasetTypes")
+
+    @classmethod
+    def getPerDatasetTypeDimensions(cls, config):
+        # Docstring inherited from PipelineTask.getPerDatasetTypeDimensions
+        return frozenset(chain.from_iterable(member.taskClass.getPerDatasetTypeDimensions(member.config)
+                                             for member in cls.getMembers(config)))
+
+    def getInitOutputDatasets(self):
+        # Docstring inherited from PipelineTask.getInitOutputDatasets
+        return dict(self._initOutputs)
+
+    def runQuantum(self, quantum, butler):
+        """Execute all tasks of the chain on a single quantum of data.
+
+        Each task is executed on a quantum made of its own inputs and
+        outputs. Intermediate datasets are given data IDs made of the
+        quantum dimensions and they are kept in memory until the last task
+        which consumes them is finished.
+
+        Parameters
+        ----------
+        quantum : `~lsst.daf.butler.Quantum`
+            Inputs and outputs of the whole chain.
+        butler : object
+            Data butler instance.
+        """
+        universe = butler.registry.dimensions
+
+        # data IDs of existing references cover quantum dimensions
+        refs = {}
+        quantumDataId = {}
+        for name, dsRefs in chain(quantum.predictedInputs.items(), quantum.outputs.items()):
+            refs[name] = list(dsRefs)
+            for ref in dsRefs:
+                quantumDataId.update(ref.dataId)
+
+        members = self.getMembers(self.config)
+        intermediates = self._getIntermediateNames(self.config)
+        cache = InMemoryDatasetCache()
+        memberQuanta = []
+        for member in members:
+            memberQuantum = Quantum(run=None, task=None)
+            consumed = []
+            for descr in member.taskClass.getInputDatasetTypes(member.config).values():
+                for ref in refs[descr.name]:
+                    memberQuantum.addPredictedInput(ref)
+                    if descr.name in intermediates:
+                        cache.addConsumer(_datasetKey(ref))
+                        consumed.append(_datasetKey(ref))
+            for descr in member.taskClass.getOutputDatasetTypes(member.config).values():
+                if descr.name not in refs:
+                    datasetType = descr.makeDatasetType(universe)
+                    dataId = {link: quantumDataId[link] for link in datasetType.dimensions.links()}
+                    refs[descr.name] = [DatasetRef(datasetType, dataId)]
+                for ref in refs[descr.name]:
+                    memberQuantum.addOutput(ref)
+            memberQuanta.append((memberQuantum, consumed))
+
+        persistKeys = set(_datasetKey(ref) for ref in chain.from_iterable(quantum.outputs.values()))
+        cachingButler = _CachingButler(butler, cache, persistKeys)
+        for task, (memberQuantum, consumed) in zip(self.members, memberQuanta):
+            self.log.debug("Running task %s", task.getName())
+            task.runQuantum(memberQuantum, cachingButler)
+            for key in consumed:
+                cache.release(key)
@@ -134,6 +134,13 @@ class QuantumGraph(list):
         self.initOutputs = []
         self._inputDatasetTypes = set()
         self._outputDatasetTypes = set()
+        # information needed by `GraphBuilder.updateGraph`, it is not pickled
+        self._buildState = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_buildState"] = None
+        return state
 
     def quanta(self):
         """Iterator over quanta in a graph.
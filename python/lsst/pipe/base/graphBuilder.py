@@ -59,6 +59,32 @@ _TaskDatasetTypes = namedtuple("_TaskDatasetTypes", ("taskDef", "inputs", "outpu
                                                      "initInputs", "initOutputs",
                                                      "perDatasetTypeDimensions", "prerequisite"))
 
+# Tuple containing information used to make a QuantumGraph, which is needed
+# to update the graph after changes in a pipeline
+#
+# Attributes
+# ----------
+# taskDatasets : `list` of `_TaskDatasetTypes`
+# quantumDimensions : `list` of `tuple` of `str`, for each task
+# required : `set` of `DatasetType`
+# optional : `set` of `DatasetType`
+# prerequisite : `set` of `DatasetType`
+# perDatasetTypeDimensions : `~lsst.daf.butler.DimensionSet`
+# originInfo : `~lsst.daf.butler.DatasetOriginInfo`
+# userQuery : `str`
+# rows : `list` of rows returned by registry query
+_GraphBuildState = namedtuple("_GraphBuildState", ("taskDatasets", "quantumDimensions",
+                                                   "required", "optional", "prerequisite",
+                                                   "perDatasetTypeDimensions", "originInfo",
+                                                   "userQuery", "rows"))
+
+
+def _taskKey(taskDef):
+    """Return key identifying a task in a pipeline, which is its label or
+    task name if label is empty.
+    """
+    return taskDef.label or taskDef.taskName
+
 
 class GraphBuilderError(Exception):
     """Base class for exceptions generated by graph builder.
@@ -96,13 +122,22 @@ class GraphBuilder(object):
     skipExisting : `bool`, optional
         If ``True`` (default) then Quantum is not created if all its outputs
         already exist, otherwise exception is raised.
+    queryCache : `QueryCache`, optional
+        Cache for the results of registry queries, if `None` then registry
+        is queried every time a graph is made.
+    keepBuildState : `bool`, optional
+        If ``True`` then graphs keep the results of registry query and other
+        data needed by `updateGraph`, which can use a lot of memory for large
+        graphs. Default is ``False``, graphs cannot be updated then.
     """
 
-    def __init__(self, taskFactory, registry, skipExisting=True):
+    def __init__(self, taskFactory, registry, skipExisting=True, queryCache=None, keepBuildState=False):
         self.taskFactory = taskFactory
         self.registry = registry
         self.dimensions = registry.dimensions
         self.skipExisting = skipExisting
+        self.queryCache = queryCache
+        self.keepBuildState = keepBuildState
 
     def _loadTaskClass(self, taskDef):
         """Make sure task class is loaded.
@@ -120,7 +155,7 @@ class GraphBuilder(object):
         already loaded.
         """
         if taskDef.taskClass is None:
-            tClass, tName = self.taskFactory.loadTaskClass(taskDef.taskName)
+            tClass, tName = self.taskFactory.loadTaskClasses([taskDef.taskName])[taskDef.taskName]
             taskDef = copy.copy(taskDef)
             taskDef.taskClass = tClass
             taskDef.taskName = tName
@@ -154,7 +189,126 @@ class GraphBuilder(object):
             classes.
         """
 
-        # make sure all task classes are loaded
+        taskDatasets = self._makeTaskDatasets(pipeline)
+        perDatasetTypeDimensions = self._extractPerDatasetTypeDimensions(taskDatasets)
+
+        # categorize dataset types for the full Pipeline
+        required, optional, prerequisite, initInputs, initOutputs = self._makeFullIODatasetTypes(taskDatasets)
+
+        # make a graph
+        return self._makeGraph(taskDatasets, required, optional, prerequisite, initInputs, initOutputs,
+                               originInfo, userQuery, perDatasetTypeDimensions=perDatasetTypeDimensions)
+
+    def updateGraph(self, graph, pipeline):
+        """Make execution graph for a modified pipeline re-using a graph
+        made for the original pipeline.
+
+        Quanta of a task are re-used if its input and output dataset types
+        and quantum dimensions are the same as in the original pipeline and
+        none of the tasks it depends on is re-made; quanta of other tasks
+        are made again. Registry query is only repeated if the set of
+        dataset types selected by the query changes, otherwise results of
+        the query made for original graph are re-used; input/output
+        collections and user query are the same as for the original graph.
+        Tasks are matched by their labels, or by task names for tasks
+        without labels.
+
+        Parameters
+        ----------
+        graph : `QuantumGraph`
+            Graph made by `makeGraph` or `updateGraph` of this class in the
+            same process, with ``keepBuildState`` enabled.
+        pipeline : `Pipeline`
+            Modified pipeline definition, it can be the same instance as the
+            original pipeline with some task definitions replaced or
+            modified. Graphs share task configurations with the pipeline, so
+            replacing a task definition keeps the original graph consistent,
+            modifying its configuration in place does not.
+
+        Returns
+        -------
+        graph : `QuantumGraph`
+            New execution graph, original graph is not modified.
+
+        Raises
+        ------
+        GraphBuilderError
+            Raised if ``graph`` was not made by this class with
+            ``keepBuildState`` enabled or it was read from a file.
+        OutputExistsError
+            Raised when output datasets already exist.
+        Exception
+            Other exceptions types may be raised by underlying registry
+            classes.
+        """
+        state = getattr(graph, "_buildState", None)
+        if state is None:
+            raise GraphBuilderError("Graph cannot be updated, it was not made by GraphBuilder "
+                                    "with keepBuildState=True in this process")
+
+        taskDatasets = self._makeTaskDatasets(pipeline)
+        perDatasetTypeDimensions = self._extractPerDatasetTypeDimensions(taskDatasets)
+        required, optional, prerequisite, initInputs, initOutputs = self._makeFullIODatasetTypes(taskDatasets)
+
+        # rows contain references for every dataset type of the original
+        # query and only rows where all required datasets exist
+        rows = None
+        oldNodes = {}
+        if (required == state.required and prerequisite <= state.prerequisite and
+                optional <= state.optional and perDatasetTypeDimensions == state.perDatasetTypeDimensions):
+            rows = state.rows
+            nodesMap = {id(nodes.taskDef): nodes for nodes in graph}
+            for taskDss, qdims in zip(state.taskDatasets, state.quantumDimensions):
+                nodes = nodesMap.get(id(taskDss.taskDef))
+                if nodes is not None:
+                    oldNodes[_taskKey(taskDss.taskDef)] = (taskDss, qdims, nodes)
+        else:
+            _LOG.debug("dataset types of the query have changed, repeat query")
+
+        # tasks whose dataset types or quantum dimensions have changed, and
+        # all tasks which depend on them
+        remake = set()
+        for taskDss in taskDatasets:
+            old = oldNodes.get(_taskKey(taskDss.taskDef))
+            if old is None or old[0][1:] != taskDss[1:] or old[1] != self._quantumDimensions(taskDss):
+                remake.add(_taskKey(taskDss.taskDef))
+        changedOutputs = set()
+        while True:
+            for taskDss in taskDatasets:
+                if _taskKey(taskDss.taskDef) in remake:
+                    changedOutputs |= taskDss.outputs
+            dependents = set(_taskKey(taskDss.taskDef) for taskDss in taskDatasets
+                             if not changedOutputs.isdisjoint(taskDss.inputs))
+            if dependents <= remake:
+                break
+            remake |= dependents
+
+        reuse = {}
+        for taskDss in taskDatasets:
+            if _taskKey(taskDss.taskDef) not in remake:
+                _LOG.debug("re-use quanta of task %s", _taskKey(taskDss.taskDef))
+                reuse[_taskKey(taskDss.taskDef)] = oldNodes[_taskKey(taskDss.taskDef)][2].quanta
+
+        return self._makeGraph(taskDatasets, required, optional, prerequisite, initInputs, initOutputs,
+                               state.originInfo, state.userQuery,
+                               perDatasetTypeDimensions=perDatasetTypeDimensions, rows=rows, reuse=reuse)
+
+    def _makeTaskDatasets(self, pipeline):
+        """Return dataset types of every task in a pipeline.
+
+        Parameters
+        ----------
+        pipeline : `Pipeline`
+            Pipeline definition, task names/classes and their configs.
+
+        Returns
+        -------
+        taskDatasets : `list` of `_TaskDatasetTypes`
+            Dataset types of each task, in pipeline order.
+        """
+        # make sure all task classes are loaded, importing them concurrently
+        self.taskFactory.startLoadingTaskClasses(taskDef.taskName for taskDef in pipeline
+                                                 if taskDef.taskClass is None)
         taskList = [self._loadTaskClass(taskDef) for taskDef in pipeline]
 
         # collect inputs/outputs from each task
@@ -164,7 +318,7 @@ class GraphBuilder(object):
             inputs = {k: v.makeDatasetType(self.registry.dimensions)
                       for k, v in taskClass.getInputDatasetTypes(taskDef.config).items()}
             prerequisite = set(inputs[k] for k in taskClass.getPrerequisiteDatasetTypes(taskDef.config))
-            taskIo = [inputs.values()]
+            taskIo = [set(inputs.values())]
             for attr in ("Output", "InitInput", "InitOutput"):
                 getter = getattr(taskClass, f"get{attr}DatasetTypes")
                 ioObject = getter(taskDef.config) or {}
@@ -174,15 +328,13 @@ class GraphBuilder(object):
                                                     taskClass.getPerDatasetTypeDimensions(taskDef.config))
             taskDatasets.append(_TaskDatasetTypes(taskDef, *taskIo, prerequisite=prerequisite,
                                                   perDatasetTypeDimensions=perDatasetTypeDimensions))
+        return taskDatasets
 
-        perDatasetTypeDimensions = self._extractPerDatasetTypeDimensions(taskDatasets)
-
-        # categorize dataset types for the full Pipeline
-        required, optional, prerequisite, initInputs, initOutputs = self._makeFullIODatasetTypes(taskDatasets)
-
-        # make a graph
-        return self._makeGraph(taskDatasets, required, optional, prerequisite, initInputs, initOutputs,
-                               originInfo, userQuery, perDatasetTypeDimensions=perDatasetTypeDimensions)
+    @staticmethod
+    def _quantumDimensions(taskDatasets):
+        """Return quantum dimensions of a task as a tuple of names.
+        """
+        return tuple(taskDatasets.taskDef.config.quantum.dimensions)
 
     def _extractPerDatasetTypeDimensions(self, taskDatasets):
         """Return the complete set of all per-DatasetType dimensions declared
@@ -289,7 +441,7 @@ class GraphBuilder(object):
 
     def _makeGraph(self, taskDatasets, required, optional, prerequisite,
                    initInputs, initOutputs, originInfo, userQuery,
-                   perDatasetTypeDimensions=()):
+                   perDatasetTypeDimensions=(), rows=None, reuse=None):
         """Make QuantumGraph instance.
 
         Parameters
@@ -322,18 +474,95 @@ class GraphBuilder(object):
         perDatasetTypeDimensions : iterable of `Dimension` or `str`
             Dimensions (or names thereof) that may have different values for
             different dataset types within the same quantum.
+        rows : `list`, optional
+            Result of a registry query made earlier for the same or larger
+            set of dataset types, if `None` then registry is queried.
+        reuse : `dict`, optional
+            Maps task key (see `_taskKey`) to the list of its quanta which
+            are re-used instead of being made from rows.
 
         Returns
         -------
         `QuantumGraph` instance.
         """
+        if rows is None:
+            dimensionVerse = self._selectRows(required, optional, prerequisite, originInfo, userQuery,
+                                              perDatasetTypeDimensions)
+        else:
+            dimensionVerse = rows
+        reuse = reuse or {}
+
+        # Next step is to group by task quantum dimensions
+        qgraph = QuantumGraph()
+        qgraph._inputDatasetTypes = (required | prerequisite)
+        qgraph._outputDatasetTypes = optional
+        qgraph.initInputs += self._findInitInputs(initInputs, originInfo)
+        for dsType in initOutputs:
+            qgraph.initOutputs.append(DatasetRef(dsType, {}))
+
+        for taskDss in taskDatasets:
+            quanta = reuse.get(_taskKey(taskDss.taskDef))
+            if quanta is None:
+                quanta = self._makeQuanta(taskDss, dimensionVerse)
+            qgraph.append(QuantumGraphTaskNodes(taskDss.taskDef, quanta))
+
+        if self.keepBuildState:
+            qgraph._buildState = _GraphBuildState(
+                taskDatasets=taskDatasets,
+                quantumDimensions=[self._quantumDimensions(taskDss) for taskDss in taskDatasets],
+                required=required, optional=optional, prerequisite=prerequisite,
+                perDatasetTypeDimensions=perDatasetTypeDimensions,
+                originInfo=originInfo, userQuery=userQuery, rows=dimensionVerse)
+        return qgraph
+
+    def _selectRows(self, required, optional, prerequisite, originInfo, userQuery,
+                    perDatasetTypeDimensions):
+        """Query registry for all combinations of dimensions and datasets,
+        or return results of the same query from `queryCache`.
+
+        Parameters are the same as for `_makeGraph`.
+
+        Returns
+        -------
+        rows : `list`
+            Rows returned by registry query.
+
+        Raises
+        ------
+        PrerequisiteMissingError
+            Raised if prerequisite datasets are missing.
+        """
+        cacheKey = token = None
+        if self.queryCache is not None:
+            def datasetTypeKeys(datasetTypes):
+                return sorted((dsType.name, sorted(str(dim) for dim in dsType.dimensions))
+                              for dsType in datasetTypes)
+
+            allDatasetTypes = required | optional | prerequisite
+            collections = {dsType.name: (list(originInfo.getInputCollections(dsType.name)),
+                                         originInfo.getOutputCollection(dsType.name))
+                           for dsType in allDatasetTypes}
+            cacheKey = self.queryCache.makeKey(required=datasetTypeKeys(required),
+                                               optional=datasetTypeKeys(optional),
+                                               prerequisite=datasetTypeKeys(prerequisite),
+                                               perDatasetTypeDimensions=sorted(str(dim) for dim in
+                                                                               perDatasetTypeDimensions),
+                                               collections=collections,
+                                               userQuery=userQuery or "")
+            token = self.queryCache.getStateToken(self.registry)
+            dimensionVerse = self.queryCache.get(cacheKey, token)
+            if dimensionVerse is not None:
+                _LOG.debug("use %d cached rows", len(dimensionVerse))
+                return dimensionVerse
+
         rows = self.registry.selectMultipleDatasetTypes(
             originInfo, userQuery,
             required=required, optional=optional, prerequisite=prerequisite,
             perDatasetTypeDimensions=perDatasetTypeDimensions
         )
 
-        # store result locally for multi-pass algorithm below
+        # store result locally for multi-pass algorithm below, it is
+        # also kept with the graph for `updateGraph` if requested
         # TODO: change it to single pass
         dimensionVerse = []
         try:
@@ -343,84 +572,169 @@ class GraphBuilder(object):
         except LookupError as err:
             raise PrerequisiteMissingError(str(err)) from err
 
-        # Next step is to group by task quantum dimensions
-        qgraph = QuantumGraph()
-        qgraph._inputDatasetTypes = (required | prerequisite)
-        qgraph._outputDatasetTypes = optional
+        if cacheKey is not None:
+            self.queryCache.put(cacheKey, token, dimensionVerse)
+        return dimensionVerse
+
+    def _findInitInputs(self, initInputs, originInfo):
+        """Find all init-input datasets.
+
+        All datasets are looked up with a single registry query; init-input
+        dataset types have no dimensions, so the query returns one row for
+        each combination of datasets found in any input collection. Query
+        does not tell which input collection comes first, so its results
+        are only used if each dataset was found in one collection. Otherwise
+        (or if that query fails for any reason) each dataset is looked up
+        separately in input collections in their order.
+
+        Parameters
+        ----------
+        initInputs : `set` of `DatasetType`
+            Init-input dataset types.
+        originInfo : `DatasetOriginInfo`
+            Object which provides names of the input/output collections.
+
+        Returns
+        -------
+        refs : `list` of `~lsst.daf.butler.DatasetRef`
+            References to init-input datasets.
+
+        Raises
+        ------
+        GraphBuilderError
+            Raised if a dataset cannot be found in any input collection.
+        """
+        if not initInputs:
+            return []
+        found = {dsType: {} for dsType in initInputs}
+        try:
+            rows = self.registry.selectMultipleDatasetTypes(
+                originInfo, None, required=initInputs, optional=set(), prerequisite=set(),
+                perDatasetTypeDimensions=()
+            )
+            for row in rows:
+                for dsType in initInputs:
+                    ref = row.datasetRefs[dsType]
+                    found[dsType][ref.id] = ref
+                if any(len(refs) > 1 for refs in found.values()):
+                    _LOG.debug("some init inputs exist in more than one input collection")
+                    break
+        except Exception as exc:
+            # registries may not support queries without dimensions, errors
+            # of the lookup below are reported instead
+            _LOG.debug("bulk lookup of init inputs failed: %s", exc)
+        else:
+            if all(len(refs) == 1 and None not in refs for refs in found.values()):
+                return [ref for refs in found.values() for ref in refs.values()]
+
+        _LOG.debug("look up init inputs one by one")
+        refs = []
         for dsType in initInputs:
             for collection in originInfo.getInputCollections(dsType.name):
                 result = self.registry.find(collection, dsType)
                 if result is not None:
-                    qgraph.initInputs.append(result)
+                    refs.append(result)
                     break
             else:
                 raise GraphBuilderError(f"Could not find initInput {dsType.name} in any input"
                                         " collection")
-        for dsType in initOutputs:
-            qgraph.initOutputs.append(DatasetRef(dsType, {}))
+        return refs
 
-        for taskDss in taskDatasets:
-            taskQuantaInputs = {}    # key is the quantum dataId (as tuple)
-            taskQuantaOutputs = {}   # key is the quantum dataId (as tuple)
-            qlinks = []
-            for dimensionName in taskDss.taskDef.config.quantum.dimensions:
-                dimension = self.dimensions[dimensionName]
-                qlinks += dimension.links()
-            _LOG.debug("task %s qdimensions: %s", taskDss.taskDef.label, qlinks)
-
-            # some rows will be non-unique for subset of dimensions, create
-            # temporary structure to remove duplicates
-            for row in dimensionVerse:
-                qkey = tuple((col, row.dataId[col]) for col in qlinks)
-                _LOG.debug("qkey: %s", qkey)
-
-                def _datasetRefKey(datasetRef):
-                    return tuple(sorted(datasetRef.dataId.items()))
-
-                qinputs = taskQuantaInputs.setdefault(qkey, {})
-                for dsType in taskDss.inputs:
-                    datasetRefs = qinputs.setdefault(dsType, {})
-                    datasetRef = row.datasetRefs[dsType]
-                    datasetRefs[_datasetRefKey(datasetRef)] = datasetRef
-                    _LOG.debug("add input datasetRef: %s %s", dsType.name, datasetRef)
-
-                qoutputs = taskQuantaOutputs.setdefault(qkey, {})
-                for dsType in taskDss.outputs:
-                    datasetRefs = qoutputs.setdefault(dsType, {})
-                    datasetRef = row.datasetRefs[dsType]
-                    datasetRefs[_datasetRefKey(datasetRef)] = datasetRef
-                    _LOG.debug("add output datasetRef: %s %s", dsType.name, datasetRef)
-
-            # all nodes for this task
-            quanta = []
-            for qkey in taskQuantaInputs:
-                # taskQuantaInputs and taskQuantaOutputs have the same keys
-                _LOG.debug("make quantum for qkey: %s", qkey)
-                quantum = Quantum(run=None, task=None)
-
-                # add all outputs, but check first that outputs don't exist
-                outputs = list(chain.from_iterable(datasetRefs.values()
-                                                   for datasetRefs in taskQuantaOutputs[qkey].values()))
-                for ref in outputs:
-                    _LOG.debug("add output: %s", ref)
-                if self.skipExisting and all(ref.id is not None for ref in outputs):
-                    _LOG.debug("all output datasetRefs already exist, skip quantum")
-                    continue
-                if any(ref.id is not None for ref in outputs):
-                    # some outputs exist, can't override them
-                    raise OutputExistsError(taskDss.taskDef.taskName, outputs)
-
-                for ref in outputs:
-                    quantum.addOutput(ref)
-
-                # add all inputs
-                for datasetRefs in taskQuantaInputs[qkey].values():
-                    for ref in datasetRefs.values():
-                        quantum.addPredictedInput(ref)
-                        _LOG.debug("add input: %s", ref)
-
-                quanta.append(quantum)
+    def _makeQuanta(self, taskDss, dimensionVerse):
+        """Make quanta of one task.
 
-            qgraph.append(QuantumGraphTaskNodes(taskDss.taskDef, quanta))
+        Parameters
+        ----------
+        taskDss : `_TaskDatasetTypes`
+            Task with its inputs and outputs.
+        dimensionVerse : `list`
+            Rows returned by registry query.
 
-        return qgraph
+        Returns
+        -------
+        quanta : `list` of `~lsst.daf.butler.Quantum`
+            Quanta of the task.
+
+        Raises
+        ------
+        OutputExistsError
+            Raised when output datasets already exist.
+        """
+        taskQuantaInputs = {}    # key is the quantum dataId (as tuple)
+        taskQuantaOutputs = {}   # key is the quantum dataId (as tuple)
+        qlinks = []
+        for dimensionName in taskDss.taskDef.config.quantum.dimensions:
+            dimension = self.dimensions[dimensionName]
+            qlinks += dimension.links()
+        _LOG.debug("task %s qdimensions: %s", taskDss.taskDef.label, qlinks)
+
+        # with skipExisting, first find quanta which have missing outputs;
+        # structures are only made for those quanta, quanta whose outputs
+        # all exist are skipped
+        missingOutputs = None
+        if self.skipExisting:
+            missingOutputs = set()
+            for row in dimensionVerse:
+                qkey = tuple((col, row.dataId[col]) for col in qlinks)
+                if qkey not in missingOutputs and any(row.datasetRefs[dsType].id is None
+                                                      for dsType in taskDss.outputs):
+                    missingOutputs.add(qkey)
+            _LOG.debug("task %s: %d quanta with missing outputs", taskDss.taskDef.label,
+                       len(missingOutputs))
+
+        # some rows will be non-unique for subset of dimensions, create
+        # temporary structure to remove duplicates
+        for row in dimensionVerse:
+            qkey = tuple((col, row.dataId[col]) for col in qlinks)
+            if missingOutputs is not None and qkey not in missingOutputs:
+                continue
+            _LOG.debug("qkey: %s", qkey)
+
+            def _datasetRefKey(datasetRef):
+                return tuple(sorted(datasetRef.dataId.items()))
+
+            qinputs = taskQuantaInputs.setdefault(qkey, {})
+            for dsType in taskDss.inputs:
+                datasetRefs = qinputs.setdefault(dsType, {})
+                datasetRef = row.datasetRefs[dsType]
+                datasetRefs[_datasetRefKey(datasetRef)] = datasetRef
+                _LOG.debug("add input datasetRef: %s %s", dsType.name, datasetRef)
+
+            qoutputs = taskQuantaOutputs.setdefault(qkey, {})
+            for dsType in taskDss.outputs:
+                datasetRefs = qoutputs.setdefault(dsType, {})
+                datasetRef = row.datasetRefs[dsType]
+                datasetRefs[_datasetRefKey(datasetRef)] = datasetRef
+                _LOG.debug("add output datasetRef: %s %s", dsType.name, datasetRef)
+
+        # all nodes for this task
+        quanta = []
+        for qkey in taskQuantaInputs:
+            # taskQuantaInputs and taskQuantaOutputs have the same keys
+            _LOG.debug("make quantum for qkey: %s", qkey)
+            quantum = Quantum(run=None, task=None)
+
+            # add all outputs, but check first that outputs don't exist
+            outputs = list(chain.from_iterable(datasetRefs.values()
+                                               for datasetRefs in taskQuantaOutputs[qkey].values()))
+            for ref in outputs:
+                _LOG.debug("add output: %s", ref)
+            if self.skipExisting and all(ref.id is not None for ref in outputs):
+                _LOG.debug("all output datasetRefs already exist, skip quantum")
+                continue
+            if any(ref.id is not None for ref in outputs):
+                # some outputs exist, can't override them
+                raise OutputExistsError(taskDss.taskDef.taskName, outputs)
+
+            for ref in outputs:
+                quantum.addOutput(ref)
+
+            # add all inputs
+            for datasetRefs in taskQuantaInputs[qkey].values():
+                for ref in datasetRefs.values():
+                    quantum.addPredictedInput(ref)
+                    _LOG.debug("add input: %s", ref)
+
+            quanta.append(quantum)
+
+        return quanta
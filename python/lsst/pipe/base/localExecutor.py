@@ -0,0 +1,650 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining classes for executing QuantumGraph on a local node.
+"""
+
+__all__ = ["InMemoryDatasetCache", "LocalQuantumGraphExecutor"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+from collections import defaultdict
+import copy
+import functools
+from itertools import chain
+import logging
+import queue
+import sys
+import time
+import traceback
+
+# -----------------------------
+#  Imports for other modules --
+# -----------------------------
+from lsst.daf.butler import DataId
+from .resources import ResourceBudget
+from .struct import Struct
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+_LOG = logging.getLogger(__name__.partition(".")[2])
+
+
+def _datasetKey(datasetRefOrType, dataId=None):
+    """Make a hashable key identifying a dataset.
+
+    The key is the same as the one used by `QuantumGraph.traverse` to match
+    producers and consumers of a dataset.
+
+    Parameters
+    ----------
+    datasetRefOrType : `~lsst.daf.butler.DatasetRef`, `DatasetType` or `str`
+        Dataset reference, or dataset type (or its name) if ``dataId`` is
+        given.
+    dataId : `dict` or `DataId`, optional
+        Data ID, only used if first argument is not a `DatasetRef`.
+
+    Returns
+    -------
+    key : `tuple`
+        Tuple of dataset type name and `DataId`.
+    """
+    if hasattr(datasetRefOrType, "dataId"):
+        dataId = datasetRefOrType.dataId
+        datasetRefOrType = datasetRefOrType.datasetType
+    name = getattr(datasetRefOrType, "name", datasetRefOrType)
+    return (name, DataId(dataId))
+
+
+class _CachingButler:
+    """Butler proxy which exchanges intermediate datasets via
+    `InMemoryDatasetCache`.
+
+    Datasets which have consumers in the cache are kept in memory on `put`,
+    and only those that need to be persisted are forwarded to the wrapped
+    butler. On `get` the cache is searched first. All other attributes are
+    forwarded to the wrapped butler.
+
+    Datasets from the cache are the same objects for all consumers unless
+    ``copyShared`` is `True`.
+
+    Parameters
+    ----------
+    butler : `~lsst.daf.butler.Butler`
+        Data butler instance.
+    cache : `InMemoryDatasetCache`
+        Cache of in-memory datasets.
+    persistKeys : `set`
+        Keys (as returned by `_datasetKey`) of the datasets which have to be
+        written to the butler.
+    copyShared : `bool`, optional
+        If `True` then consumers of a dataset get its deep copy, except the
+        last one which gets the cached object.
+    """
+    def __init__(self, butler, cache, persistKeys, copyShared=False):
+        self._butler = butler
+        self._cache = cache
+        self._persistKeys = persistKeys
+        self._copyShared = copyShared
+
+    def get(self, datasetRefOrType, dataId=None, **kwds):
+        key = _datasetKey(datasetRefOrType, dataId)
+        if key in self._cache:
+            _LOG.debug("get dataset %s from memory", key)
+            obj = self._cache.get(key)
+            if self._copyShared and self._cache.getConsumerCount(key) > 1:
+                # other consumers will need this dataset later
+                obj = copy.deepcopy(obj)
+            return obj
+        return self._butler.get(datasetRefOrType, dataId, **kwds)
+
+    def put(self, obj, datasetRefOrType, dataId=None, **kwds):
+        key = _datasetKey(datasetRefOrType, dataId)
+        if self._cache.isNeeded(key):
+            _LOG.debug("keep dataset %s in memory", key)
+            self._cache.put(key, obj)
+        if key in self._persistKeys:
+            return self._butler.put(obj, datasetRefOrType, dataId, **kwds)
+
+    def __getattr__(self, name):
+        return getattr(self._butler, name)
+
+
+class _QuantumRunner:
+    """Helper class which makes task instances and runs quanta.
+
+    Task instances are cached, one instance is made for each `TaskDef`.
+    There is one instance of this class in a parent process for serial
+    execution and one instance in each worker process for multi-process
+    execution.
+
+    Parameters
+    ----------
+    taskFactory : `TaskFactory`
+        Factory object used to load/instantiate PipelineTasks.
+    butler : `~lsst.daf.butler.Butler`
+        Data butler instance.
+    """
+    def __init__(self, taskFactory, butler):
+        self.taskFactory = taskFactory
+        self.butler = butler
+        self._tasks = {}
+
+    def makeTask(self, taskDef):
+        """Return task instance for a given task definition.
+
+        Task definitions are compared by task name and label, so that
+        instances are reused for copies of `TaskDef` received by a worker
+        process.
+        """
+        key = (taskDef.taskName, taskDef.label)
+        task = self._tasks.get(key)
+        if task is None:
+            taskClass = taskDef.taskClass
+            if taskClass is None:
+                taskClass, _ = self.taskFactory.loadTaskClasses([taskDef.taskName])[taskDef.taskName]
+            task = self.taskFactory.makeTask(taskClass, taskDef.config, None, self.butler)
+            self._tasks[key] = task
+        return task
+
+    def run(self, quantumId, taskDef, quantum, butler=None):
+        """Execute single quantum.
+
+        Parameters
+        ----------
+        quantumId : `int`
+            Quantum index.
+        taskDef : `TaskDef`
+            Task to be run on this quantum.
+        quantum : `~lsst.daf.butler.Quantum`
+            Quantum to execute.
+        butler : `~lsst.daf.butler.Butler`, optional
+            Butler to use instead of the default one.
+
+        Returns
+        -------
+        quantumId : `int`
+            Quantum index.
+        wallTime : `float`
+            Wall clock time spent on this quantum (seconds).
+        cpuTime : `float`
+            CPU time spent by this process on this quantum (seconds).
+        """
+        task = self.makeTask(taskDef)
+        _LOG.debug("Executing quantum %d of task %s", quantumId, taskDef)
+        startWall = time.time()
+        startCpu = time.process_time()
+        task.runQuantum(quantum, butler or self.butler)
+        return quantumId, time.time() - startWall, time.process_time() - startCpu
+
+
+# Quantum runner instance in a worker process, set by `_initWorker`
+_workerRunner = None
+
+
+def _initWorker(taskFactory, butler):
+    """Initialize worker process.
+    """
+    global _workerRunner
+    _workerRunner = _QuantumRunner(taskFactory, butler)
+
+
+def _runQuantumInWorker(quantumId, taskDef, quantum):
+    """Execute single quantum in a worker process.
+
+    Exceptions are not propagated (they may not be picklable), formatted
+    traceback is returned instead.
+
+    Returns
+    -------
+    quantumId : `int`
+        Quantum index.
+    wallTime : `float` or `None`
+        Wall clock time spent on this quantum, `None` on failure.
+    cpuTime : `float` or `None`
+        CPU time spent on this quantum, `None` on failure.
+    error : `str` or `None`
+        Formatted exception traceback, `None` on success.
+    """
+    try:
+        return _workerRunner.run(quantumId, taskDef, quantum) + (None,)
+    except Exception:
+        return quantumId, None, None, traceback.format_exc()
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class InMemoryDatasetCache:
+    """Reference-counted in-process storage for datasets exchanged between
+    quanta.
+
+    Each dataset is identified by a key (dataset type name and `DataId`).
+    Before execution the number of consumers of a dataset is registered with
+    `addConsumer`; datasets without consumers are never stored. A dataset is
+    evicted from the cache when its last consumer calls `release`.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        self._refCounts = {}
+
+    def addConsumer(self, key):
+        """Register one more consumer for a dataset.
+
+        Parameters
+        ----------
+        key : `tuple`
+            Dataset key.
+        """
+        self._refCounts[key] = self._refCounts.get(key, 0) + 1
+
+    def isNeeded(self, key):
+        """Return `True` if dataset has consumers that did not release it.
+        """
+        return self._refCounts.get(key, 0) > 0
+
+    def getConsumerCount(self, key):
+        """Return number of consumers of a dataset that did not release it.
+        """
+        return self._refCounts.get(key, 0)
+
+    def put(self, key, obj):
+        """Store in-memory dataset.
+
+        Dataset is only stored if it has any consumers.
+
+        Parameters
+        ----------
+        key : `tuple`
+            Dataset key.
+        obj : `object`
+            In-memory dataset.
+        """
+        if self.isNeeded(key):
+            self._datasets[key] = obj
+
+    def get(self, key):
+        """Return in-memory dataset.
+
+        Raises
+        ------
+        KeyError
+            Raised if dataset is not in the cache.
+        """
+        return self._datasets[key]
+
+    def release(self, key):
+        """Release dataset by one of its consumers.
+
+        Dataset is evicted from the cache after its last consumer releases
+        it.
+
+        Parameters
+        ----------
+        key : `tuple`
+            Dataset key.
+        """
+        count = self._refCounts.get(key, 0) - 1
+        if count > 0:
+            self._refCounts[key] = count
+        else:
+            self._refCounts.pop(key, None)
+            self._datasets.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._datasets
+
+    def __len__(self):
+        return len(self._datasets)
+
+
+class LocalQuantumGraphExecutor:
+    """Executor for `QuantumGraph` which runs all quanta on a local node.
+
+    Quanta are executed in topological order as returned by
+    `QuantumGraph.traverse`, either in the current process or, if
+    ``numProcesses`` is larger than one, in a pool of worker processes. In
+    the latter case each quantum is scheduled as soon as all quanta that it
+    depends on are finished. Task instances are made once for each `TaskDef`
+    in each process and are reused for all quanta of that task.
+
+    In multi-process mode quanta are also admitted against a node budget of
+    cores and memory, using resource requirements declared by each task in
+    ``config.resources`` (see `ResourceConfig`). When deciding what to run
+    next, ready quanta with the largest memory requirements are considered
+    first and smaller quanta are used to fill remaining cores and memory.
+    Quantum which does not fit into an empty budget is executed alone.
+
+    If a quantum fails then all quanta that depend on it (directly or
+    indirectly) are skipped, other quanta are still executed unless
+    ``doRaise`` is `True`.
+
+    By default every output dataset is written to a butler and every input
+    dataset is read from a butler. With ``inMemory`` set to `True` datasets
+    that are produced and consumed by quanta in the same graph are handed
+    over in memory instead; they are kept in `InMemoryDatasetCache` until
+    their last consumer finishes and they are only written to butler if
+    their dataset type is in ``persistDatasetTypes``. Outputs which are not
+    consumed by any quantum in the graph are final outputs and they are
+    always written to butler. In-memory handoff is only possible in a single
+    process, ``inMemory`` is ignored if ``numProcesses`` is larger than one.
+    All consumers of a dataset handed over in memory get the same object, so
+    tasks must not modify their inputs, unless ``copyShared`` is `True`.
+
+    Executor does not write task init-outputs, this has to be done by the
+    caller.
+
+    Parameters
+    ----------
+    taskFactory : `TaskFactory`
+        Factory object used to load/instantiate PipelineTasks.
+    butler : `~lsst.daf.butler.Butler`
+        Data butler instance. Both ``taskFactory`` and ``butler`` must be
+        picklable for multi-process execution.
+    inMemory : `bool`, optional
+        If `True` then keep intermediate datasets in memory.
+    persistDatasetTypes : iterable of `str`, optional
+        Names of the intermediate dataset types which are written to butler
+        even if ``inMemory`` is `True`.
+    numProcesses : `int`, optional
+        Number of worker processes, if 1 (default) then all quanta are
+        executed in the current process.
+    doRaise : `bool`, optional
+        If `True` then stop execution on the first failure and raise an
+        exception.
+    timeout : `float`, optional
+        Maximum time in seconds to wait for a single quantum in
+        multi-process mode, if `None` then `TIMEOUT` is used.
+    maxCores : `int`, optional
+        Number of cores available for multi-process execution, by default
+        it is equal to ``numProcesses``.
+    maxMemoryMB : `int`, optional
+        Memory in megabytes available for multi-process execution, by
+        default memory is not limited.
+    copyShared : `bool`, optional
+        If `True` then datasets handed over in memory to more than one
+        consumer are copied for all consumers except the last one, so that
+        tasks can modify their inputs. Only used if ``inMemory`` is `True`.
+    """
+
+    TIMEOUT = 3600*24*30
+    """Default timeout (seconds) for multiprocessing."""
+
+    def __init__(self, taskFactory, butler, inMemory=False, persistDatasetTypes=None,
+                 numProcesses=1, doRaise=False, timeout=None, maxCores=None, maxMemoryMB=None,
+                 copyShared=False):
+        self.taskFactory = taskFactory
+        self.butler = butler
+        self.inMemory = inMemory
+        self.persistDatasetTypes = frozenset(persistDatasetTypes or ())
+        self.numProcesses = numProcesses
+        self.doRaise = doRaise
+        self.timeout = timeout if timeout else self.TIMEOUT
+        self.maxCores = maxCores if maxCores else numProcesses
+        self.maxMemoryMB = maxMemoryMB
+        self.copyShared = copyShared
+
+    def execute(self, graph):
+        """Execute all quanta in a graph.
+
+        Parameters
+        ----------
+        graph : `QuantumGraph`
+            Execution graph.
+
+        Returns
+        -------
+        reports : `list` of `Struct`
+            One report per quantum, ordered by quantum index. Each report
+            has these fields:
+
+            - ``quantumId``: quantum index (`int`).
+            - ``label``: label of the task (`str`).
+            - ``status``: one of "success", "failed" or "skipped" (`str`).
+            - ``wallTime``: wall clock time in seconds, `None` unless
+              quantum was executed successfully.
+            - ``cpuTime``: CPU time in seconds of the process which executed
+              quantum, `None` unless quantum was executed successfully.
+
+        Raises
+        ------
+        Exception
+            Exceptions raised by tasks are propagated to caller if
+            ``doRaise`` is `True`.
+        """
+        quanta = list(graph.traverse())
+        reports = {}
+        if self.numProcesses > 1:
+            if self.inMemory:
+                _LOG.warning("In-memory dataset handoff is not supported with multiple processes")
+            self._executeParallel(quanta, reports)
+        else:
+            self._executeSerial(quanta, reports)
+
+        reports = [reports[qdata.quantumId] for qdata in quanta]
+        self._logSummary(reports)
+        return reports
+
+    def _executeSerial(self, quanta, reports):
+        """Execute all quanta in the current process.
+
+        Parameters
+        ----------
+        quanta : `list` of `QuantumIterData`
+            All quanta in a graph in topological order.
+        reports : `dict`
+            Maps quantum index to its report, updated by this method.
+        """
+        butler = self.butler
+        cache = None
+        if self.inMemory:
+            cache, persistKeys = self._makeCache(quanta)
+            butler = _CachingButler(self.butler, cache, persistKeys, self.copyShared)
+
+        runner = _QuantumRunner(self.taskFactory, self.butler)
+        for qdata in quanta:
+            if any(reports[dep].status != "success" for dep in qdata.dependencies):
+                reports[qdata.quantumId] = self._makeReport(qdata, "skipped")
+            else:
+                try:
+                    _, wallTime, cpuTime = runner.run(qdata.quantumId, qdata.taskDef, qdata.quantum, butler)
+                except Exception as exc:
+                    if self.doRaise:
+                        raise
+                    _LOG.error("Quantum %d of task %s failed: %s", qdata.quantumId, qdata.taskDef, exc)
+                    traceback.print_exc(file=sys.stderr)
+                    reports[qdata.quantumId] = self._makeReport(qdata, "failed")
+                else:
+                    reports[qdata.quantumId] = self._makeReport(qdata, "success", wallTime, cpuTime)
+
+            if cache is not None:
+                # this quantum is done with its inputs
+                for ref in chain.from_iterable(qdata.quantum.predictedInputs.values()):
+                    cache.release(_datasetKey(ref))
+
+    def _executeParallel(self, quanta, reports):
+        """Execute all quanta in a pool of worker processes.
+
+        Parameters
+        ----------
+        quanta : `list` of `QuantumIterData`
+            All quanta in a graph in topological order.
+        reports : `dict`
+            Maps quantum index to its report, updated by this method.
+        """
+        import multiprocessing
+
+        byId = {qdata.quantumId: qdata for qdata in quanta}
+        waiting = {qdata.quantumId: set(qdata.dependencies) for qdata in quanta}
+        dependents = defaultdict(list)
+        for qdata in quanta:
+            for dep in qdata.dependencies:
+                dependents[dep].append(qdata.quantumId)
+
+        # resources needed by each task
+        requirements = {}
+        for qdata in quanta:
+            key = id(qdata.taskDef)
+            if key not in requirements:
+                requirements[key] = ResourceBudget.getRequirements(qdata.taskDef.config)
+        budget = ResourceBudget(self.maxCores, self.maxMemoryMB)
+
+        def nextQuantum():
+            """Find ready quantum which fits into budget and remove it from
+            the ready list, or return `None`.
+            """
+            def sortKey(qid):
+                # largest memory first, in topological order for same needs
+                numCores, memoryMB = requirements[id(byId[qid].taskDef)]
+                return (-memoryMB, -numCores, qid)
+
+            ready.sort(key=sortKey)
+            for i, qid in enumerate(ready):
+                if budget.fits(*requirements[id(byId[qid].taskDef)]):
+                    return ready.pop(i)
+            if ready and budget.isIdle():
+                qid = ready.pop(0)
+                _LOG.warning("Resources needed by quantum %d of task %s exceed node budget, "
+                             "running it alone", qid, byId[qid].taskDef)
+                return qid
+            return None
+
+        ready = [qid for qid, deps in waiting.items() if not deps]
+
+        def skipDescendants(quantumId):
+            stack = list(dependents[quantumId])
+            while stack:
+                qid = stack.pop()
+                if qid not in reports:
+                    reports[qid] = self._makeReport(byId[qid], "skipped")
+                    stack += dependents[qid]
+
+        # results are passed from pool result handler thread via this queue
+        completions = queue.Queue()
+
+        def onError(exc, quantumId):
+            completions.put((quantumId, None, None, repr(exc)))
+
+        pool = multiprocessing.Pool(processes=self.numProcesses, initializer=_initWorker,
+                                    initargs=(self.taskFactory, self.butler))
+        try:
+            nRunning = 0
+            while ready or nRunning:
+                while ready and nRunning < self.numProcesses:
+                    quantumId = nextQuantum()
+                    if quantumId is None:
+                        break
+                    qdata = byId[quantumId]
+                    budget.acquire(*requirements[id(qdata.taskDef)])
+                    pool.apply_async(_runQuantumInWorker, (qdata.quantumId, qdata.taskDef, qdata.quantum),
+                                     callback=completions.put,
+                                     error_callback=functools.partial(onError, quantumId=qdata.quantumId))
+                    nRunning += 1
+
+                try:
+                    quantumId, wallTime, cpuTime, error = completions.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise RuntimeError("Timeout while waiting for quanta to finish") from None
+                nRunning -= 1
+
+                qdata = byId[quantumId]
+                budget.release(*requirements[id(qdata.taskDef)])
+                if error is not None:
+                    _LOG.error("Quantum %d of task %s failed:\n%s", quantumId, qdata.taskDef, error)
+                    reports[quantumId] = self._makeReport(qdata, "failed")
+                    if self.doRaise:
+                        raise RuntimeError("Quantum {} of task {} failed".format(quantumId, qdata.taskDef))
+                    skipDescendants(quantumId)
+                else:
+                    reports[quantumId] = self._makeReport(qdata, "success", wallTime, cpuTime)
+                    for qid in dependents[quantumId]:
+                        waiting[qid].discard(quantumId)
+                        if not waiting[qid] and qid not in reports:
+                            ready.append(qid)
+        except BaseException:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
+
+    @staticmethod
+    def _makeReport(qdata, status, wallTime=None, cpuTime=None):
+        """Make execution report for a single quantum.
+        """
+        return Struct(quantumId=qdata.quantumId, label=qdata.taskDef.label, status=status,
+                      wallTime=wallTime, cpuTime=cpuTime)
+
+    @staticmethod
+    def _logSummary(reports):
+        """Log per-task summary of quantum execution.
+        """
+        summary = {}
+        for report in reports:
+            counts = summary.get(report.label)
+            if counts is None:
+                counts = dict(success=0, failed=0, skipped=0, wallTime=0., cpuTime=0.)
+                summary[report.label] = counts
+            counts[report.status] += 1
+            if report.status == "success":
+                counts["wallTime"] += report.wallTime
+                counts["cpuTime"] += report.cpuTime
+        for label, counts in summary.items():
+            _LOG.info("Task %s: %d succeeded, %d failed, %d skipped; wall time %.3f sec, CPU time %.3f sec",
+                      label, counts["success"], counts["failed"], counts["skipped"],
+                      counts["wallTime"], counts["cpuTime"])
+
+    def _makeCache(self, quanta):
+        """Make dataset cache for a graph.
+
+        Parameters
+        ----------
+        quanta : `list` of `QuantumIterData`
+            All quanta in a graph.
+
+        Returns
+        -------
+        cache : `InMemoryDatasetCache`
+            Cache with consumers registered for each intermediate dataset.
+        persistKeys : `set`
+            Keys of the datasets that need to be written to butler.
+        """
+        produced = set()
+        for qdata in quanta:
+            for ref in chain.from_iterable(qdata.quantum.outputs.values()):
+                produced.add(_datasetKey(ref))
+
+        cache = InMemoryDatasetCache()
+        for qdata in quanta:
+            for ref in chain.from_iterable(qdata.quantum.predictedInputs.values()):
+                key = _datasetKey(ref)
+                if key in produced:
+                    cache.addConsumer(key)
+
+        persistKeys = set(key for key in produced
+                          if not cache.isNeeded(key) or key[0] in self.persistDatasetTypes)
+        return cache, persistKeys
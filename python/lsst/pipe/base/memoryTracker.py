@@ -0,0 +1,176 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining MemoryTracker class and related methods.
+"""
+
+__all__ = ["MemoryTracker"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import resource
+import threading
+import tracemalloc
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+_PAGE_SIZE = resource.getpagesize()
+
+
+def _readRss():
+    """Return current resident set size of this process in bytes, or `None`
+    if it cannot be determined.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Frame:
+    """Memory state of one call in progress.
+    """
+
+    __slots__ = ("start", "peak", "rss")
+
+    def __init__(self, start, rss):
+        self.start = start
+        self.peak = start
+        self.rss = rss
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class MemoryTracker:
+    """Tracker of memory allocated by nested calls of task methods.
+
+    Uses `tracemalloc` to measure Python memory allocations (including
+    allocations by extension modules which use Python allocator, e.g. NumPy
+    arrays). For each call it measures the peak of memory allocated during
+    the call and the memory still allocated after the call, both relative to
+    memory allocated when the call started. Peaks are tracked separately for
+    each level of nesting, so the peak of a parent call includes peaks of
+    its children.
+
+    Parameters
+    ----------
+    trackRss : `bool`, optional
+        If `True` then also record resident set size of the process at the
+        start and end of each call (only on systems with ``/proc``).
+
+    Notes
+    -----
+    Tracing memory allocations slows Python code down considerably, this
+    should only be used for diagnostics. Accurate per-call peaks need
+    `tracemalloc.reset_peak` (Python 3.9); with older Python the peak is the
+    peak since tracing started, which is an upper limit.
+
+    Each thread has its own stack of calls in progress, but `tracemalloc`
+    counts allocations of the whole process, so with concurrent threads
+    the memory of each call includes allocations made by other threads.
+    """
+
+    def __init__(self, trackRss=False):
+        self.trackRss = trackRss
+        self._local = threading.local()
+        self._ownTracing = False
+
+    @property
+    def _stack(self):
+        """Calls in progress in the current thread (`list`).
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def start(self):
+        """Start tracing memory allocations, if not traced yet.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._ownTracing = True
+
+    def stop(self):
+        """Stop tracing memory allocations if it was started by `start`.
+        """
+        if self._ownTracing:
+            tracemalloc.stop()
+            self._ownTracing = False
+        self._local = threading.local()
+
+    def enter(self):
+        """Start tracking a call.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        stack = self._stack
+        if stack:
+            # peak since last reset belongs to the call in progress
+            parent = stack[-1]
+            parent.peak = max(parent.peak, peak)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        stack.append(_Frame(current, _readRss() if self.trackRss else None))
+
+    def exit(self, obj=None, prefix=None):
+        """Finish tracking the call started by the last `enter`.
+
+        Parameters
+        ----------
+        obj : `lsst.pipe.base.Task`-type, optional
+            Object with ``metadata`` attribute to save results to.
+        prefix : `str`, optional
+            Prefix of metadata item names, required if ``obj`` is given.
+            Items are ``PeakAllocated`` and ``NetAllocated`` and, if RSS is
+            tracked, ``StartRss`` and ``EndRss``, all in bytes.
+
+        Returns
+        -------
+        peakAllocated : `int`
+            Peak of memory allocated during the call, in bytes.
+        netAllocated : `int`
+            Memory allocated during the call and not released, in bytes,
+            negative if the call released more than it allocated.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        stack = self._stack
+        frame = stack.pop()
+        peak = max(frame.peak, peak)
+        if stack:
+            parent = stack[-1]
+            parent.peak = max(parent.peak, peak)
+        peakAllocated = peak - frame.start
+        netAllocated = current - frame.start
+        if obj is not None:
+            obj.metadata.add(name=prefix + "PeakAllocated", value=peakAllocated)
+            obj.metadata.add(name=prefix + "NetAllocated", value=netAllocated)
+            if frame.rss is not None:
+                rss = _readRss()
+                if rss is not None:
+                    obj.metadata.add(name=prefix + "StartRss", value=frame.rss)
+                    obj.metadata.add(name=prefix + "EndRss", value=rss)
+        return peakAllocated, netAllocated
@@ -0,0 +1,210 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining MetadataStore class and related methods.
+"""
+
+__all__ = ["MetadataStore"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import json
+import pickle
+import sqlite3
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS metadata (
+    datasetType TEXT NOT NULL,
+    dataId TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (datasetType, dataId)
+)"""
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class MetadataStore:
+    """Single-file store of task metadata indexed by data ID.
+
+    Writing one metadata dataset per data reference makes a lot of small
+    files, which is slow on shared file systems. This class keeps metadata
+    of all data references of a run in one SQLite database instead, each
+    record holds pickled metadata of one data reference and is indexed by
+    metadata dataset type and data ID.
+
+    Parameters
+    ----------
+    path : `str`
+        Name of the database file, made if it does not exist.
+    commitInterval : `int`, optional
+        Number of records written between commits; records not committed
+        are lost if the process is killed.
+
+    Notes
+    -----
+    Records are replaced if the same data ID is written again, e.g. when
+    a run is repeated. Only one process should write to a store at a time,
+    `TaskRunner` writes records returned by worker processes from the main
+    process.
+    """
+
+    def __init__(self, path, commitInterval=100):
+        self.path = path
+        self.commitInterval = commitInterval
+        self._uncommitted = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    @staticmethod
+    def makeKey(dataId):
+        """Return string representation of a data ID used as a key.
+
+        Parameters
+        ----------
+        dataId : `dict` or `list` [`dict`]
+            Data ID, or list of data IDs for tasks which process multiple
+            data references.
+
+        Returns
+        -------
+        key : `str`
+            JSON representation of the data ID with sorted keys.
+        """
+        if isinstance(dataId, (list, tuple)):
+            dataId = [dict(item) for item in dataId]
+        else:
+            dataId = dict(dataId)
+        return json.dumps(dataId, sort_keys=True, default=str)
+
+    def put(self, datasetType, dataId, metadata):
+        """Write metadata of one data reference.
+
+        Parameters
+        ----------
+        datasetType : `str`
+            Name of the metadata dataset type, see
+            `CmdLineTask._getMetadataName`.
+        dataId : `dict`, `list` [`dict`] or `str`
+            Data ID, or a key returned by `makeKey`.
+        metadata : `lsst.daf.base.PropertySet`
+            Metadata to write.
+        """
+        key = dataId if isinstance(dataId, str) else self.makeKey(dataId)
+        self._connection.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                                 (datasetType, key, pickle.dumps(metadata, protocol=pickle.HIGHEST_PROTOCOL)))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commitInterval:
+            self.commit()
+
+    def get(self, datasetType, dataId):
+        """Read metadata of one data reference.
+
+        Parameters
+        ----------
+        datasetType : `str`
+            Name of the metadata dataset type.
+        dataId : `dict`, `list` [`dict`] or `str`
+            Data ID, or a key returned by `makeKey`.
+
+        Returns
+        -------
+        metadata : `lsst.daf.base.PropertySet`
+            Metadata of the data reference.
+
+        Raises
+        ------
+        KeyError
+            Raised if there is no metadata for this data ID.
+        """
+        key = dataId if isinstance(dataId, str) else self.makeKey(dataId)
+        row = self._connection.execute("SELECT metadata FROM metadata WHERE datasetType = ? AND dataId = ?",
+                                       (datasetType, key)).fetchone()
+        if row is None:
+            raise KeyError("No {} for data ID {}".format(datasetType, key))
+        return pickle.loads(row[0])
+
+    def keys(self, datasetType=None):
+        """Return data IDs of all records.
+
+        Parameters
+        ----------
+        datasetType : `str`, optional
+            Only return data IDs of this metadata dataset type.
+
+        Returns
+        -------
+        keys : `list` [`tuple` [`str`, `dict`]]
+            Dataset type and data ID of each record, data IDs of tasks
+            which process multiple data references are lists.
+        """
+        if datasetType is None:
+            rows = self._connection.execute("SELECT datasetType, dataId FROM metadata")
+        else:
+            rows = self._connection.execute("SELECT datasetType, dataId FROM metadata WHERE datasetType = ?",
+                                            (datasetType,))
+        return [(name, json.loads(key)) for name, key in rows]
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def merge(self, other):
+        """Copy all records of other store into this one.
+
+        Parameters
+        ----------
+        other : `str`
+            Name of the database file of the other store.
+        """
+        self.commit()
+        self._connection.execute("ATTACH DATABASE ? AS other", (other,))
+        try:
+            self._connection.execute("INSERT OR REPLACE INTO metadata SELECT * FROM other.metadata")
+            self._connection.commit()
+        finally:
+            self._connection.execute("DETACH DATABASE other")
+
+    def commit(self):
+        """Commit records written so far.
+        """
+        self._connection.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """Commit records and close the database.
+        """
+        if self._connection is not None:
+            self.commit()
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
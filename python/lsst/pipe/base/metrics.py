@@ -0,0 +1,541 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining classes for collecting and exporting task metrics.
+"""
+
+__all__ = ["Counter", "Gauge", "Histogram", "TaskMetrics", "MetricsSink"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import array
+import bisect
+import os
+import resource
+import sys
+import time
+
+# -----------------------------
+#  Imports for other modules --
+# -----------------------------
+from .memoryTracker import _readRss
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _formatLabels(labels):
+    """Format a label set, e.g. ``{task="name",status="success"}``.
+    """
+    if not labels:
+        return ""
+    items = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        items.append('{}="{}"'.format(name, value))
+    return "{" + ",".join(items) + "}"
+
+
+def _formatValue(value):
+    """Format a sample value.
+    """
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _formatHistogram(name, labels, histogram):
+    """Format histogram samples.
+    """
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append("{}_bucket{} {}".format(name, _formatLabels(labels + (("le", repr(bound)),)),
+                                             cumulative))
+    lines.append("{}_bucket{} {}".format(name, _formatLabels(labels + (("le", "+Inf"),)), histogram.count))
+    lines.append("{}_count{} {}".format(name, _formatLabels(labels), histogram.count))
+    lines.append("{}_sum{} {}".format(name, _formatLabels(labels), _formatValue(histogram.sum)))
+    return lines
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class Counter:
+    """Monotonically increasing count.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        """Increase the count.
+
+        Parameters
+        ----------
+        amount : `int` or `float`, optional
+            Non-negative increment.
+        """
+        if amount < 0:
+            raise ValueError("Counter cannot be decreased, increment is {}".format(amount))
+        self.value += amount
+
+    def merge(self, other):
+        """Add count of other counter to this one.
+        """
+        self.value += other.value
+
+
+class Gauge:
+    """Value which can go up and down.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        """Set the value.
+        """
+        self.value = value
+
+    def merge(self, other):
+        """Replace value of this gauge with the value of other gauge.
+        """
+        self.value = other.value
+
+
+class Histogram:
+    """Distribution of values in fixed buckets.
+
+    Parameters
+    ----------
+    buckets : sequence of `float`
+        Upper bounds of buckets, inclusive. Values larger than all bounds are
+        counted in an overflow bucket.
+
+    Attributes
+    ----------
+    buckets : `tuple` [`float`]
+        Sorted upper bounds of buckets.
+    counts : `array.array`
+        Count of values in each bucket (not cumulative), the last element is
+        the overflow bucket.
+    sum : `float`
+        Sum of all values.
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        if not self.buckets:
+            raise ValueError("Histogram needs at least one bucket")
+        self.counts = array.array("q", bytes(8*(len(self.buckets) + 1)))
+        self.sum = 0.
+
+    @property
+    def count(self):
+        """Number of values (`int`).
+        """
+        return sum(self.counts)
+
+    def observe(self, value):
+        """Add a value to the histogram.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        """Add values of other histogram to this one.
+
+        Raises
+        ------
+        ValueError
+            Raised if histograms have different buckets.
+        """
+        if other.buckets != self.buckets:
+            raise ValueError("Cannot merge histograms with different buckets")
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+
+    def __getstate__(self):
+        return (self.buckets, self.counts, self.sum)
+
+    def __setstate__(self, state):
+        self.buckets, self.counts, self.sum = state
+
+
+class TaskMetrics:
+    """Collection of named counters, gauges and histograms of one task.
+
+    Metrics are stored compactly and saved to task metadata only when
+    `saveToMetadata` is called (which `Task.getFullMetadata` does), so
+    updating a metric in a loop does not grow metadata.
+
+    Examples
+    --------
+    Typical use in a task method::
+
+        self.metrics.counter("numSources").inc(len(sources))
+        self.metrics.gauge("background").set(background)
+        histogram = self.metrics.histogram("iterations", buckets=[1, 2, 5, 10])
+        histogram.observe(numIterations)
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get(self, name, metricType, *args):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = metricType(*args)
+        elif type(metric) is not metricType:
+            raise TypeError("Metric {} is a {}, not a {}".format(
+                name, type(metric).__name__, metricType.__name__))
+        return metric
+
+    def counter(self, name):
+        """Return counter with a given name, making it if needed.
+
+        Returns
+        -------
+        counter : `Counter`
+
+        Raises
+        ------
+        TypeError
+            Raised if metric with this name exists and is not a counter.
+        """
+        return self._get(name, Counter)
+
+    def gauge(self, name):
+        """Return gauge with a given name, making it if needed.
+
+        Returns
+        -------
+        gauge : `Gauge`
+
+        Raises
+        ------
+        TypeError
+            Raised if metric with this name exists and is not a gauge.
+        """
+        return self._get(name, Gauge)
+
+    def histogram(self, name, buckets):
+        """Return histogram with a given name, making it if needed.
+
+        Parameters
+        ----------
+        name : `str`
+            Name of the histogram.
+        buckets : sequence of `float`
+            Upper bounds of buckets, only used when histogram is made.
+
+        Returns
+        -------
+        histogram : `Histogram`
+
+        Raises
+        ------
+        TypeError
+            Raised if metric with this name exists and is not a histogram.
+        """
+        return self._get(name, Histogram, buckets)
+
+    def items(self):
+        """Return iterable of (name, metric) pairs.
+        """
+        return self._metrics.items()
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def merge(self, other):
+        """Merge metrics from other collection into this one.
+
+        Counters and histograms are added, gauges take values from
+        ``other``.
+
+        Parameters
+        ----------
+        other : `TaskMetrics`
+            Metrics to merge.
+        """
+        for name, metric in other.items():
+            if isinstance(metric, Histogram):
+                self.histogram(name, metric.buckets).merge(metric)
+            else:
+                self._get(name, type(metric)).merge(metric)
+
+    def saveToMetadata(self, metadata):
+        """Save all metrics to metadata.
+
+        Counters and gauges are saved as items with metric name, histograms
+        as items with metric name followed by ``HistBounds`` (upper bounds of
+        buckets), ``HistCounts`` (counts in buckets, with overflow bucket at
+        the end), ``HistCount`` and ``HistSum``. Existing items with these
+        names are replaced.
+
+        Parameters
+        ----------
+        metadata : `lsst.daf.base.PropertyList`
+            Metadata to update.
+        """
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Histogram):
+                metadata.set(name + "HistBounds", list(metric.buckets))
+                metadata.set(name + "HistCounts", list(metric.counts))
+                metadata.set(name + "HistCount", metric.count)
+                metadata.set(name + "HistSum", metric.sum)
+            else:
+                metadata.set(name, metric.value)
+
+
+class MetricsSink:
+    """Aggregator of task run metrics written in OpenMetrics text format.
+
+    Metrics are updated from results of `TaskRunner.__call__` and written to
+    a file which can be scraped by e.g. the textfile collector of Prometheus
+    node exporter. The file is replaced atomically, so readers never see a
+    partially written file.
+
+    Parameters
+    ----------
+    path : `str`
+        Name of the output file.
+    taskName : `str`
+        Name of the task, used as the value of ``task`` label.
+    buckets : sequence of `float`, optional
+        Upper bounds (seconds) of duration histogram buckets.
+    minInterval : `float`, optional
+        Minimum time (seconds) between writes done by `update`.
+    prefix : `str`, optional
+        Prefix of all metric names.
+
+    Notes
+    -----
+    Exported metrics (names without prefix):
+
+    - ``targets_total``: counter of processed targets, with ``status`` label
+      ``success`` or ``failure``.
+    - ``target_duration_seconds``: histogram of wall clock time per target,
+      summed over top-level timed methods.
+    - ``method_calls_total``: counter of calls of timed methods, with
+      ``method`` label (full task name and method name).
+    - ``method_seconds_total``: counter of wall clock time of timed methods,
+      with ``method`` label, inclusive of called methods.
+    - ``method_duration_seconds``: histogram of wall clock time of timed
+      methods per target, with ``method`` label.
+    - ``resident_memory_bytes``: gauge of resident set size of this process.
+    - ``children_max_resident_memory_bytes``: gauge of the largest resident
+      set size of finished child processes (e.g. multiprocessing workers).
+    - ``task_counter_total``, ``task_gauge``, ``task_histogram``: metrics
+      of `Task.metrics` of all tasks, merged over all targets, with
+      ``subtask`` (full task name) and ``metric`` (metric name) labels.
+    """
+
+    DEFAULT_BUCKETS = (0.01, 0.1, 1., 10., 60., 300., 1800., 3600., 14400.)
+
+    def __init__(self, path, taskName, buckets=None, minInterval=5., prefix="pipe_base"):
+        self.path = path
+        self.taskName = taskName
+        self.buckets = tuple(sorted(buckets if buckets is not None else self.DEFAULT_BUCKETS))
+        self.minInterval = minInterval
+        self.prefix = prefix
+        self._targets = {"success": 0, "failure": 0}
+        self._targetDuration = Histogram(self.buckets)
+        self._methodCalls = {}
+        self._methodSeconds = {}
+        self._methodDuration = {}
+        self._taskMetrics = {}
+        self._lastWrite = None
+
+    def addResult(self, result):
+        """Add one result of `TaskRunner.__call__` to metrics.
+
+        Parameters
+        ----------
+        result : `Struct`
+            Result of one target, its ``exitStatus``, ``timingTree`` and
+            ``taskMetrics`` attributes are used if present.
+        """
+        status = "success" if getattr(result, "exitStatus", 0) == 0 else "failure"
+        self._targets[status] += 1
+        timingTree = getattr(result, "timingTree", None)
+        if timingTree is not None:
+            self.addTimingTree(timingTree)
+        taskMetrics = getattr(result, "taskMetrics", None)
+        if taskMetrics is not None:
+            self.addTaskMetrics(taskMetrics)
+
+    def addTaskMetrics(self, taskMetrics):
+        """Add task metrics of one target.
+
+        Parameters
+        ----------
+        taskMetrics : `dict` [`str`, `TaskMetrics`]
+            Metrics indexed by full task name, as returned by
+            `Task.getFullMetrics`.
+        """
+        for fullName, metrics in taskMetrics.items():
+            self._taskMetrics.setdefault(fullName, TaskMetrics()).merge(metrics)
+
+    def addTimingTree(self, timingTree):
+        """Add timing of one target to metrics.
+
+        Parameters
+        ----------
+        timingTree : `TimingTree`
+            Timing tree of the target.
+        """
+        self._targetDuration.observe(sum(node.wallTime for node in timingTree.root.children.values()))
+        wallTimes = {}
+        for path, node in timingTree.walk():
+            self._methodCalls[node.name] = self._methodCalls.get(node.name, 0) + node.calls
+            # recursive calls are already included in their caller
+            if node.name not in path[:-1]:
+                wallTimes[node.name] = wallTimes.get(node.name, 0.) + node.wallTime
+        for name, wallTime in wallTimes.items():
+            self._methodSeconds[name] = self._methodSeconds.get(name, 0.) + wallTime
+            histogram = self._methodDuration.get(name)
+            if histogram is None:
+                histogram = self._methodDuration[name] = Histogram(self.buckets)
+            histogram.observe(wallTime)
+
+    def format(self):
+        """Return all metrics in OpenMetrics text format.
+
+        Returns
+        -------
+        text : `str`
+            Metrics, ending with ``# EOF`` line.
+        """
+        prefix = self.prefix
+        task = (("task", self.taskName),)
+        lines = []
+
+        name = prefix + "_targets"
+        lines += ["# TYPE {} counter".format(name),
+                  "# HELP {} Number of processed targets.".format(name)]
+        for status, count in sorted(self._targets.items()):
+            lines.append("{}_total{} {}".format(name, _formatLabels(task + (("status", status),)), count))
+
+        name = prefix + "_target_duration_seconds"
+        lines += ["# TYPE {} histogram".format(name),
+                  "# HELP {} Wall clock time per target.".format(name)]
+        lines += _formatHistogram(name, task, self._targetDuration)
+
+        name = prefix + "_method_calls"
+        lines += ["# TYPE {} counter".format(name),
+                  "# HELP {} Number of calls of timed methods.".format(name)]
+        for method, count in sorted(self._methodCalls.items()):
+            lines.append("{}_total{} {}".format(name, _formatLabels(task + (("method", method),)), count))
+
+        name = prefix + "_method_seconds"
+        lines += ["# TYPE {} counter".format(name),
+                  "# HELP {} Wall clock time of timed methods.".format(name)]
+        for method, seconds in sorted(self._methodSeconds.items()):
+            lines.append("{}_total{} {}".format(name, _formatLabels(task + (("method", method),)),
+                                                repr(seconds)))
+
+        name = prefix + "_method_duration_seconds"
+        lines += ["# TYPE {} histogram".format(name),
+                  "# HELP {} Wall clock time of timed methods per target.".format(name)]
+        for method, histogram in sorted(self._methodDuration.items()):
+            lines += _formatHistogram(name, task + (("method", method),), histogram)
+
+        counters, gauges, histograms = [], [], []
+        for fullName, metrics in sorted(self._taskMetrics.items()):
+            for metricName, metric in sorted(metrics.items()):
+                labels = task + (("subtask", fullName), ("metric", metricName))
+                if isinstance(metric, Counter):
+                    counters.append("{}_task_counter_total{} {}".format(prefix, _formatLabels(labels),
+                                                                        _formatValue(metric.value)))
+                elif isinstance(metric, Gauge):
+                    gauges.append("{}_task_gauge{} {}".format(prefix, _formatLabels(labels),
+                                                              _formatValue(metric.value)))
+                else:
+                    histograms += _formatHistogram(prefix + "_task_histogram", labels, metric)
+        if counters:
+            lines += ["# TYPE {}_task_counter counter".format(prefix),
+                      "# HELP {}_task_counter Counters of tasks.".format(prefix)] + counters
+        if gauges:
+            lines += ["# TYPE {}_task_gauge gauge".format(prefix),
+                      "# HELP {}_task_gauge Gauges of tasks.".format(prefix)] + gauges
+        if histograms:
+            lines += ["# TYPE {}_task_histogram histogram".format(prefix),
+                      "# HELP {}_task_histogram Histograms of tasks.".format(prefix)] + histograms
+
+        rss = _readRss()
+        if rss is not None:
+            name = prefix + "_resident_memory_bytes"
+            lines += ["# TYPE {} gauge".format(name),
+                      "# HELP {} Resident set size of the main process.".format(name),
+                      "{}{} {}".format(name, _formatLabels(task), rss)]
+        name = prefix + "_children_max_resident_memory_bytes"
+        maxRss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * _MAXRSS_UNIT
+        lines += ["# TYPE {} gauge".format(name),
+                  "# HELP {} Largest resident set size of finished child processes.".format(name),
+                  "{}{} {}".format(name, _formatLabels(task), maxRss)]
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """Write metrics to the output file.
+
+        Metrics are written to a temporary file in the same directory which
+        then replaces the output file.
+        """
+        tmpPath = "{}.tmp{}".format(self.path, os.getpid())
+        with open(tmpPath, "w") as output:
+            output.write(self.format())
+        os.replace(tmpPath, self.path)
+        self._lastWrite = time.monotonic()
+
+    def update(self, result):
+        """Add result to metrics and write them if ``minInterval`` passed
+        since the last write.
+
+        Parameters
+        ----------
+        result : `Struct`
+            Result of one target, see `addResult`.
+        """
+        self.addResult(result)
+        if self._lastWrite is None or time.monotonic() - self._lastWrite >= self.minInterval:
+            self.write()
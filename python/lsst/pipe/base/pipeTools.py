@@ -23,15 +23,18 @@
 """
 
 # No one should do import * from this module
-__all__ = ["isPipelineOrdered", "orderPipeline"]
+__all__ = ["isPipelineOrdered", "orderPipeline", "fusePipeline", "prunePipeline"]
 
 # -------------------------------
 #  Imports of standard modules --
 # -------------------------------
+import copy
+import heapq
 
 # -----------------------------
 #  Imports for other modules --
 # -----------------------------
+from .fusedTask import FusedPipelineTask
 from .pipeline import Pipeline
 
 # ----------------------------------
@@ -52,9 +55,18 @@ def _loadTaskClass(taskDef, taskFactory):
         if not taskFactory:
             raise MissingTaskFactoryError("Task class is not defined but task "
                                           "factory instance is not provided")
-        taskClass = taskFactory.loadTaskClass(taskDef.taskName)
+        taskClass, _ = taskFactory.loadTaskClasses([taskDef.taskName])[taskDef.taskName]
     return taskClass
 
+
+def _startLoadingTaskClasses(pipeline, taskFactory):
+    """Start importing all task classes of a pipeline which are not loaded
+    yet, so that they are imported concurrently.
+    """
+    if taskFactory:
+        taskFactory.startLoadingTaskClasses(taskDef.taskName for taskDef in pipeline
+                                            if not taskDef.taskClass)
+
 # ------------------------
 #  Exported definitions --
 # ------------------------
@@ -79,6 +91,13 @@ class PipelineDataCycleError(Exception):
     pass
 
 
+class MissingTargetError(Exception):
+    """Exception raised when requested dataset type is not produced by any
+    task in Pipeline.
+    """
+    pass
+
+
 def isPipelineOrdered(pipeline, taskFactory=None):
     """Checks whether tasks in pipeline are correctly ordered.
 
@@ -105,6 +124,8 @@ def isPipelineOrdered(pipeline, taskFactory=None):
     `MissingTaskFactoryError` is raised when TaskFactory is needed but not
     provided.
     """
+    _startLoadingTaskClasses(pipeline, taskFactory)
+
     # Build a map of DatasetType name to producer's index in a pipeline
     producerIndex = {}
     for idx, taskDef in enumerate(pipeline):
@@ -162,13 +183,17 @@ def orderPipeline(pipeline, taskFactory=None):
     provided.
     """
 
-    # This is a modified version of Kahn's algorithm that preserves order
+    # This is a modified version of Kahn's algorithm that preserves order:
+    # tasks with no unprocessed producers are kept in a heap of their
+    # original indices, so the first task in the original order is always
+    # taken next.
+
+    _startLoadingTaskClasses(pipeline, taskFactory)
 
     # build mapping of the tasks to their inputs and outputs
-    inputs = {}   # maps task index to its input DatasetType names
-    outputs = {}  # maps task index to its output DatasetType names
-    allInputs = set()   # all inputs of all tasks
-    allOutputs = set()  # all outputs of all tasks
+    inputs = []   # input DatasetType names of each task
+    outputs = []  # output DatasetType names of each task
+    producerIndex = {}  # maps DatasetType name to index of its producer
     for idx, taskDef in enumerate(pipeline):
 
         # we will need task class for next operations, make sure it is loaded
@@ -177,51 +202,48 @@ def orderPipeline(pipeline, taskFactory=None):
         # task outputs
         dsMap = taskClass.getOutputDatasetTypes(taskDef.config)
         for dsTypeDescr in dsMap.values():
-            if dsTypeDescr.name in allOutputs:
+            if dsTypeDescr.name in producerIndex:
                 raise DuplicateOutputError("DatasetType `{}' appears more than "
                                            "once as output".format(dsTypeDescr.name))
-        outputs[idx] = set(dsTypeDescr.name for dsTypeDescr in dsMap.values())
-        allOutputs.update(outputs[idx])
+        outputs.append(set(dsTypeDescr.name for dsTypeDescr in dsMap.values()))
+        for name in outputs[idx]:
+            producerIndex[name] = idx
 
         # task inputs
         dsMap = taskClass.getInputDatasetTypes(taskDef.config)
-        inputs[idx] = set(dsTypeDescr.name for dsTypeDescr in dsMap.values())
-        allInputs.update(inputs[idx])
-
-    # for simplicity add pseudo-node which is a producer for all pre-existing
-    # inputs, its index is -1
-    preExisting = allInputs - allOutputs
-    outputs[-1] = preExisting
-
-    # Set of nodes with no incoming edges, initially set to pseudo-node
-    queue = [-1]
+        inputs.append(set(dsTypeDescr.name for dsTypeDescr in dsMap.values()))
+
+    # edges from producers to consumers, pre-existing inputs have no producer;
+    # number of incoming edges of each task is the number of its producers
+    consumers = [[] for _ in inputs]
+    inDegree = []
+    for idx, inputNames in enumerate(inputs):
+        producers = set(producerIndex[name] for name in inputNames if name in producerIndex)
+        for producer in producers:
+            consumers[producer].append(idx)
+        inDegree.append(len(producers))
+
+    # heap of tasks with no incoming edges, sorted list is a valid heap
+    queue = [idx for idx, count in enumerate(inDegree) if count == 0]
     result = []
     while queue:
-
-        # move to final list, drop -1
-        idx = queue.pop(0)
-        if idx >= 0:
-            result.append(idx)
-
-        # remove task outputs from other tasks inputs
-        thisTaskOutputs = outputs.get(idx, set())
-        for taskInputs in inputs.values():
-            taskInputs -= thisTaskOutputs
-
-        # find all nodes with no incoming edges and move them to the queue
-        topNodes = [key for key, value in inputs.items() if not value]
-        queue += topNodes
-        for key in topNodes:
-            del inputs[key]
-
-        # keep queue ordered
-        queue.sort()
+        idx = heapq.heappop(queue)
+        result.append(idx)
+        for consumer in consumers[idx]:
+            inDegree[consumer] -= 1
+            if inDegree[consumer] == 0:
+                heapq.heappush(queue, consumer)
 
     # if there is something left it means cycles
-    if inputs:
-        # format it in usable way
+    if len(result) < len(inputs):
+        # format it in usable way, showing inputs which are not produced yet
+        done = set(result)
         loops = []
-        for idx, inputNames in inputs.items():
+        for idx, taskInputs in enumerate(inputs):
+            if idx in done:
+                continue
+            inputNames = set(name for name in taskInputs
+                             if name in producerIndex and producerIndex[name] not in done)
             taskName = pipeline[idx].label
             outputNames = outputs[idx]
             edge = "   {} -> {} -> {}".format(inputNames, taskName, outputNames)
@@ -229,3 +251,188 @@ def orderPipeline(pipeline, taskFactory=None):
         raise PipelineDataCycleError("Pipeline has data cycles:\n" + "\n".join(loops))
 
     return Pipeline(pipeline[idx] for idx in result)
+
+
+def fusePipeline(pipeline, taskFactory=None, keepOutputs=()):
+    """Replace linear chains of tasks with single fused tasks.
+
+    A chain is a sequence of tasks with identical quantum dimensions where
+    each task (except the first one) consumes outputs of the previous task
+    and of no other task in the pipeline, and where each task (except the
+    last one) has only one consumer in the chain. Every chain of two or
+    more tasks is replaced with a `FusedPipelineTask`, so that one quantum
+    per data ID covers the whole chain and datasets passed between its
+    tasks are kept in memory. Intermediate datasets which are consumed by
+    other tasks of the pipeline or are listed in ``keepOutputs`` are still
+    written to butler.
+
+    Datasets passed in memory must not have dimensions which are not in
+    quantum dimensions, otherwise tasks are not joined.
+
+    Parameters
+    ----------
+    pipeline : `pipe.base.Pipeline`
+        Pipeline description.
+    taskFactory: `pipe.base.TaskFactory`, optional
+        Instance of an object which knows how to import task classes. It is only
+        used if pipeline task definitions do not define task classes.
+    keepOutputs : iterable of `str`, optional
+        Names of the intermediate dataset types which have to be written to
+        butler.
+
+    Returns
+    -------
+    Correctly ordered pipeline (`pipe.base.Pipeline` instance) with fused
+    tasks, task definitions which are not fused are the same objects as in
+    the original pipeline, or their copies if their task classes had to be
+    loaded.
+
+    Raises
+    ------
+    `ImportError` is raised when task class cannot be imported.
+    `DuplicateOutputError` is raised when there is more than one producer for a
+    dataset type.
+    `PipelineDataCycleError` is also raised when pipeline has dependency cycles.
+    `MissingTaskFactoryError` is raised when TaskFactory is needed but not
+    provided.
+    """
+    pipeline = orderPipeline(pipeline, taskFactory)
+    keepOutputs = set(keepOutputs)
+
+    # input and output dataset types of each task
+    inputs = []
+    outputs = []
+    for idx, taskDef in enumerate(pipeline):
+        if taskDef.taskClass is None:
+            # do not update task definitions of the original pipeline
+            taskDef = copy.copy(taskDef)
+            taskDef.taskClass = _loadTaskClass(taskDef, taskFactory)
+            pipeline[idx] = taskDef
+        inputs.append(taskDef.taskClass.getInputDatasetTypes(taskDef.config))
+        outputs.append(taskDef.taskClass.getOutputDatasetTypes(taskDef.config))
+
+    producerIndex = {}
+    consumerIndices = {}
+    for idx, (taskInputs, taskOutputs) in enumerate(zip(inputs, outputs)):
+        for dsTypeDescr in taskOutputs.values():
+            producerIndex[dsTypeDescr.name] = idx
+        for dsTypeDescr in taskInputs.values():
+            consumerIndices.setdefault(dsTypeDescr.name, set()).add(idx)
+
+    def canJoin(producer, consumer):
+        """Return True if consumer, whose only producer is ``producer``,
+        can be appended to a chain ending with producer.
+        """
+        dimensions = set(pipeline[consumer].config.quantum.dimensions or ())
+        if dimensions != set(pipeline[producer].config.quantum.dimensions or ()):
+            return False
+        for dsTypeDescr in inputs[consumer].values():
+            name = dsTypeDescr.name
+            inMemory = (name in producerIndex and name not in keepOutputs and
+                        consumerIndices[name] == {consumer})
+            if inMemory and not set(dsTypeDescr.dimensionNames) <= dimensions:
+                return False
+        return True
+
+    # chains in the order of their first task, and index of a chain for
+    # each task
+    chains = []
+    chainIndex = []
+    for idx in range(len(pipeline)):
+        producers = set(producerIndex[dsTypeDescr.name] for dsTypeDescr in inputs[idx].values()
+                        if dsTypeDescr.name in producerIndex)
+        if len(producers) == 1:
+            producer = producers.pop()
+            taskChain = chains[chainIndex[producer]]
+            if taskChain[-1] == producer and canJoin(producer, idx):
+                taskChain.append(idx)
+                chainIndex.append(chainIndex[producer])
+                continue
+        chainIndex.append(len(chains))
+        chains.append([idx])
+
+    fused = Pipeline()
+    for taskChain in chains:
+        if len(taskChain) == 1:
+            fused.append(pipeline[taskChain[0]])
+            continue
+        # intermediates consumed outside of the chain have to be written too
+        members = set(taskChain)
+        keep = set()
+        for idx in taskChain[:-1]:
+            for dsTypeDescr in outputs[idx].values():
+                consumers = consumerIndices.get(dsTypeDescr.name, set())
+                if consumers & members and (dsTypeDescr.name in keepOutputs or not consumers <= members):
+                    keep.add(dsTypeDescr.name)
+        fused.append(FusedPipelineTask.makeTaskDef([pipeline[idx] for idx in taskChain], keep))
+
+    # fused tasks are placed at the position of their first task
+    return orderPipeline(fused, taskFactory)
+
+
+def prunePipeline(pipeline, targets, taskFactory=None):
+    """Remove tasks which are not needed to produce given dataset types.
+
+    A task is kept if it produces one of the target dataset types or if
+    it produces an input of another task which is kept.
+
+    Parameters
+    ----------
+    pipeline : `pipe.base.Pipeline`
+        Pipeline description.
+    targets : iterable of `str`
+        Names of the dataset types which have to be produced.
+    taskFactory: `pipe.base.TaskFactory`, optional
+        Instance of an object which knows how to import task classes. It is only
+        used if pipeline task definitions do not define task classes.
+
+    Returns
+    -------
+    Correctly ordered pipeline (`pipe.base.Pipeline` instance) containing
+    only the tasks needed for targets, task definitions are the same objects
+    as in the original pipeline.
+
+    Raises
+    ------
+    `ImportError` is raised when task class cannot be imported.
+    `DuplicateOutputError` is raised when there is more than one producer for a
+    dataset type.
+    `PipelineDataCycleError` is also raised when pipeline has dependency cycles.
+    `MissingTaskFactoryError` is raised when TaskFactory is needed but not
+    provided.
+    `MissingTargetError` is raised when a target dataset type is not produced
+    by any task.
+
+    Notes
+    -----
+    Kept tasks still produce all of their outputs, including those which
+    are not needed for targets. Use `fusePipeline` with ``keepOutputs``
+    equal to targets to avoid writing intermediate outputs of the pruned
+    pipeline.
+    """
+    pipeline = orderPipeline(pipeline, taskFactory)
+    targets = list(targets)
+
+    producerIndex = {}
+    inputs = []
+    for idx, taskDef in enumerate(pipeline):
+        taskClass = _loadTaskClass(taskDef, taskFactory)
+        for dsTypeDescr in taskClass.getOutputDatasetTypes(taskDef.config).values():
+            producerIndex[dsTypeDescr.name] = idx
+        inputs.append([dsTypeDescr.name for dsTypeDescr
+                       in taskClass.getInputDatasetTypes(taskDef.config).values()])
+
+    missing = set(name for name in targets if name not in producerIndex)
+    if missing:
+        raise MissingTargetError("Dataset types {} are not produced by any task".format(sorted(missing)))
+
+    # walk from targets to their producers, then to producers of their inputs
+    needed = set()
+    stack = [producerIndex[name] for name in targets]
+    while stack:
+        idx = stack.pop()
+        if idx not in needed:
+            needed.add(idx)
+            stack += [producerIndex[name] for name in inputs[idx] if name in producerIndex]
+
+    return Pipeline(taskDef for idx, taskDef in enumerate(pipeline) if idx in needed)
@@ -27,6 +27,10 @@ __all__ = ["Pipeline", "TaskDef"]
 # -------------------------------
 #  Imports of standard modules --
 # -------------------------------
+import importlib
+import io
+import json
+import re
 
 # -----------------------------
 #  Imports for other modules --
@@ -36,6 +40,136 @@ __all__ = ["Pipeline", "TaskDef"]
 #  Local non-exported definitions --
 # ----------------------------------
 
+# Version of the format written by `Pipeline.save`
+_FORMAT_VERSION = 1
+
+# Name of the root config in saved configuration
+_CONFIG_ROOT = "config"
+
+# Saved default configuration for each config class
+_defaultConfigText = {}
+
+_PATH_RE = re.compile(r"\[[^\]]*\]|[^.\[]+")
+
+
+def _importName(fullName):
+    """Import object given its full name, e.g. ``package.module.Class``.
+    """
+    moduleName, _, name = fullName.rpartition(".")
+    while moduleName:
+        try:
+            obj = importlib.import_module(moduleName)
+            break
+        except ImportError:
+            moduleName, _, parent = moduleName.rpartition(".")
+            name = parent + "." + name
+    else:
+        raise ImportError("Cannot import {}".format(fullName))
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _saveConfig(config):
+    """Return configuration saved as Python code.
+    """
+    stream = io.StringIO()
+    config.saveToStream(stream, _CONFIG_ROOT)
+    return stream.getvalue()
+
+
+def _splitStatements(text):
+    """Split saved configuration into import statements and other
+    statements, dropping comments and blank lines.
+
+    Returns
+    -------
+    imports : `list` [`str`]
+        Import statements.
+    statements : `list` [`tuple`]
+        Tuples of the path of the assigned attribute (`tuple` of `str`) and
+        the statement.
+    """
+    imports = []
+    statements = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if line[0] in " \t)]}" and statements:
+            # continuation of a multi-line statement
+            path, statement = statements[-1]
+            statements[-1] = (path, statement + "\n" + line)
+        elif stripped.startswith("import ") or stripped.startswith("from "):
+            if stripped not in imports:
+                imports.append(stripped)
+        else:
+            if ".retarget(" in line:
+                target = line.split(".retarget(", 1)[0]
+            else:
+                target = line.split("=", 1)[0]
+            statements.append((tuple(_PATH_RE.findall(target.strip())), line))
+    return imports, statements
+
+
+def _diffStatements(depth, statements, defaults, delta):
+    """Add statements of a configuration subtree which differ from defaults
+    to ``delta``.
+
+    Subtrees are compared as a whole. A subtree which differs from defaults
+    and has statements modifying the subtree itself (assignment of a value
+    or a dictionary, retargeting a subtask) is kept as a whole because later
+    statements depend on them, otherwise its children are compared
+    separately.
+    """
+    if [line for _, line in statements] == [line for _, line in defaults]:
+        return
+    if any(len(path) <= depth for path, _ in statements + defaults):
+        delta += [line for _, line in statements]
+        return
+    children = {}
+    for index, block in enumerate((statements, defaults)):
+        for path, line in block:
+            children.setdefault(path[depth], ([], []))[index].append((path, line))
+    for childStatements, childDefaults in children.values():
+        _diffStatements(depth + 1, childStatements, childDefaults, delta)
+
+
+def _configDelta(config):
+    """Return Python code which applies ``config`` to the default
+    configuration of its class.
+
+    Parameters
+    ----------
+    config : `lsst.pex.config.Config`
+        Configuration.
+
+    Returns
+    -------
+    delta : `str`
+        Import statements followed by statements of the saved configuration
+        which are different from the defaults.
+    """
+    configClass = type(config)
+    defaultText = _defaultConfigText.get(configClass)
+    if defaultText is None:
+        defaultText = _defaultConfigText[configClass] = _saveConfig(configClass())
+    imports, statements = _splitStatements(_saveConfig(config))
+    _, defaults = _splitStatements(defaultText)
+    delta = []
+    _diffStatements(1, statements, defaults, delta)
+    return "\n".join(imports + delta)
+
+
+def _loadConfig(configClassName, delta):
+    """Make configuration from the name of its class and the delta returned
+    by `_configDelta`.
+    """
+    config = _importName(configClassName)()
+    if delta:
+        config.loadFromStream(delta, _CONFIG_ROOT)
+    return config
+
 # ------------------------
 #  Exported definitions --
 # ------------------------
@@ -63,6 +197,11 @@ class TaskDef:
         framework will have to locate and load class.
     label : `str`, optional
         Task label, usually a short string unique in a pipeline.
+
+    Notes
+    -----
+    For task definitions loaded with `Pipeline.load` the configuration is
+    made when ``config`` is accessed for the first time, it is frozen.
     """
     def __init__(self, taskName, config, taskClass=None, label=""):
         self.taskName = taskName
@@ -70,6 +209,31 @@ class TaskDef:
         self.taskClass = taskClass
         self.label = label
 
+    @property
+    def config(self):
+        """Configuration of the task (`lsst.pex.config.Config`).
+        """
+        if self._configSource is not None:
+            self._config = _loadConfig(*self._configSource)
+            self._config.freeze()
+            self._configSource = None
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self._configSource = None
+
+    def _getConfigSource(self):
+        """Return full name of the configuration class and the delta
+        returned by `_configDelta`, without making the configuration if it
+        has not been made yet.
+        """
+        if self._configSource is not None:
+            return self._configSource
+        configClass = type(self._config)
+        return configClass.__module__ + "." + configClass.__qualname__, _configDelta(self._config)
+
     def __str__(self):
         rep = "TaskDef(" + self.taskName
         if self.label:
@@ -87,9 +251,11 @@ class Pipeline(list):
 
     Main purpose of this class is to provide a mechanism to pass pipeline
     definition from users to supervising framework. That mechanism is
-    implemented using simple serialization and de-serialization via
-    `pickle`. Note that pipeline serialization is not guaranteed to be
-    compatible between different versions or releases.
+    implemented using serialization and de-serialization with `save` and
+    `load`, which store task names, labels and the differences of task
+    configurations from their defaults in a versioned JSON format.
+    Serialization via `pickle` also works, but it is slower and is not
+    guaranteed to be compatible between different versions or releases.
 
     In current implementation Pipeline is a list (it inherits from `list`)
     and one can use all list methods on pipeline. Content of the pipeline
@@ -123,6 +289,63 @@ class Pipeline(list):
                 return idx
         return -1
 
+    def save(self, filename):
+        """Save pipeline to a file.
+
+        Parameters
+        ----------
+        filename : `str`
+            Name of the output file.
+
+        Notes
+        -----
+        Only task names, labels, names of configuration classes and
+        differences of configurations from the defaults of their classes
+        are saved; task classes are not. Configurations of tasks loaded with
+        `load` which were never accessed are saved without making them.
+        """
+        tasks = []
+        for taskDef in self:
+            configClassName, configDelta = taskDef._getConfigSource()
+            tasks.append(dict(taskName=taskDef.taskName, label=taskDef.label,
+                              configClass=configClassName, config=configDelta))
+        with open(filename, "w") as output:
+            json.dump(dict(version=_FORMAT_VERSION, tasks=tasks), output, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        """Load pipeline from a file written by `save`.
+
+        Parameters
+        ----------
+        filename : `str`
+            Name of the input file.
+
+        Returns
+        -------
+        pipeline : `Pipeline`
+            Loaded pipeline. ``taskClass`` of all task definitions is `None`
+            and configurations are made from their saved differences when
+            they are accessed for the first time, so no task or configuration
+            classes are imported here. Configurations are frozen.
+
+        Raises
+        ------
+        ValueError
+            Raised if the file was written by a newer version of this class.
+        """
+        with open(filename) as input:
+            data = json.load(input)
+        version = data.get("version")
+        if not isinstance(version, int) or version > _FORMAT_VERSION:
+            raise ValueError("Unsupported pipeline format version {} in {}".format(version, filename))
+        pipeline = cls()
+        for task in data["tasks"]:
+            taskDef = TaskDef(taskName=task["taskName"], config=None, label=task["label"])
+            taskDef._configSource = (task["configClass"], task["config"])
+            pipeline.append(taskDef)
+        return pipeline
+
     def __str__(self):
         infos = [str(tdef) for tdef in self]
         return "Pipeline({})".format(", ".join(infos))
@@ -27,6 +27,7 @@ __all__ = ["PipelineBuilder"]
 # -------------------------------
 #  Imports of standard modules --
 # -------------------------------
+import copy
 import logging
 
 # -----------------------------
@@ -72,7 +73,9 @@ class PipelineBuilder:
         """Return updated pipeline instance.
 
         Pipeline will be checked for possible inconsistencies before
-        returning.
+        returning. Task configurations are frozen, config overrides applied
+        after this method is called are applied to copies of
+        configurations.
 
         Parameters
         ----------
@@ -93,6 +96,8 @@ class PipelineBuilder:
         # conditionally re-order pipeline if requested, but unconditionally
         # check for possible errors
         orderedPipeline = pipeTools.orderPipeline(self._pipeline, self._taskFactory)
+        for taskDef in self._pipeline:
+            taskDef.config.freeze()
         if ordered:
             return orderedPipeline
         else:
@@ -172,6 +177,16 @@ class PipelineBuilder:
             raise LookupError("New task label is not unique: " + label)
         self._pipeline[idx].label = newLabel
 
+    def _mutableConfig(self, idx):
+        """Return configuration of a task which can be modified.
+
+        Configurations frozen by `pipeline` are replaced with their copies.
+        """
+        taskDef = self._pipeline[idx]
+        if getattr(taskDef.config, "_frozen", False):
+            taskDef.config = copy.deepcopy(taskDef.config)
+        return taskDef.config
+
     def configOverride(self, label, value):
         """Apply single config override.
 
@@ -189,7 +204,7 @@ class PipelineBuilder:
         key, sep, val = value.partition('=')
         overrides = ConfigOverrides()
         overrides.addValueOverride(key, val)
-        overrides.applyTo(self._pipeline[idx].config)
+        overrides.applyTo(self._mutableConfig(idx))
 
     def configOverrideFile(self, label, path):
         """Apply overrides from file.
@@ -206,7 +221,7 @@ class PipelineBuilder:
             raise LookupError("Task label is not found: " + label)
         overrides = ConfigOverrides()
         overrides.addFileOverride(path)
-        overrides.applyTo(self._pipeline[idx].config)
+        overrides.applyTo(self._mutableConfig(idx))
 
     def substituteDatatypeNames(self, label, value):
         """Apply name string formatting to config file.
@@ -224,4 +239,4 @@ class PipelineBuilder:
 
         overrides = ConfigOverrides()
         overrides.addDatasetNameSubstitution(value)
-        overrides.applyTo(self._pipeline[idx].config)
+        overrides.applyTo(self._mutableConfig(idx))
@@ -22,11 +22,16 @@
 """This module defines PipelineTask class and related methods.
 """
 
-__all__ = ["DatasetTypeDescriptor", "PipelineTask"]  # Classes in this module
+__all__ = ["DatasetTypeDescriptor", "PipelineTask", "StreamedOutputError"]  # Classes in this module
+
+import collections
+import inspect
+import weakref
 
 from lsst.daf.butler import DatasetType
 from .config import (InputDatasetConfig, OutputDatasetConfig,
-                     InitInputDatasetConfig, InitOutputDatasetConfig)
+                     InitInputDatasetConfig, InitOutputDatasetConfig,
+                     _BaseDatasetTypeConfig)
 from .task import Task
 
 
@@ -46,6 +51,70 @@ class ScalarError(TypeError):
                           "received {} DataIds").format(key, numDataIds))
 
 
+class StreamedOutputError(ValueError):
+    """Exception raised when outputs yielded by a task do not match
+    the outputs of a Quantum.
+    """
+    pass
+
+
+def _dataIdKey(dataId):
+    """Make a hashable key out of a DataId.
+    """
+    return tuple(sorted(dataId.items()))
+
+
+# Maps (task class, dataset config class, config fingerprint) to descriptors,
+# least recently used entries are removed when it is full.
+_datasetTypesCache = collections.OrderedDict()
+_DATASET_TYPES_CACHE_SIZE = 1000
+
+# Maps id() of frozen configs to their fingerprints, entries are removed
+# when config is garbage-collected.
+_configFingerprints = {}
+
+
+def _makeConfigFingerprint(config):
+    """Return values of all dataset type fields of a configuration.
+    """
+    return tuple((name, type(value), value.name, value.storageClass, tuple(value.dimensions),
+                  getattr(value, "scalar", True), getattr(value, "manualLoad", False))
+                 for name, value in config.items()
+                 if isinstance(value, _BaseDatasetTypeConfig))
+
+
+def _configFingerprint(config):
+    """Return fingerprint of a configuration.
+
+    Parameters
+    ----------
+    config : `lsst.pex.config.Config`
+        Task configuration.
+
+    Returns
+    -------
+    fingerprint : `tuple`
+        Values of all dataset type fields of the configuration.
+
+    Notes
+    -----
+    Only top-level dataset type fields are used, same as in
+    `PipelineTask.getDatasetTypes`, other fields (e.g. subtask configurations)
+    are not visited. Fingerprints of frozen configurations are remembered,
+    fingerprints of other configurations are computed on every call, as
+    they can change.
+    """
+    if not getattr(config, "_frozen", False):
+        return _makeConfigFingerprint(config)
+    key = id(config)
+    fingerprint = _configFingerprints.get(key)
+    if fingerprint is None:
+        fingerprint = _makeConfigFingerprint(config)
+        weakref.finalize(config, _configFingerprints.pop, key, None)
+        _configFingerprints[key] = fingerprint
+    return fingerprint
+
+
 class DatasetTypeDescriptor:
     """Description of an unnormalized proto-DatasetType and its relationship to
     a PipelineTask.
@@ -122,6 +191,13 @@ class DatasetTypeDescriptor:
         """
         return self._name
 
+    @property
+    def dimensionNames(self):
+        """Names of the dimensions used to identify datasets of this type
+        (`~collections.abc.Set` of `str`).
+        """
+        return self._dimensionNames
+
     @property
     def scalar(self):
         """`True` if this is a scalar dataset.
@@ -372,6 +448,30 @@ class PipelineTask(Task):
         implementation uses configuration field name as dictionary key.
         Returns empty dict if configuration has no fields with the specified
         ``configClass``.
+
+        Notes
+        -----
+        Descriptors are cached, indexed by task class, ``configClass`` and
+        values of dataset type fields of the configuration, so repeated calls
+        (e.g. when ordering a pipeline and building a quantum graph) do not
+        make descriptors again. Each call returns a new dictionary. Values of
+        the fields of frozen configurations (e.g. in pipelines returned by
+        `PipelineBuilder.pipeline` and `Pipeline.load`) are only read once.
+        """
+        key = (cls, configClass, _configFingerprint(config))
+        dsTypes = _datasetTypesCache.get(key)
+        if dsTypes is None:
+            dsTypes = _datasetTypesCache[key] = cls._makeDatasetTypes(config, configClass)
+            if len(_datasetTypesCache) > _DATASET_TYPES_CACHE_SIZE:
+                _datasetTypesCache.popitem(last=False)
+        else:
+            _datasetTypesCache.move_to_end(key)
+        return dict(dsTypes)
+
+    @classmethod
+    def _makeDatasetTypes(cls, config, configClass):
+        """Make dataset type descriptors defined in task configuration,
+        implementation of `getDatasetTypes`.
         """
         dsTypes = {}
         for key, value in config.items():
@@ -456,13 +556,21 @@ class PipelineTask(Task):
 
         Returns
         -------
-        struct : `Struct`
+        struct : `Struct` or generator
             Standard convention is that this method should return `Struct`
             instance containing all output data. Struct attribute names
             should correspond to the names of the configuration fields
             describing task output dataset types. If something different
             is returned then `saveStruct` method has to be re-implemented
             accordingly.
+
+            Tasks which produce many outputs can instead be implemented as
+            a generator yielding ``(key, dataId, object)`` tuples, where
+            ``key`` is the name of the configuration field describing output
+            dataset type and ``dataId`` is one of the DataIds for that key in
+            ``outputDataIds``. Every output is then saved by `saveStream` as
+            soon as it is produced, so that all outputs do not need to be
+            held in memory at the same time.
         """
         return self.run(**inputData)
 
@@ -483,8 +591,10 @@ class PipelineTask(Task):
 
         Returns
         -------
-        struct : `Struct`
-            See description of `adaptArgsAndRun` method.
+        struct : `Struct` or generator
+            See description of `adaptArgsAndRun` method. Generator yielding
+            outputs is only useful for tasks that know their output DataIds,
+            i.e. which override `adaptArgsAndRun`.
 
         Examples
         --------
@@ -602,7 +712,10 @@ class PipelineTask(Task):
         struct = self.adaptArgsAndRun(inputs, inputDataIds, outputDataIds, butler)
 
         # store produced ouput data
-        self.saveStruct(struct, outputDataRefs, butler)
+        if inspect.isgenerator(struct):
+            self.saveStream(struct, outputDataRefs, butler)
+        else:
+            self.saveStruct(struct, outputDataRefs, butler)
 
     def saveStruct(self, struct, outputDataRefs, butler):
         """Save data in butler.
@@ -638,6 +751,60 @@ class PipelineTask(Task):
             for dataRef, data in zip(dataRefs, dataList):
                 butler.put(data, dataRef.datasetType.name, dataRef.dataId)
 
+    def saveStream(self, outputs, outputDataRefs, butler):
+        """Save data in butler as it is produced.
+
+        This method is used instead of `saveStruct` when `adaptArgsAndRun`
+        returns a generator. Each output is saved as soon as generator
+        yields it. After generator is exhausted this method checks that
+        every output DataRef of a quantum was saved.
+
+        Parameters
+        ----------
+        outputs : iterable
+            Iterable (typically generator) of ``(key, dataId, object)``
+            tuples, where ``key`` is the name of the configuration field
+            describing output dataset type and ``dataId`` is the DataId of
+            the output.
+        outputDataRefs : `dict`
+            Dictionary whose keys are the names of the configuration fields
+            describing output dataset types and values are DataRefs or lists
+            of DataRefs.
+        butler : object
+            Data butler instance.
+
+        Raises
+        ------
+        StreamedOutputError
+            Raised if an output does not match any output DataRef, if it is
+            produced more than once, or if some outputs are not produced.
+        """
+        # map of (key, dataId key) to DataRef of all expected outputs
+        expected = {}
+        for key, dataRefs in outputDataRefs.items():
+            if not isinstance(dataRefs, list):
+                dataRefs = [dataRefs]
+            for dataRef in dataRefs:
+                expected[(key, _dataIdKey(dataRef.dataId))] = dataRef
+
+        saved = set()
+        for key, dataId, data in outputs:
+            refKey = (key, _dataIdKey(dataId))
+            dataRef = expected.get(refKey)
+            if dataRef is None:
+                raise StreamedOutputError("Unexpected output {} for DataId {}".format(key, dataId))
+            if refKey in saved:
+                raise StreamedOutputError("Output {} for DataId {} produced more than once".format(
+                    key, dataId))
+            butler.put(data, dataRef.datasetType.name, dataRef.dataId)
+            saved.add(refKey)
+            del data
+
+        missing = [(refKey[0], dataRef.dataId) for refKey, dataRef in expected.items() if refKey not in saved]
+        if missing:
+            raise StreamedOutputError("Outputs were not produced: " +
+                                      ", ".join("{} {}".format(key, dataId) for key, dataId in missing))
+
     def getResourceConfig(self):
         """Return resource configuration for this task.
 
@@ -0,0 +1,206 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining SamplingProfiler class and related methods.
+"""
+
+__all__ = ["SamplingProfiler"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import collections
+import os
+import sys
+import threading
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the stack of one thread.
+
+    A background thread wakes up every ``interval`` seconds and records the
+    current stack of the thread which started the profiler. Unlike
+    `cProfile` the profiled code is not instrumented, so overhead does not
+    depend on the number of function calls and numerical code is not
+    distorted.
+
+    Samples are kept as counts of identical stacks and can be saved in
+    collapsed stack format used by flame graph tools: one line per stack
+    with frames separated by ``;`` followed by space and sample count.
+
+    Parameters
+    ----------
+    interval : `float`, optional
+        Sampling interval in seconds.
+
+    Examples
+    --------
+    Typical use::
+
+        with SamplingProfiler() as profiler:
+            pass  # code to profile
+        profiler.writeCollapsedStacks("profile.txt")
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._labels = {}
+        self._thread = None
+        self._threadId = None
+        self._stopEvent = threading.Event()
+
+    def start(self):
+        """Start sampling the current thread.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Profiler is already running")
+        self._threadId = threading.get_ident()
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._sample, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling.
+        """
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        return False
+
+    def _label(self, code):
+        """Return frame label for a code object.
+        """
+        label = self._labels.get(code)
+        if label is None:
+            fileName = os.path.basename(code.co_filename)
+            label = self._labels[code] = "{} ({}:{})".format(code.co_name, fileName, code.co_firstlineno)
+        return label
+
+    def _sample(self):
+        """Sampling loop, runs in a separate thread.
+        """
+        while not self._stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self._threadId)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def merge(self, other):
+        """Add samples of other profiler to this one.
+
+        Parameters
+        ----------
+        other : `SamplingProfiler`
+            Profiler to merge.
+        """
+        self.samples.update(other.samples)
+
+    def toCollapsedStacks(self):
+        """Return samples in collapsed stack format.
+
+        Returns
+        -------
+        lines : `list` [`str`]
+            One line per distinct stack.
+        """
+        return ["{} {}".format(stack, count) for stack, count in sorted(self.samples.items())]
+
+    def writeCollapsedStacks(self, filename):
+        """Write samples to a file in collapsed stack format.
+
+        Parameters
+        ----------
+        filename : `str`
+            Name of the output file.
+        """
+        with open(filename, "w") as output:
+            for line in self.toCollapsedStacks():
+                print(line, file=output)
+
+    @classmethod
+    def readCollapsedStacks(cls, filename):
+        """Make profiler with samples read from a file.
+
+        Parameters
+        ----------
+        filename : `str`
+            Name of a file in collapsed stack format.
+
+        Returns
+        -------
+        profiler : `SamplingProfiler`
+            Profiler (not running) with samples from the file.
+        """
+        profiler = cls()
+        with open(filename) as input:
+            for line in input:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    profiler.samples[stack] += int(count)
+        return profiler
+
+    def formatSummary(self, limit=20):
+        """Return summary of functions which were sampled most often.
+
+        Parameters
+        ----------
+        limit : `int`, optional
+            Maximum number of functions to report.
+
+        Returns
+        -------
+        text : `str`
+            One line per function with the number and fraction of samples
+            when the function was running itself (``self``) and anywhere on
+            the stack (``total``), sorted by ``self``.
+        """
+        selfCounts = collections.Counter()
+        totalCounts = collections.Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            selfCounts[frames[-1]] += count
+            for frame in set(frames):
+                totalCounts[frame] += count
+        nSamples = max(sum(self.samples.values()), 1)
+        lines = ["{:>8} {:>6} {:>8} {:>6}  {}".format("self", "%", "total", "%", "function")]
+        for frame, count in selfCounts.most_common(limit):
+            lines.append("{:8d} {:6.1f} {:8d} {:6.1f}  {}".format(count, 100.*count/nSamples,
+                                                                  totalCounts[frame],
+                                                                  100.*totalCounts[frame]/nSamples,
+                                                                  frame))
+        return "\n".join(lines)
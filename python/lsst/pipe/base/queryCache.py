@@ -0,0 +1,204 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining QueryCache class and related methods.
+"""
+
+__all__ = ["QueryCache"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+_LOG = logging.getLogger(__name__.partition(".")[2])
+
+_SUFFIX = ".pickle"
+
+
+def _sqliteStateToken(registry):
+    """Return state token of a registry which uses SQLite database file.
+
+    Token is made of the size and modification time of the database file
+    and of its write-ahead log, `None` is returned for other registries.
+    """
+    try:
+        db = registry.config["db"]
+    except (AttributeError, KeyError, TypeError):
+        return None
+    prefix = "sqlite:///"
+    if not isinstance(db, str) or not db.startswith(prefix) or db == prefix + ":memory:":
+        return None
+    path = db[len(prefix):]
+    token = []
+    for fileName in (path, path + "-wal"):
+        try:
+            stat = os.stat(fileName)
+        except OSError:
+            continue
+        token.append("{}:{}:{}".format(fileName, stat.st_size, stat.st_mtime_ns))
+    return ";".join(token) or None
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class QueryCache:
+    """On-disk cache of registry query results.
+
+    Results of `~lsst.daf.butler.Registry.selectMultipleDatasetTypes` are
+    stored in one file per query, file name is made from a hash of all
+    query parameters (see `makeKey`). Each file also stores a registry
+    state token which was current when the query was made, cached results
+    are only used if the token has not changed since then. Results with an
+    old token are replaced when the query is repeated.
+
+    Parameters
+    ----------
+    directory : `str`
+        Directory for cache files, made if it does not exist.
+    stateToken : callable, optional
+        Function which takes registry instance and returns a string which
+        changes every time datasets are added to or removed from registry,
+        or `None` if the state cannot be determined. Default implementation
+        uses size and modification time of SQLite database file and returns
+        `None` for other databases.
+
+    Notes
+    -----
+    Nothing is cached or read from cache when state token is `None`.
+    """
+
+    def __init__(self, directory, stateToken=None):
+        self.directory = directory
+        self._stateToken = stateToken or _sqliteStateToken
+        os.makedirs(directory, exist_ok=True)
+
+    def getStateToken(self, registry):
+        """Return current registry state token.
+
+        Parameters
+        ----------
+        registry : `~lsst.daf.butler.Registry`
+            Registry instance.
+
+        Returns
+        -------
+        token : `str` or `None`
+            State token, `None` if it cannot be determined.
+        """
+        return self._stateToken(registry)
+
+    @staticmethod
+    def makeKey(**parts):
+        """Return cache key for query parameters.
+
+        Parameters
+        ----------
+        **parts
+            Query parameters, values have to be JSON-serializable or have
+            string representation which identifies them.
+
+        Returns
+        -------
+        key : `str`
+            Hash of the parameters.
+        """
+        text = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key, token):
+        """Return cached query results.
+
+        Parameters
+        ----------
+        key : `str`
+            Key returned by `makeKey`.
+        token : `str` or `None`
+            Current registry state token.
+
+        Returns
+        -------
+        rows : `list` or `None`
+            Cached rows, or `None` if there are no results in cache for this
+            key and token.
+        """
+        if token is None:
+            return None
+        try:
+            with open(self._path(key), "rb") as cacheFile:
+                cachedToken, rows = pickle.load(cacheFile)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            # damaged or incompatible file, it will be replaced
+            _LOG.debug("failed to read query cache file for key %s: %s", key, exc)
+            return None
+        if cachedToken != token:
+            _LOG.debug("query cache for key %s is out of date", key)
+            return None
+        return rows
+
+    def put(self, key, token, rows):
+        """Store query results.
+
+        Parameters
+        ----------
+        key : `str`
+            Key returned by `makeKey`.
+        token : `str` or `None`
+            Registry state token at the time of query, nothing is stored if
+            `None`.
+        rows : `list`
+            Query results, they have to be picklable.
+        """
+        if token is None:
+            return
+        # write to temporary file first so that readers never see partial
+        # files
+        fd, tmpName = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as cacheFile:
+                pickle.dump((token, rows), cacheFile, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpName, self._path(key))
+        except BaseException:
+            os.unlink(tmpName)
+            raise
+
+    def clear(self):
+        """Remove all cached results.
+        """
+        for fileName in os.listdir(self.directory):
+            if fileName.endswith(_SUFFIX):
+                os.unlink(os.path.join(self.directory, fileName))
@@ -0,0 +1,118 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining ResourceBudget class and related methods.
+"""
+
+__all__ = ["ResourceBudget"]
+
+
+class ResourceBudget:
+    """Budget of cores and memory available for running tasks on a node.
+
+    Resource requirements of tasks are taken from the ``resources`` field
+    (an instance of `~lsst.pipe.base.ResourceConfig`) of task configuration,
+    if task configuration has no such field then task needs one core and an
+    unknown amount of memory. Unknown memory requirement is treated as zero.
+
+    Parameters
+    ----------
+    numCores : `int`
+        Number of cores available.
+    memoryMB : `int`, optional
+        Memory available in megabytes, `None` means no limit.
+    """
+
+    def __init__(self, numCores, memoryMB=None):
+        self.numCores = numCores
+        self.memoryMB = memoryMB
+        self.usedCores = 0
+        self.usedMemoryMB = 0
+
+    @staticmethod
+    def getRequirements(config):
+        """Return resources needed by a task.
+
+        Parameters
+        ----------
+        config : `lsst.pex.config.Config`
+            Task configuration.
+
+        Returns
+        -------
+        numCores : `int`
+            Number of cores needed by the task, at least one.
+        memoryMB : `int`
+            Memory needed by the task in megabytes, zero if unknown.
+        """
+        resources = getattr(config, "resources", None)
+        if resources is None:
+            return 1, 0
+        return max(resources.minNumCores or 1, 1), resources.minMemoryMB or 0
+
+    def fits(self, numCores, memoryMB):
+        """Return `True` if resources are available right now.
+        """
+        if self.usedCores + numCores > self.numCores:
+            return False
+        if self.memoryMB is not None and self.usedMemoryMB + memoryMB > self.memoryMB:
+            return False
+        return True
+
+    def isIdle(self):
+        """Return `True` if nothing is using resources.
+        """
+        return self.usedCores == 0 and self.usedMemoryMB == 0
+
+    def acquire(self, numCores, memoryMB):
+        """Reserve resources for a task.
+
+        Reservation is not checked against available resources, use `fits`
+        to check it first.
+        """
+        self.usedCores += numCores
+        self.usedMemoryMB += memoryMB
+
+    def release(self, numCores, memoryMB):
+        """Return resources reserved with `acquire`.
+        """
+        self.usedCores -= numCores
+        self.usedMemoryMB -= memoryMB
+
+    def maxConcurrent(self, numCores, memoryMB):
+        """Return how many identical tasks can run at the same time.
+
+        Parameters
+        ----------
+        numCores : `int`
+            Number of cores needed by each task.
+        memoryMB : `int`
+            Memory needed by each task in megabytes.
+
+        Returns
+        -------
+        count : `int`
+            Number of tasks which fit into the budget, at least one.
+        """
+        count = self.numCores // max(numCores, 1)
+        if self.memoryMB is not None and memoryMB > 0:
+            count = min(count, self.memoryMB // memoryMB)
+        return max(count, 1)
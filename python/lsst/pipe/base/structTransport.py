@@ -0,0 +1,197 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining methods for transferring Struct instances between
+processes.
+"""
+
+__all__ = ["dumpStruct", "loadStruct", "SharedMemoryStruct"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import os
+import pickle
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    SharedMemory = None
+
+if os.name == "posix":
+    from multiprocessing import resource_tracker
+else:
+    resource_tracker = None
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+# Out-of-band buffers need pickle protocol 5
+_OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+
+def _untrack(shm):
+    """Stop resource tracker of this process from destroying a shared memory
+    segment when the process exits.
+    """
+    if resource_tracker is not None:
+        resource_tracker.unregister(shm._name, "shared_memory")
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+def dumpStruct(struct):
+    """Pickle a `Struct` with large buffers passed out-of-band.
+
+    Objects in a struct which support pickle protocol 5 (e.g. contiguous
+    NumPy arrays) do not copy their data into the pickle, their buffers are
+    returned separately instead. If protocol 5 is not available all data is
+    pickled in-band.
+
+    Parameters
+    ----------
+    struct : `Struct`
+        Struct to pickle, can be any other picklable object too.
+
+    Returns
+    -------
+    payload : `bytes`
+        Pickled struct without out-of-band data.
+    buffers : `list` of `pickle.PickleBuffer`
+        Out-of-band buffers, possibly empty.
+    """
+    buffers = []
+    if _OUT_OF_BAND:
+        payload = pickle.dumps(struct, protocol=5, buffer_callback=buffers.append)
+    else:
+        payload = pickle.dumps(struct, protocol=pickle.HIGHEST_PROTOCOL)
+    return payload, buffers
+
+
+def loadStruct(payload, buffers):
+    """Unpickle a `Struct` pickled with `dumpStruct`.
+
+    Parameters
+    ----------
+    payload : `bytes`
+        Pickled struct without out-of-band data.
+    buffers : `list`
+        Out-of-band buffers (any objects supporting buffer protocol), in the
+        same order as returned by `dumpStruct`. Objects are built on top of
+        these buffers without copying them.
+
+    Returns
+    -------
+    struct : `Struct`
+        Unpickled struct.
+    """
+    if buffers:
+        return pickle.loads(payload, buffers=buffers)
+    return pickle.loads(payload)
+
+
+class SharedMemoryStruct:
+    """Wrapper for transferring a `Struct` between processes via shared
+    memory.
+
+    Instance of this class is made in a process which produced the struct,
+    its out-of-band buffers are copied to shared memory segments and only a
+    small pickle and segment names remain in the instance. The instance is
+    then pickled and sent to another process (e.g. returned from a
+    `multiprocessing` worker) which calls `unpack` to get the struct back.
+
+    This is not a zero-copy transfer: buffers are copied once into shared
+    memory and once out of it, but they are not serialized and sent through
+    a pipe.
+
+    Notes
+    -----
+    Segments are owned by the receiving process: the process which made
+    them may exit before `unpack` is called, and segments are only destroyed
+    by `unpack`. An instance which is never unpacked leaks its segments.
+
+    Parameters
+    ----------
+    struct : `Struct`
+        Struct to transfer.
+    """
+
+    def __init__(self, struct):
+        payload, buffers = dumpStruct(struct)
+        self._payload = payload
+        self._segments = []
+        try:
+            for buffer in buffers:
+                view = buffer.raw()
+                shm = SharedMemory(create=True, size=max(view.nbytes, 1))
+                # segment has to survive this process, e.g. a pool worker
+                # which exits right after returning the result
+                _untrack(shm)
+                self._segments.append((shm.name, view.nbytes))
+                shm.buf[:view.nbytes] = view
+                shm.close()
+        except Exception:
+            self._unlink()
+            raise
+
+    @staticmethod
+    def isSupported():
+        """Return `True` if shared memory transport is available.
+        """
+        return _OUT_OF_BAND and SharedMemory is not None
+
+    def unpack(self):
+        """Return struct, releasing shared memory segments.
+
+        This method can only be called once, shared memory segments are
+        destroyed after their data is copied into memory of this process.
+
+        Returns
+        -------
+        struct : `Struct`
+            Transferred struct.
+        """
+        buffers = []
+        try:
+            for name, size in self._segments:
+                shm = SharedMemory(name=name)
+                try:
+                    buffers.append(bytearray(shm.buf[:size]))
+                finally:
+                    shm.close()
+        finally:
+            self._unlink()
+        return loadStruct(self._payload, buffers)
+
+    def _unlink(self):
+        """Destroy all shared memory segments.
+        """
+        for name, _ in self._segments:
+            try:
+                shm = SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            shm.close()
+            shm.unlink()
+        self._segments = []
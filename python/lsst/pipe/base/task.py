@@ -27,7 +27,11 @@ import lsstDebug
 from lsst.pex.config import ConfigurableField
 from lsst.log import Log
 import lsst.daf.base as dafBase
-from .timer import logInfo
+from .timer import logInfo, TimingBuffer
+from .timingTree import TimingTree
+from .memoryTracker import MemoryTracker
+from .metrics import TaskMetrics
+from .threadSafeMetadata import ThreadSafeMetadata
 
 
 class TaskError(Exception):
@@ -89,7 +93,11 @@ class Task:
     - ``config``: task-specific configuration; an instance of ``ConfigClass`` (see below).
     - ``metadata``: an `lsst.daf.base.PropertyList` for collecting task-specific metadata,
         e.g. data quality and performance metrics. This is data that is only meant to be
-        persisted, never to be used by the task.
+        persisted, never to be used by the task. If the task uses threads, see
+        `enableThreadSafeMetadata`.
+    - ``metrics``: a `TaskMetrics` for collecting counters, gauges and histograms, e.g. number of
+        detected sources or iterations. Metrics are updated in place, which is cheaper than adding
+        items to ``metadata`` in a loop, and are saved to metadata by `getFullMetadata`.
 
     Subclasses typically have a method named ``runDataRef`` to perform the main data processing. Details:
 
@@ -119,16 +127,26 @@ class Task:
 
     def __init__(self, config=None, name=None, parentTask=None, log=None):
         self.metadata = dafBase.PropertyList()
+        self.metrics = TaskMetrics()
         self._parentTask = parentTask
+        self._timingBuffer = None
+        self._threadSafeMetadata = False
 
         if parentTask is not None:
             if name is None:
                 raise RuntimeError("name is required for a subtask")
+            if parentTask._timingBuffer is not None:
+                self._timingBuffer = TimingBuffer()
+            if parentTask._threadSafeMetadata:
+                self._threadSafeMetadata = True
+                self.metadata = ThreadSafeMetadata(self.metadata)
             self._name = name
             self._fullName = parentTask._computeFullName(name)
             if config is None:
                 config = getattr(parentTask.config, name)
             self._taskDict = parentTask._taskDict
+            self._timingTree = parentTask._timingTree
+            self._memoryTracker = parentTask._memoryTracker
             loggerName = parentTask.log.getName() + '.' + name
         else:
             if name is None:
@@ -141,6 +159,8 @@ class Task:
             if config is None:
                 config = self.ConfigClass()
             self._taskDict = dict()
+            self._timingTree = None
+            self._memoryTracker = None
             loggerName = self._fullName
             if log is not None and log.getName():
                 loggerName = log.getName() + '.' + loggerName
@@ -154,7 +174,159 @@ class Task:
         """Empty (clear) the metadata for this Task and all sub-Tasks.
         """
         for subtask in self._taskDict.values():
-            subtask.metadata = dafBase.PropertyList()
+            subtask.metadata = subtask._makeMetadata()
+            subtask.metrics = TaskMetrics()
+            if subtask._timingBuffer is not None:
+                subtask._timingBuffer.clear()
+
+    def clone(self):
+        """Make a copy of this Task and all sub-Tasks with fresh state.
+
+        Returns
+        -------
+        task : `Task`
+            A new instance of the same class as this task. It shares configuration, log, schemas and all
+            other attributes with this task, but has new metadata (a copy of the metadata of this task
+            and its subtasks), a new timing tree (if enabled) and new subtasks which are clones of the
+            subtasks of this task.
+
+        Raises
+        ------
+        RuntimeError
+            Raised if this task is not a top-level task.
+
+        Notes
+        -----
+        Cloning is much cheaper than constructing a task hierarchy, it makes new instances without calling
+        their constructors. Tasks which modify their attributes (other than metadata) while running should
+        not be cloned, their clones would share those attributes.
+
+        Attributes of each task which refer to tasks of the same hierarchy (subtasks, parent task) are
+        redirected to the corresponding clones.
+        """
+        if self._parentTask is not None:
+            raise RuntimeError("Only a top-level task can be cloned, %s is a subtask" % self._fullName)
+        taskDict = dict()
+        timingTree = TimingTree() if self._timingTree is not None else None
+        clones = {}
+        for fullName, task in self._taskDict.items():
+            clone = object.__new__(type(task))
+            clone.__dict__.update(task.__dict__)
+            clone.metadata = task._makeMetadata(task.metadata.deepCopy())
+            clone.metrics = TaskMetrics()
+            clone.metrics.merge(task.metrics)
+            clone._taskDict = taskDict
+            clone._timingTree = timingTree
+            if task._timingBuffer is not None:
+                clone._timingBuffer = TimingBuffer()
+            taskDict[fullName] = clone
+            clones[id(task)] = clone
+        for clone in taskDict.values():
+            for name, value in clone.__dict__.items():
+                if isinstance(value, Task) and id(value) in clones:
+                    clone.__dict__[name] = clones[id(value)]
+        return taskDict[self._fullName]
+
+    def enableFastTiming(self, enable=True):
+        """Enable or disable fast timing mode for this Task and all sub-Tasks.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            If `True` then timing samples are saved in a buffer and only ``Utc`` and ``CpuTime`` are
+            measured, otherwise full resource usage is measured and saved immediately (the default).
+
+        Notes
+        -----
+        In fast timing mode `timer.timeMethod` and `timer` avoid system calls and formatting, samples are
+        added to metadata and log when `getFullMetadata` is called. Subtasks made after this call use the
+        same mode as their parent. Disabling fast timing mode flushes buffered samples.
+        """
+        for subtask in self._taskDict.values():
+            if enable:
+                if subtask._timingBuffer is None:
+                    subtask._timingBuffer = TimingBuffer()
+            elif subtask._timingBuffer is not None:
+                subtask._timingBuffer.flush(subtask)
+                subtask._timingBuffer = None
+
+    def enableTimingTree(self, enable=True):
+        """Enable or disable timing tree for this Task and all sub-Tasks.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            If `True` then calls of methods decorated with ``@timer.timeMethod`` and blocks timed with
+            `timer` are added to a `TimingTree` (see `getTimingTree`), otherwise they are only logged to
+            metadata (the default).
+
+        Notes
+        -----
+        Enabling keeps the existing tree, if any. Subtasks made after this call use the same mode as
+        their parent.
+        """
+        timingTree = None
+        if enable:
+            timingTree = self._timingTree if self._timingTree is not None else TimingTree()
+        for subtask in self._taskDict.values():
+            subtask._timingTree = timingTree
+
+    def enableThreadSafeMetadata(self, enable=True):
+        """Enable or disable thread-safe metadata for this Task and all sub-Tasks.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            If `True` then ``metadata`` of each task is wrapped in `ThreadSafeMetadata`, otherwise it is a
+            plain `lsst.daf.base.PropertyList` (the default).
+
+        Notes
+        -----
+        Tasks which call timed methods or update metadata from multiple threads (e.g. processing
+        amplifiers in a thread pool) must enable this before starting the threads. Updates made by threads
+        other than the one which called this method are buffered per thread and applied to metadata when it
+        is read, e.g. by `getFullMetadata`. Timing tree, fast timing buffers and memory tracking are safe
+        to use from multiple threads in either mode; task metrics are not. Subtasks made after this call
+        use the same mode as their parent.
+        """
+        for subtask in self._taskDict.values():
+            subtask._threadSafeMetadata = enable
+            if enable:
+                if not isinstance(subtask.metadata, ThreadSafeMetadata):
+                    subtask.metadata = ThreadSafeMetadata(subtask.metadata)
+            elif isinstance(subtask.metadata, ThreadSafeMetadata):
+                subtask.metadata = subtask.metadata.getPropertyList()
+
+    def enableMemoryTracking(self, enable=True, trackRss=False):
+        """Enable or disable memory tracking for this Task and all sub-Tasks.
+
+        Parameters
+        ----------
+        enable : `bool`, optional
+            If `True` then memory allocated by methods decorated with ``@timer.timeMethod`` and blocks timed
+            with `timer` is measured with `tracemalloc`.
+        trackRss : `bool`, optional
+            If `True` then also record resident set size at the start and end of each method.
+
+        Notes
+        -----
+        For each timed method peak and net allocated memory (in bytes) are saved in metadata as
+        ``<method>PeakAllocated`` and ``<method>NetAllocated`` (and ``<method>StartRss`` and
+        ``<method>EndRss`` with ``trackRss``), and are also added to the nodes of the timing tree, if it is
+        enabled (see `enableTimingTree`). Peaks are relative to memory allocated when the method starts.
+
+        Tracing memory allocations has a large overhead, so it is disabled by default. Subtasks made after
+        this call use the same mode as their parent.
+        """
+        tracker = self._memoryTracker
+        if tracker is not None:
+            tracker.stop()
+        tracker = None
+        if enable:
+            tracker = MemoryTracker(trackRss=trackRss)
+            tracker.start()
+        for subtask in self._taskDict.values():
+            subtask._memoryTracker = tracker
 
     def getSchemaCatalogs(self):
         """Get the schemas generated by this task.
@@ -219,8 +391,11 @@ class Task:
         Notes
         -----
         The returned metadata includes timing information (if ``@timer.timeMethod`` is used)
-        and any metadata set by the task. The name of each item consists of the full task name
-        with ``.`` replaced by ``:``, followed by ``.`` and the name of the item, e.g.::
+        and any metadata set by the task, timing samples buffered in fast timing mode (see
+        `enableFastTiming`) and updates buffered by other threads (see `enableThreadSafeMetadata`) are
+        flushed to metadata first and task metrics (see `metrics`) are saved to metadata. The name of
+        each item consists of the full task name with ``.`` replaced by ``:``, followed by ``.`` and the
+        name of the item, e.g.::
 
             topLevelTaskName:subtaskName:subsubtaskName.itemName
 
@@ -229,9 +404,26 @@ class Task:
         """
         fullMetadata = dafBase.PropertySet()
         for fullName, task in self.getTaskDict().items():
-            fullMetadata.set(fullName.replace(".", ":"), task.metadata)
+            if task._timingBuffer is not None:
+                task._timingBuffer.flush(task)
+            metadata = task.metadata
+            if isinstance(metadata, ThreadSafeMetadata):
+                metadata = metadata.getPropertyList()
+            task.metrics.saveToMetadata(metadata)
+            fullMetadata.set(fullName.replace(".", ":"), metadata)
         return fullMetadata
 
+    def getFullMetrics(self):
+        """Get metrics for all tasks.
+
+        Returns
+        -------
+        metrics : `dict` [`str`, `TaskMetrics`]
+            Metrics of the top-level task and all subtasks, sub-subtasks, etc., indexed by full task name.
+            Tasks without metrics are not included.
+        """
+        return {fullName: task.metrics for fullName, task in self.getTaskDict().items() if len(task.metrics)}
+
     def getFullName(self):
         """Get the task name as a hierarchical name including parent task names.
 
@@ -272,6 +464,18 @@ class Task:
         """
         return self._taskDict.copy()
 
+    def getTimingTree(self):
+        """Get timing tree of this task and all subtasks.
+
+        Returns
+        -------
+        timingTree : `TimingTree` or `None`
+            Call tree of methods decorated with ``@timer.timeMethod`` and blocks timed with `timer`, shared
+            by all tasks in the hierarchy. Nodes are named by the full task name followed by ``.`` and the
+            method or block name. `None` unless enabled with `enableTimingTree`.
+        """
+        return self._timingTree
+
     def makeSubtask(self, name, **keyArgs):
         """Create a subtask as a new instance as the ``name`` attribute of this task.
 
@@ -319,11 +523,22 @@ class Task:
         --------
         timer.logInfo
         """
+        memoryTracker = self._memoryTracker
+        timingTree = self._timingTree
+        if timingTree is not None:
+            timingTree.enter(self._computeFullName(name))
+        if memoryTracker is not None:
+            memoryTracker.enter()
         logInfo(obj=self, prefix=name + "Start", logLevel=logLevel)
         try:
             yield
         finally:
             logInfo(obj=self, prefix=name + "End", logLevel=logLevel)
+            memory = None
+            if memoryTracker is not None:
+                memory = memoryTracker.exit(self, name)
+            if timingTree is not None:
+                timingTree.exit(memory)
 
     @classmethod
     def makeField(cls, doc):
@@ -350,6 +565,25 @@ class Task:
         """
         return ConfigurableField(doc=doc, target=cls)
 
+    def _makeMetadata(self, metadata=None):
+        """Make metadata for this task.
+
+        Parameters
+        ----------
+        metadata : `lsst.daf.base.PropertyList`, optional
+            Initial contents, empty if `None`.
+
+        Returns
+        -------
+        metadata : `lsst.daf.base.PropertyList` or `ThreadSafeMetadata`
+            Metadata, wrapped if thread-safe metadata is enabled.
+        """
+        if metadata is None:
+            metadata = dafBase.PropertyList()
+        if self._threadSafeMetadata:
+            metadata = ThreadSafeMetadata(metadata)
+        return metadata
+
     def _computeFullName(self, name):
         """Compute the full name of a subtask or metadata item, given its brief name.
 
@@ -25,6 +25,23 @@
 __all__ = ["TaskFactory"]
 
 from abc import ABCMeta, abstractmethod
+import concurrent.futures
+import threading
+import time
+
+# Protects initialization of per-factory loading state, factories do not
+# have to call base class constructor
+_stateLock = threading.Lock()
+
+
+class _TaskClassLoader:
+    """State of task class loading of one factory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.importTimes = {}
 
 
 class TaskFactory(metaclass=ABCMeta):
@@ -32,8 +49,152 @@ class TaskFactory(metaclass=ABCMeta):
 
     Task factory is responsible for importing PipelineTask subclasses by
     name and creating instances of these classes.
+
+    Notes
+    -----
+    Subclasses implement `loadTaskClass`, which imports a single class.
+    `loadTaskClasses` and `startLoadingTaskClasses` use it to import many
+    classes concurrently and cache the results, so that each class is
+    imported only once per factory.
     """
 
+    maxImportThreads = 8
+    """Maximum number of threads importing task classes concurrently
+    (`int`)."""
+
+    def _getLoader(self):
+        """Return task class loading state of this factory.
+        """
+        loader = self.__dict__.get("_taskClassLoader")
+        if loader is None:
+            with _stateLock:
+                loader = self.__dict__.setdefault("_taskClassLoader", _TaskClassLoader())
+        return loader
+
+    def __getstate__(self):
+        # loading state contains locks and futures which cannot be pickled,
+        # unpickled factory starts with empty state and re-imports classes
+        state = self.__dict__.copy()
+        state.pop("_taskClassLoader", None)
+        return state
+
+    def _loadTimed(self, taskName):
+        """Call `loadTaskClass` and record its time.
+        """
+        start = time.perf_counter()
+        result = self.loadTaskClass(taskName)
+        loader = self._getLoader()
+        with loader.lock:
+            loader.importTimes[taskName] = time.perf_counter() - start
+        return result
+
+    def _submitLoads(self, taskNames):
+        """Start loading task classes which are not loaded or being loaded.
+
+        Returns
+        -------
+        futures : `dict` [`str`, `concurrent.futures.Future`]
+            Futures for all ``taskNames``.
+        """
+        loader = self._getLoader()
+        futures = {}
+        executor = None
+        with loader.lock:
+            for taskName in taskNames:
+                future = loader.futures.get(taskName)
+                if future is None:
+                    if executor is None:
+                        executor = concurrent.futures.ThreadPoolExecutor(
+                            max_workers=max(min(self.maxImportThreads, len(taskNames)), 1),
+                            thread_name_prefix="TaskFactory")
+                    future = loader.futures[taskName] = executor.submit(self._loadTimed, taskName)
+                futures[taskName] = future
+        if executor is not None:
+            # threads exit when submitted loads are done
+            executor.shutdown(wait=False)
+        return futures
+
+    def startLoadingTaskClasses(self, taskNames):
+        """Start importing task classes in background threads.
+
+        Parameters
+        ----------
+        taskNames : iterable of `str`
+            Names of the PipelineTask classes, as for `loadTaskClass`.
+
+        Notes
+        -----
+        This returns immediately, use `loadTaskClasses` to get the classes.
+        Errors are not reported here, they are raised by `loadTaskClasses`.
+        """
+        self._submitLoads(list(taskNames))
+
+    def loadTaskClasses(self, taskNames):
+        """Locate and import multiple PipelineTask classes.
+
+        Classes which are not loaded yet are imported concurrently by
+        `loadTaskClass` in multiple threads. Results are cached, so loading
+        a class which was already loaded (or started loading with
+        `startLoadingTaskClasses`) by this factory is cheap.
+
+        Parameters
+        ----------
+        taskNames : iterable of `str`
+            Names of the PipelineTask classes, as for `loadTaskClass`.
+
+        Returns
+        -------
+        taskClasses : `dict` [`str`, `tuple`]
+            Result of `loadTaskClass` (task class and its full name) for each
+            name in ``taskNames``.
+
+        Raises
+        ------
+        ImportError
+            Raised if task class cannot be imported.
+        TypeError
+            Raised if imported class is not a PipelineTask.
+
+        Notes
+        -----
+        If any class cannot be loaded, the exception of the first such name
+        is raised after all imports have finished; failed names are not
+        cached and are imported again by the next call.
+        """
+        taskNames = list(taskNames)
+        futures = self._submitLoads(taskNames)
+        concurrent.futures.wait(futures.values())
+        loader = self._getLoader()
+        result = {}
+        error = None
+        for taskName in taskNames:
+            future = futures[taskName]
+            if future.exception() is not None:
+                with loader.lock:
+                    if loader.futures.get(taskName) is future:
+                        del loader.futures[taskName]
+                if error is None:
+                    error = future.exception()
+            else:
+                result[taskName] = future.result()
+        if error is not None:
+            raise error
+        return result
+
+    def getImportTimes(self):
+        """Return time spent importing each task class.
+
+        Returns
+        -------
+        importTimes : `dict` [`str`, `float`]
+            Wall clock time (seconds) of `loadTaskClass` for each loaded task
+            name. When classes are imported concurrently, the time includes
+            waiting for modules imported by other threads.
+        """
+        loader = self._getLoader()
+        with loader.lock:
+            return dict(loader.importTimes)
+
     @abstractmethod
     def loadTaskClass(self, taskName):
         """Locate and import PipelineTask class.
@@ -0,0 +1,148 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining ThreadSafeMetadata class and related methods.
+"""
+
+__all__ = ["ThreadSafeMetadata"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import functools
+import numbers
+import threading
+
+# -----------------------------
+#  Imports for other modules --
+# -----------------------------
+import lsst.daf.base as dafBase
+
+# ----------------------------------
+#  Local non-exported definitions --
+# ----------------------------------
+
+# PropertyList methods which modify it
+_UPDATE_METHODS = frozenset(["add", "set", "addLongLong", "setLongLong", "remove", "combine"])
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class ThreadSafeMetadata:
+    """Wrapper for `lsst.daf.base.PropertyList` which can be updated from
+    multiple threads.
+
+    The thread which made the instance (owner thread) updates the property
+    list directly. Updates made by other threads are saved in per-thread
+    buffers without locking and are applied to the property list, in order
+    for each thread, before any read access. All other methods and
+    attributes of the property list are forwarded to it.
+
+    Parameters
+    ----------
+    metadata : `lsst.daf.base.PropertyList`, optional
+        Property list to wrap, a new one is made if `None`.
+
+    Notes
+    -----
+    Updates from different non-owner threads are not ordered relative to
+    each other or to updates from the owner thread, but they are ordered for
+    each thread, which is enough for e.g. ``Start`` and ``End`` items of
+    `timer.timeMethod`. Errors from updates made by non-owner threads are
+    raised when they are applied, with the exception of type checks done by
+    ``addLongLong`` and ``setLongLong`` which are done immediately.
+
+    Buffers of threads which have finished are dropped when their updates
+    are applied, so that short-lived threads do not accumulate.
+    """
+
+    def __init__(self, metadata=None):
+        self._metadata = metadata if metadata is not None else dafBase.PropertyList()
+        self._ownerId = threading.get_ident()
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # buffers of non-owner threads indexed by thread
+        self._buffers = {}
+
+    def _getBuffer(self):
+        """Return update buffer of the current thread.
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = []
+            with self._lock:
+                self._buffers[threading.current_thread()] = buffer
+        return buffer
+
+    def _update(self, method, *args, **kwargs):
+        """Update property list directly or via buffer.
+        """
+        if threading.get_ident() == self._ownerId:
+            with self._lock:
+                return getattr(self._metadata, method)(*args, **kwargs)
+        if method in ("addLongLong", "setLongLong"):
+            value = args[1] if len(args) > 1 else kwargs.get("value")
+            if not isinstance(value, numbers.Integral) or isinstance(value, bool):
+                raise TypeError("{} needs an integer value, got {!r}".format(method, value))
+        self._getBuffer().append((method, args, kwargs))
+
+    def merge(self):
+        """Apply all buffered updates to the property list.
+        """
+        with self._lock:
+            for thread, buffer in list(self._buffers.items()):
+                # check before applying, a finished thread cannot add more
+                finished = not thread.is_alive()
+                count = len(buffer)
+                updates = buffer[:count]
+                # other threads may append to buffer meanwhile, only remove
+                # what is applied
+                del buffer[:count]
+                if finished:
+                    del self._buffers[thread]
+                for method, args, kwargs in updates:
+                    getattr(self._metadata, method)(*args, **kwargs)
+
+    def getPropertyList(self):
+        """Return wrapped property list with all updates applied.
+
+        Returns
+        -------
+        metadata : `lsst.daf.base.PropertyList`
+            Wrapped property list, it should not be updated directly while
+            other threads may update this instance.
+        """
+        self.merge()
+        return self._metadata
+
+    def __getattr__(self, name):
+        if name in _UPDATE_METHODS:
+            return functools.partial(self._update, name)
+        self.merge()
+        return getattr(self._metadata, name)
+
+    def __contains__(self, name):
+        return self.getPropertyList().exists(name)
+
+    def __reduce__(self):
+        return self.__class__, (self.getPropertyList(),)
@@ -21,10 +21,12 @@
 #
 """Utilities for measuring execution time.
 """
-__all__ = ["logInfo", "timeMethod"]
+__all__ = ["logInfo", "timeMethod", "TimingBuffer"]
 
+import array
 import functools
 import resource
+import threading
 import time
 import datetime
 
@@ -87,7 +89,15 @@ def logInfo(obj, prefix, logLevel=Log.DEBUG):
     - ``MaxRss``: maximum resident set size.
 
     All logged resource information is only for the current process; child processes are excluded.
+
+    If ``obj`` has a `TimingBuffer` in its ``_timingBuffer`` attribute (see `Task.enableFastTiming`) then
+    only ``Utc`` and ``CpuTime`` are measured and they are saved in that buffer, metadata and log are only
+    updated when the buffer is flushed.
     """
+    timingBuffer = getattr(obj, "_timingBuffer", None)
+    if timingBuffer is not None:
+        timingBuffer.record(prefix, time.process_time(), time.time(), logLevel)
+        return
     cpuTime = time.process_time()
     utcStr = datetime.datetime.utcnow().isoformat()
     res = resource.getrusage(resource.RUSAGE_SELF)
@@ -109,6 +119,100 @@ def logInfo(obj, prefix, logLevel=Log.DEBUG):
              )
 
 
+class TimingBuffer:
+    """Buffer for raw timing samples recorded by `logInfo`.
+
+    Samples are stored in preallocated arrays, formatting them into metadata
+    and log messages is delayed until `flush` is called. This makes timing
+    cheap enough to be used on methods which are called many times.
+
+    Parameters
+    ----------
+    capacity : `int`, optional
+        Initial number of samples, buffer grows when it is full.
+
+    Notes
+    -----
+    Samples can be recorded from multiple threads.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._size = 0
+        self._names = [None]*capacity
+        self._cpuTimes = array.array("d", bytes(8*capacity))
+        self._wallTimes = array.array("d", bytes(8*capacity))
+        self._logLevels = array.array("i", bytes(4*capacity))
+
+    def __len__(self):
+        return self._size
+
+    def record(self, prefix, cpuTime, wallTime, logLevel=Log.DEBUG):
+        """Save one sample.
+
+        Parameters
+        ----------
+        prefix : `str`
+            Name prefix, same as for `logInfo`.
+        cpuTime : `float`
+            CPU time in seconds, as returned by `time.process_time`.
+        wallTime : `float`
+            Wall clock time in seconds since epoch, as returned by `time.time`.
+        logLevel : optional
+            Log level (an `lsst.log` level constant, such as `lsst.log.Log.DEBUG`).
+        """
+        with self._lock:
+            index = self._size
+            if index == len(self._names):
+                self._grow()
+            self._names[index] = prefix
+            self._cpuTimes[index] = cpuTime
+            self._wallTimes[index] = wallTime
+            self._logLevels[index] = logLevel
+            self._size = index + 1
+
+    def flush(self, obj):
+        """Save all buffered samples to ``obj.metadata`` and ``obj.log`` and
+        empty the buffer.
+
+        Parameters
+        ----------
+        obj : `lsst.pipe.base.Task`-type
+            A `~lsst.pipe.base.Task` or any other object with ``metadata`` and ``log``
+            attributes, see `logInfo`.
+        """
+        logName = obj.log.getName()
+        with self._lock:
+            for index in range(self._size):
+                prefix = self._names[index]
+                cpuTime = self._cpuTimes[index]
+                utcStr = datetime.datetime.utcfromtimestamp(self._wallTimes[index]).isoformat()
+                obj.metadata.add(name=prefix + "Utc", value=utcStr)
+                obj.metadata.add(name=prefix + "CpuTime", value=cpuTime)
+                logLevel = self._logLevels[index]
+                if obj.log.isEnabledFor(logLevel):
+                    log(logName, logLevel, "%sCpuTime=%s" % (prefix, cpuTime))
+                self._names[index] = None
+            self._size = 0
+
+    def clear(self):
+        """Discard all buffered samples.
+        """
+        with self._lock:
+            for index in range(self._size):
+                self._names[index] = None
+            self._size = 0
+
+    def _grow(self):
+        """Double the capacity of the buffer.
+        """
+        capacity = max(len(self._names), 1)
+        self._names.extend([None]*capacity)
+        self._cpuTimes.frombytes(bytes(8*capacity))
+        self._wallTimes.frombytes(bytes(8*capacity))
+        self._logLevels.frombytes(bytes(4*capacity))
+
+
 def timeMethod(func):
     """Decorator to measure duration of a task method.
 
@@ -130,6 +234,13 @@ def timeMethod(func):
          ``add(name, value)`` method).
        - ``log``: an instance of `lsst.log.Log`.
 
+    See `logInfo` for the measured quantities; use `Task.enableFastTiming` to
+    make timing cheaper for methods which are called many times. If the timing
+    tree is enabled (see `Task.enableTimingTree`) then calls of task methods
+    are also added to the task's `~lsst.pipe.base.TimingTree`. If memory
+    tracking is enabled (see `Task.enableMemoryTracking`) then peak and net
+    allocated memory are measured too.
+
     Examples
     --------
     To use::
@@ -145,10 +256,21 @@ def timeMethod(func):
 
     @functools.wraps(func)
     def wrapper(self, *args, **keyArgs):
+        timingTree = getattr(self, "_timingTree", None)
+        memoryTracker = getattr(self, "_memoryTracker", None)
+        if timingTree is not None:
+            timingTree.enter(self._fullName + "." + func.__name__)
+        if memoryTracker is not None:
+            memoryTracker.enter()
         logInfo(obj=self, prefix=func.__name__ + "Start")
         try:
             res = func(self, *args, **keyArgs)
         finally:
             logInfo(obj=self, prefix=func.__name__ + "End")
+            memory = None
+            if memoryTracker is not None:
+                memory = memoryTracker.exit(self, func.__name__)
+            if timingTree is not None:
+                timingTree.exit(memory)
         return res
     return wrapper
@@ -0,0 +1,309 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Module defining TimingTree class and related methods.
+"""
+
+__all__ = ["TimingNode", "TimingTree"]
+
+# -------------------------------
+#  Imports of standard modules --
+# -------------------------------
+import contextlib
+import threading
+import time
+
+# ------------------------
+#  Exported definitions --
+# ------------------------
+
+
+class TimingNode:
+    """Node of a `TimingTree`, accumulated timing of one method or code
+    block in one call context.
+
+    Parameters
+    ----------
+    name : `str`
+        Name of the node, for task methods this is the full task name
+        followed by ``.`` and method name.
+
+    Attributes
+    ----------
+    name : `str`
+        Name of the node.
+    calls : `int`
+        Number of completed calls.
+    wallTime : `float`
+        Inclusive wall clock time (seconds) of all calls.
+    cpuTime : `float`
+        Inclusive CPU time (seconds) of all calls.
+    peakAllocated : `int`
+        Maximum over all calls of the peak memory allocated during a call,
+        in bytes, only if memory tracking is enabled (see
+        `Task.enableMemoryTracking`).
+    netAllocated : `int`
+        Memory allocated and not released by all calls, in bytes, only if
+        memory tracking is enabled.
+    children : `dict` [`str`, `TimingNode`]
+        Nodes of methods called from this one, indexed by name.
+    """
+
+    __slots__ = ("name", "calls", "wallTime", "cpuTime", "peakAllocated", "netAllocated", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wallTime = 0.
+        self.cpuTime = 0.
+        self.peakAllocated = 0
+        self.netAllocated = 0
+        self.children = {}
+
+    def getChild(self, name):
+        """Return child node with a given name, making it if needed.
+        """
+        node = self.children.get(name)
+        if node is None:
+            node = self.children[name] = TimingNode(name)
+        return node
+
+    @property
+    def exclusiveWallTime(self):
+        """Wall clock time (seconds) not spent in child nodes (`float`).
+        """
+        return self.wallTime - sum(child.wallTime for child in self.children.values())
+
+    @property
+    def exclusiveCpuTime(self):
+        """CPU time (seconds) not spent in child nodes (`float`).
+        """
+        return self.cpuTime - sum(child.cpuTime for child in self.children.values())
+
+    def merge(self, other):
+        """Add timing of other node and its children to this node.
+
+        Parameters
+        ----------
+        other : `TimingNode`
+            Node to merge, usually with the same name.
+        """
+        self.calls += other.calls
+        self.wallTime += other.wallTime
+        self.cpuTime += other.cpuTime
+        self.peakAllocated = max(self.peakAllocated, other.peakAllocated)
+        self.netAllocated += other.netAllocated
+        for name, child in other.children.items():
+            self.getChild(name).merge(child)
+
+    def __getstate__(self):
+        return (self.name, self.calls, self.wallTime, self.cpuTime, self.peakAllocated, self.netAllocated,
+                self.children)
+
+    def __setstate__(self, state):
+        (self.name, self.calls, self.wallTime, self.cpuTime, self.peakAllocated, self.netAllocated,
+         self.children) = state
+
+
+class TimingTree:
+    """Call tree of timed task methods.
+
+    Methods decorated with `timer.timeMethod` and code blocks timed with
+    `Task.timer` are added to the tree of their top-level task, each node
+    collects call count, inclusive and exclusive wall clock and CPU time
+    for one call path. Trees from different runs can be merged to get
+    aggregated timing.
+
+    Notes
+    -----
+    Calls which have not finished yet are not pickled, so a tree can be
+    returned from a worker process at any time.
+
+    The tree can be updated from multiple threads. Each thread has its own
+    stack of calls in progress; calls made by a thread other than the one
+    which made the tree, with no calls of its own in progress, are added as
+    children of the innermost call in progress in the thread which made the
+    tree (usually the method which started the threads). CPU time is
+    measured for the whole process, so with concurrent threads CPU times of
+    the nodes include time used by other threads.
+    """
+
+    def __init__(self):
+        self.root = TimingNode("")
+        self._initThreading()
+
+    def _initThreading(self):
+        """Initialize per-thread state.
+        """
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ownerStack = self._local.stack = []
+
+    @property
+    def _stack(self):
+        """Calls in progress in the current thread (`list`).
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name):
+        """Start timing a call.
+
+        Parameters
+        ----------
+        name : `str`
+            Name of the method or code block.
+        """
+        stack = self._stack
+        if stack:
+            parent = stack[-1][0]
+        elif self._ownerStack:
+            parent = self._ownerStack[-1][0]
+        else:
+            parent = self.root
+        with self._lock:
+            node = parent.getChild(name)
+        stack.append((node, time.perf_counter(), time.process_time()))
+
+    def exit(self, memory=None):
+        """Finish timing the call started by the last `enter`.
+
+        Parameters
+        ----------
+        memory : `tuple` [`int`, `int`], optional
+            Peak and net memory allocated by the call, as returned by
+            `MemoryTracker.exit`.
+        """
+        node, wallStart, cpuStart = self._stack.pop()
+        wallTime = time.perf_counter() - wallStart
+        cpuTime = time.process_time() - cpuStart
+        with self._lock:
+            node.calls += 1
+            node.wallTime += wallTime
+            node.cpuTime += cpuTime
+            if memory is not None:
+                peakAllocated, netAllocated = memory
+                node.peakAllocated = max(node.peakAllocated, peakAllocated)
+                node.netAllocated += netAllocated
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """Context manager timing a block of code.
+
+        Parameters
+        ----------
+        name : `str`
+            Name of the code block.
+        """
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def merge(self, other):
+        """Add timing of other tree to this one.
+
+        Parameters
+        ----------
+        other : `TimingTree`
+            Tree to merge.
+        """
+        with self._lock:
+            self.root.merge(other.root)
+
+    def walk(self):
+        """Iterate over all nodes depth-first.
+
+        Yields
+        ------
+        path : `tuple` [`str`]
+            Names of all nodes from the top-level one to this node.
+        node : `TimingNode`
+            The node.
+        """
+        stack = [((child.name,), child) for child in reversed(list(self.root.children.values()))]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            stack += [(path + (child.name,), child) for child in reversed(list(node.children.values()))]
+
+    def toCollapsedStacks(self, useCpuTime=False):
+        """Return timing in collapsed stack format used by flame graph
+        tools.
+
+        Parameters
+        ----------
+        useCpuTime : `bool`, optional
+            If `True` use CPU time, otherwise wall clock time.
+
+        Returns
+        -------
+        lines : `list` [`str`]
+            One line per node, node names separated by ``;`` followed by
+            space and exclusive time in microseconds.
+        """
+        lines = []
+        for path, node in self.walk():
+            seconds = node.exclusiveCpuTime if useCpuTime else node.exclusiveWallTime
+            lines.append("{} {}".format(";".join(path), max(int(round(seconds * 1e6)), 0)))
+        return lines
+
+    def writeCollapsedStacks(self, filename, useCpuTime=False):
+        """Write timing in collapsed stack format to a file.
+
+        Parameters
+        ----------
+        filename : `str`
+            Name of the output file.
+        useCpuTime : `bool`, optional
+            If `True` use CPU time, otherwise wall clock time.
+        """
+        with open(filename, "w") as output:
+            for line in self.toCollapsedStacks(useCpuTime):
+                print(line, file=output)
+
+    def format(self):
+        """Return human-readable representation of the tree.
+
+        Returns
+        -------
+        text : `str`
+            One line per node with call count, inclusive and exclusive
+            wall clock and CPU times, peak and net allocated memory (in
+            megabytes), indented by depth.
+        """
+        header = ("calls", "wall", "wallExcl", "cpu", "cpuExcl", "peakMB", "netMB", "name")
+        lines = ["{:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}  {}".format(*header)]
+        for path, node in self.walk():
+            lines.append("{:8d} {:10.3f} {:10.3f} {:10.3f} {:10.3f} {:10.1f} {:10.1f}  {}{}".format(
+                node.calls, node.wallTime, node.exclusiveWallTime, node.cpuTime, node.exclusiveCpuTime,
+                node.peakAllocated / 2**20, node.netAllocated / 2**20, "  " * (len(path) - 1), node.name))
+        return "\n".join(lines)
+
+    def __getstate__(self):
+        return self.root
+
+    def __setstate__(self, state):
+        self.root = state
+        self._initThreading()
@@ -25,6 +25,7 @@ import unittest
 import tempfile
 
 import lsst.utils
+import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipeBase
 import lsst.obs.test
 from lsst.log import Log
@@ -68,6 +69,16 @@ class NoMultiprocessTask(ExampleTask):
     canMultiprocess = False
 
 
+class CloneTask(ExampleTask):
+    """Version of ExampleTask that is cloned for each data reference"""
+    canCloneTask = True
+
+    def __init__(self, *args, **kwargs):
+        ExampleTask.__init__(self, *args, **kwargs)
+        self.metadata.set("constructionId", id(self))
+        self.metadata.set("constructionPid", os.getpid())
+
+
 class LegacyTask(ExampleTask):
     """Version of ExampleTask with `run` as entry point rather than
        `runDataRef`
@@ -81,6 +92,25 @@ class LegacyTask(ExampleTask):
         return results
 
 
+class FailVisitTask(ExampleTask):
+    """Version of ExampleTask which fails for visit 3"""
+
+    def runDataRef(self, dataRef):
+        if dataRef.dataId["visit"] == 3:
+            raise RuntimeError("Failed by request: visit 3")
+        return ExampleTask.runDataRef(self, dataRef)
+
+
+class ResourceTaskConfig(lsst.obs.test.TestConfig):
+    resources = pexConfig.ConfigField(dtype=pipeBase.ResourceConfig, doc="resource configuration")
+
+
+class ResourceTask(ExampleTask):
+    """Version of ExampleTask which declares its resource requirements"""
+    ConfigClass = ResourceTaskConfig
+    _DefaultName = "resource"
+
+
 class CmdLineTaskTestCase(unittest.TestCase):
     """A test case for CmdLineTask
     """
@@ -139,6 +169,84 @@ class CmdLineTaskTestCase(unittest.TestCase):
         self.assertEqual(result.metadata.getScalar("numProcessed"), 1)
         self.assertEqual(result.result.numProcessed, 1)
 
+    def testTimingStacks(self):
+        """Test that timing trees are merged and written
+        """
+        filename = os.path.join(self.outPath, "timing.txt")
+        retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                               "--id", "visit=2", "filter=r",
+                                               "--timing-stacks", filename])
+        timingTree = retVal.taskRunner.timingTree
+        node = timingTree.root.children["test.runDataRef"]
+        self.assertEqual(node.calls, len(retVal.resultList))
+        with open(filename) as inFile:
+            lines = inFile.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith("test.runDataRef "))
+
+        # timing tree is not recorded without the option
+        retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                               "--id", "visit=2", "filter=r"],
+                                         doReturnResults=True)
+        for result in retVal.resultList:
+            self.assertIsNone(result.timingTree)
+        self.assertEqual(len(retVal.taskRunner.timingTree.root.children), 0)
+
+    def testMetricsFile(self):
+        """Test that metrics are written
+        """
+        filename = os.path.join(self.outPath, "metrics.prom")
+        retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                               "--id", "visit=2", "filter=r", "-j", "2",
+                                               "--metrics-file", filename])
+        with open(filename) as metricsFile:
+            lines = metricsFile.read().splitlines()
+        self.assertIn('pipe_base_targets_total{task="test",status="success"} %d' % len(retVal.resultList),
+                      lines)
+        self.assertIn('pipe_base_method_calls_total{task="test",method="test.runDataRef"} %d' %
+                      len(retVal.resultList), lines)
+
+    def testMetadataStore(self):
+        """Test that metadata is written to a single store instead of the output repository
+        """
+        filename = os.path.join(self.outPath, "metadata.sqlite3")
+        retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                               "--id", "visit=2", "filter=r", "-j", "2",
+                                               "--metadata-store", filename], doReturnResults=True)
+        with pipeBase.MetadataStore(filename) as store:
+            self.assertEqual(len(store), len(retVal.resultList))
+            for result in retVal.resultList:
+                self.assertFalse(hasattr(result, "metadataRecord"))
+                metadata = store.get("test_metadata", result.dataRef.dataId)
+                self.assertEqual(metadata.getScalar("test.numProcessed"), 1)
+                self.assertFalse(result.dataRef.datasetExists("test_metadata"))
+
+    def testMetadataStoreFailure(self):
+        """Test that metadata records are written as results arrive
+        """
+        filename = os.path.join(self.outPath, "metadata.sqlite3")
+        with self.assertRaises(RuntimeError):
+            FailVisitTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                            "--id", "visit=2^3", "-j", "2", "--doraise",
+                                            "--metadata-store", filename])
+        # records of the targets before the failed one are kept
+        with pipeBase.MetadataStore(filename) as store:
+            keys = store.keys()
+        self.assertGreater(len(keys), 0)
+        for datasetType, dataId in keys:
+            self.assertEqual(dataId["visit"], 2)
+
+    def testSamplingProfile(self):
+        """Test that sampling profiles are written per target and merged
+        """
+        filename = os.path.join(self.outPath, "profile.txt")
+        retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                               "--id", "visit=2", "filter=r", "-j", "2",
+                                               "--profile", filename, "--profile-mode", "sampling"])
+        for index in range(len(retVal.resultList)):
+            self.assertTrue(os.path.exists("{}.{}".format(filename, index)))
+        self.assertTrue(os.path.exists(filename))
+
     def testDoReturnResultsOnFailure(self):
         retVal = ExampleTask.parseAndRun(args=[DataPath, "--output", self.outPath,
                                                "--id", "visit=3", "filter=r", "--config", "doFail=True",
@@ -159,6 +267,28 @@ class CmdLineTaskTestCase(unittest.TestCase):
         self.assertTrue(os.path.exists(os.path.join(
             self.outPath, "config", ExampleTask._DefaultName + ".py~1")))
 
+    def testConfigHash(self):
+        """Test that hash of the config is written and used for checks
+        """
+        args = [DataPath, "--output", self.outPath, "--id", "visit=3", "filter=r"]
+        ExampleTask.parseAndRun(args=args)
+        hashPath = os.path.join(self.outPath, "config", ExampleTask._DefaultName + ".py.sha256")
+        with open(hashPath) as hashFile:
+            content = hashFile.read()
+        self.assertEqual(len(content.split()), 3)
+
+        # same config is accepted
+        ExampleTask.parseAndRun(args=args)
+        with open(hashPath) as hashFile:
+            self.assertEqual(hashFile.read(), content)
+
+        # invalid hash falls back to full comparison and is replaced
+        with open(hashPath, "w") as hashFile:
+            hashFile.write("invalid 0 0\n")
+        ExampleTask.parseAndRun(args=args)
+        with open(hashPath) as hashFile:
+            self.assertEqual(hashFile.read(), content)
+
     def testNoBackupConfig(self):
         """Test no backup config file creation
         """
@@ -179,6 +309,46 @@ class CmdLineTaskTestCase(unittest.TestCase):
                                                  "-j", "5", "--id", "visit=2", "filter=r"])
             self.assertEqual(result.taskRunner.numProcesses, 5 if TaskClass.canMultiprocess else 1)
 
+    def testMaxMemory(self):
+        """Test that task resources and --max-memory limit number of processes
+        """
+        # config overrides, --max-memory, expected number of processes
+        cases = [([], None, 5),
+                 (["resources.minMemoryMB=1000"], None, 5),
+                 (["resources.minMemoryMB=1000"], 3000, 3),
+                 (["resources.minMemoryMB=1000"], 500, 1),
+                 (["resources.minNumCores=2"], None, 2)]
+        for i, (config, maxMemory, numProcesses) in enumerate(cases):
+            args = [DataPath, "--output", os.path.join(self.outPath, str(i)), "-j", "5",
+                    "--id", "visit=2", "filter=r"]
+            if config:
+                args += ["--config"] + config
+            if maxMemory is not None:
+                args += ["--max-memory", str(maxMemory)]
+            result = ResourceTask.parseAndRun(args=args)
+            self.assertEqual(result.taskRunner.numProcesses, numProcesses)
+
+    def testCloneTask(self):
+        """Test that a task is constructed once and cloned for each target
+        """
+        retVal = CloneTask.parseAndRun(args=[DataPath, "--output", self.outPath,
+                                             "--id", "visit=2", "filter=r"], doReturnResults=True)
+        self.assertGreater(len(retVal.resultList), 1)
+        constructionIds = set(result.metadata.getScalar("constructionId") for result in retVal.resultList)
+        self.assertEqual(len(constructionIds), 1)
+        for result in retVal.resultList:
+            self.assertEqual(result.exitStatus, 0)
+
+        # worker processes are kept and construct the task once each
+        retVal = CloneTask.parseAndRun(args=[DataPath, "--output", self.outPath, "-j", "2",
+                                             "--id", "visit=2", "filter=r"], doReturnResults=True)
+        constructions = set((result.metadata.getScalar("constructionPid"),
+                             result.metadata.getScalar("constructionId")) for result in retVal.resultList)
+        self.assertLessEqual(len(constructions), 2)
+        self.assertEqual(len(constructions), len(set(pid for pid, _ in constructions)))
+        for result in retVal.resultList:
+            self.assertEqual(result.exitStatus, 0)
+
     def testCannotConstructTask(self):
         """Test error handling when a task cannot be constructed
         """
@@ -0,0 +1,191 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for FusedPipelineTask.
+"""
+
+import unittest
+from types import SimpleNamespace
+
+import lsst.utils.tests
+from lsst.daf.butler import DatasetRef, Quantum, Run, DimensionUniverse
+import lsst.pex.config as pexConfig
+import lsst.pipe.base as pipeBase
+from lsst.pipe.base import pipeTools
+
+
+class ButlerMock():
+    """Mock version of butler, only usable for this test
+    """
+    def __init__(self):
+        self.datasets = {}
+        self.nget = 0
+        self.registry = SimpleNamespace(dimensions=DimensionUniverse.fromConfig())
+
+    @staticmethod
+    def key(dataId):
+        """Make a dict key out of dataId.
+        """
+        return (dataId["instrument"], dataId["visit"])
+
+    def get(self, datasetRefOrType, dataId=None):
+        if isinstance(datasetRefOrType, DatasetRef):
+            dataId = datasetRefOrType.dataId
+            dsTypeName = datasetRefOrType.datasetType.name
+        else:
+            dsTypeName = datasetRefOrType
+        self.nget += 1
+        return self.datasets[dsTypeName][self.key(dataId)]
+
+    def put(self, inMemoryDataset, dsTypeName, dataId, producer=None):
+        dsdata = self.datasets.setdefault(dsTypeName, {})
+        dsdata[self.key(dataId)] = inMemoryDataset
+
+
+class AddConfig(pipeBase.PipelineTaskConfig):
+    addend = pexConfig.Field(doc="amount to add", dtype=int, default=3)
+    input = pipeBase.InputDatasetField(name="add_input",
+                                       dimensions=["instrument", "visit"],
+                                       storageClass="Catalog",
+                                       scalar=True,
+                                       doc="Input dataset type for this task")
+    output = pipeBase.OutputDatasetField(name="add_output",
+                                         dimensions=["instrument", "visit"],
+                                         storageClass="Catalog",
+                                         scalar=True,
+                                         doc="Output dataset type for this task")
+
+    def setDefaults(self):
+        self.quantum.dimensions = ["instrument", "visit"]
+
+
+class AddTask(pipeBase.PipelineTask):
+    ConfigClass = AddConfig
+    _DefaultName = "add_task"
+
+    def run(self, input):
+        return pipeBase.Struct(output=input + self.config.addend)
+
+
+def _makePipeline(tasks):
+    """Make a pipeline of AddTasks.
+
+    Parameters
+    ----------
+    tasks : `list` of `tuple`
+        Each tuple is (input name, output name, label, quantum dimensions).
+    """
+    pipeline = pipeBase.Pipeline()
+    for inputName, outputName, label, dimensions in tasks:
+        config = AddConfig()
+        config.input.name = inputName
+        config.output.name = outputName
+        config.quantum.dimensions = dimensions
+        pipeline.append(pipeBase.TaskDef("AddTask", config, AddTask, label))
+    return pipeline
+
+
+class FusedPipelineTaskTestCase(unittest.TestCase):
+    """A test case for FusedPipelineTask
+    """
+
+    nQuanta = 3
+
+    def _runFused(self, taskDef, butler):
+        """Run fused task on all visits.
+        """
+        universe = butler.registry.dimensions
+        run = Run(collection=1, environment=None, pipeline=None)
+        task = taskDef.taskClass(config=taskDef.config)
+        inputs = taskDef.taskClass.getInputDatasetTypes(taskDef.config)
+        outputs = taskDef.taskClass.getOutputDatasetTypes(taskDef.config)
+        for visit in range(self.nQuanta):
+            dataId = dict(instrument="X", visit=visit)
+            quantum = Quantum(run=run, task=None)
+            for descr in inputs.values():
+                quantum.addPredictedInput(DatasetRef(descr.makeDatasetType(universe), dataId))
+            for descr in outputs.values():
+                quantum.addOutput(DatasetRef(descr.makeDatasetType(universe), dataId))
+            task.runQuantum(quantum, butler)
+
+    def _makeButler(self):
+        butler = ButlerMock()
+        for visit in range(self.nQuanta):
+            butler.put(visit * 100, "ds0", dict(instrument="X", visit=visit))
+        return butler
+
+    def testRunQuantum(self):
+        """Test that intermediates are not written to butler
+        """
+        pipeline = _makePipeline([("ds0", "ds1", "task0", ["instrument", "visit"]),
+                                  ("ds1", "ds2", "task1", ["instrument", "visit"]),
+                                  ("ds2", "ds3", "task2", ["instrument", "visit"])])
+        fused = pipeTools.fusePipeline(pipeline)
+        self.assertEqual(len(fused), 1)
+
+        butler = self._makeButler()
+        self._runFused(fused[0], butler)
+        self.assertEqual(set(butler.datasets), {"ds0", "ds3"})
+        for visit in range(self.nQuanta):
+            self.assertEqual(butler.datasets["ds3"][("X", visit)], visit * 100 + 9)
+        # only inputs of the chain are read from butler
+        self.assertEqual(butler.nget, self.nQuanta)
+
+        # requested intermediates are written too
+        fused = pipeTools.fusePipeline(pipeline, keepOutputs=["ds2"])
+        butler = self._makeButler()
+        self._runFused(fused[0], butler)
+        self.assertEqual(set(butler.datasets), {"ds0", "ds2", "ds3"})
+        for visit in range(self.nQuanta):
+            self.assertEqual(butler.datasets["ds2"][("X", visit)], visit * 100 + 6)
+        self.assertEqual(butler.nget, self.nQuanta)
+
+    def testRunQuantumConsumedOutside(self):
+        """Test that intermediates consumed by other tasks are written to
+        butler
+        """
+        # last task has different quantum dimensions and is not fused
+        pipeline = _makePipeline([("ds0", "ds1", "task0", ["instrument", "visit"]),
+                                  ("ds1", "ds2", "task1", ["instrument", "visit"]),
+                                  ("ds1", "ds3", "task2", ["instrument"])])
+        fused = pipeTools.fusePipeline(pipeline)
+        self.assertEqual([taskDef.label for taskDef in fused], ["task0+task1", "task2"])
+
+        butler = self._makeButler()
+        self._runFused(fused[0], butler)
+        self.assertEqual(set(butler.datasets), {"ds0", "ds1", "ds2"})
+        for visit in range(self.nQuanta):
+            self.assertEqual(butler.datasets["ds1"][("X", visit)], visit * 100 + 3)
+            self.assertEqual(butler.datasets["ds2"][("X", visit)], visit * 100 + 6)
+        self.assertEqual(butler.nget, self.nQuanta)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -22,16 +22,18 @@
 """Simple unit test for GraphBuilder class.
 """
 
+import itertools
 import unittest
+from types import SimpleNamespace
 
 import lsst.utils.tests
 from lsst.daf.butler import (Registry, RegistryConfig, SchemaConfig,
-                             DatasetOriginInfoDef)
+                             DatasetOriginInfoDef, DatasetRef, DimensionUniverse)
 from lsst.pipe.base import (Struct, PipelineTask, PipelineTaskConfig,
                             InputDatasetField, OutputDatasetField,
                             InitInputDatasetField, InitOutputDatasetField,
                             GraphBuilder, Pipeline, TaskDef, TaskFactory)
-from lsst.pipe.base.graphBuilder import _TaskDatasetTypes
+from lsst.pipe.base.graphBuilder import _TaskDatasetTypes, GraphBuilderError, OutputExistsError
 
 
 class OneToOneTaskConfig(PipelineTaskConfig):
@@ -109,6 +111,215 @@ class TaskFactoryMock(TaskFactory):
         return taskClass(config=config)
 
 
+class RegistryMock:
+    """Registry which knows about a fixed set of datasets.
+
+    Parameters
+    ----------
+    visits : `list` of `int`
+        Visits of instrument "X" returned by queries.
+    datasets : `dict`
+        Maps (dataset type name, visit) to dataset ID of existing datasets.
+    initDatasets : `dict`
+        Maps collection name to a `dict` which maps name of dataset type
+        without dimensions to dataset ID.
+    initQueryError : `Exception`, optional
+        Exception raised by queries for dataset types without dimensions.
+    """
+
+    def __init__(self, visits, datasets, initDatasets, initQueryError=None):
+        self.dimensions = DimensionUniverse.fromConfig()
+        self.visits = visits
+        self.datasets = datasets
+        self.initDatasets = initDatasets
+        self.finds = []
+        self.queries = 0
+        self.initQueryError = initQueryError
+
+    def selectMultipleDatasetTypes(self, originInfo, expression, required, optional, prerequisite,
+                                   perDatasetTypeDimensions):
+        initNames = set(itertools.chain.from_iterable(self.initDatasets.values()))
+        if all(dsType.name in initNames for dsType in required):
+            if self.initQueryError is not None:
+                raise self.initQueryError
+            # one row per combination of collections containing datasets,
+            # in reverse order of collections so that first row does not
+            # come from first collection
+            choices = []
+            for dsType in required:
+                collections = originInfo.getInputCollections(dsType.name)
+                choices.append([DatasetRef(dsType, {}, id=self.initDatasets[coll][dsType.name])
+                                for coll in reversed(collections)
+                                if dsType.name in self.initDatasets.get(coll, {})])
+            for refs in itertools.product(*choices):
+                yield SimpleNamespace(dataId={}, datasetRefs=dict(zip(required, refs)))
+            return
+        self.queries += 1
+        for visit in self.visits:
+            dataId = dict(instrument="X", visit=visit)
+            refs = {dsType: DatasetRef(dsType, dataId, id=self.datasets.get((dsType.name, visit)))
+                    for dsType in required | optional | prerequisite}
+            if all(refs[dsType].id is not None for dsType in required):
+                yield SimpleNamespace(dataId=dataId, datasetRefs=refs)
+
+    def find(self, collection, datasetType, dataId=None):
+        self.finds.append((collection, datasetType.name))
+        dsId = self.initDatasets.get(collection, {}).get(datasetType.name)
+        if dsId is None:
+            return None
+        return DatasetRef(datasetType, {}, id=dsId)
+
+
+class GraphBuilderRegistryMockTestCase(unittest.TestCase):
+    """A test case for GraphBuilder class using registry mock
+    """
+
+    def _makePipeline(self, quantumDimensions=None):
+        config = OneToOneTaskConfig()
+        if quantumDimensions is not None:
+            config.quantum.dimensions = quantumDimensions
+        return Pipeline([TaskDef("TaskOne", config, TaskOne, "task1")])
+
+    def _initInputs(self, initDatasets, inputCollections, initQueryError=None):
+        registry = RegistryMock([1], {("input", 1): 1}, initDatasets, initQueryError)
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry)
+        coll = DatasetOriginInfoDef(inputCollections, "out")
+        graph = gbuilder.makeGraph(self._makePipeline(), coll, None)
+        return [(ref.datasetType.name, ref.id) for ref in graph.initInputs], registry.finds
+
+    def testInitInputs(self):
+        """Test for lookup of init-input datasets
+        """
+        # dataset in one collection is found by registry query
+        initInputs, finds = self._initInputs({"coll2": {"initInput": 2}}, ["coll1", "coll2"])
+        self.assertEqual(initInputs, [("initInput", 2)])
+        self.assertEqual(finds, [])
+
+        # dataset in more than one collection is found in the first one
+        initDatasets = {"coll1": {"initInput": 1}, "coll2": {"initInput": 2}}
+        initInputs, finds = self._initInputs(initDatasets, ["coll1", "coll2"])
+        self.assertEqual(initInputs, [("initInput", 1)])
+        self.assertEqual(finds, [("coll1", "initInput")])
+        initInputs, finds = self._initInputs(initDatasets, ["coll2", "coll1"])
+        self.assertEqual(initInputs, [("initInput", 2)])
+
+        # missing dataset
+        with self.assertRaises(GraphBuilderError):
+            self._initInputs({"coll3": {"initInput": 3}}, ["coll1", "coll2"])
+
+        # registry which cannot run the query, datasets are looked up one
+        # by one
+        initInputs, finds = self._initInputs(initDatasets, ["coll2", "coll1"],
+                                             RuntimeError("query without dimensions"))
+        self.assertEqual(initInputs, [("initInput", 2)])
+        self.assertEqual(finds, [("coll2", "initInput")])
+        with self.assertRaises(GraphBuilderError):
+            self._initInputs({"coll3": {"initInput": 3}}, ["coll1", "coll2"],
+                             RuntimeError("query without dimensions"))
+
+    def _makeTaskDef(self, inputName, outputName, label, quantumDimensions=None):
+        config = OneToOneTaskConfig()
+        config.input.name = inputName
+        config.output.name = outputName
+        if quantumDimensions is not None:
+            config.quantum.dimensions = quantumDimensions
+        return TaskDef("TaskOne", config, TaskOne, label)
+
+    def testUpdateGraph(self):
+        """Test for updateGraph() implementation
+        """
+        initDatasets = {"coll": {"initInput": 1}}
+        coll = DatasetOriginInfoDef(["coll"], "out")
+        registry = RegistryMock([1, 2, 3], {("input", visit): visit for visit in [1, 2, 3]}, initDatasets)
+        # task2 depends on task1, task3 is independent
+        pipeline = Pipeline([self._makeTaskDef("input", "output1", "task1"),
+                             self._makeTaskDef("output1", "output2", "task2"),
+                             self._makeTaskDef("input", "output3", "task3")])
+
+        # build state is not kept by default
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry)
+        graph = gbuilder.makeGraph(pipeline, coll, None)
+        self.assertIsNone(graph._buildState)
+        with self.assertRaises(GraphBuilderError):
+            gbuilder.updateGraph(graph, pipeline)
+
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry, keepBuildState=True)
+        graph = gbuilder.makeGraph(pipeline, coll, None)
+        self.assertEqual(registry.queries, 2)
+        self.assertEqual([len(nodes.quanta) for nodes in graph], [3, 3, 3])
+
+        # nothing has changed, query results and all quanta are re-used
+        newGraph = gbuilder.updateGraph(graph, pipeline)
+        self.assertEqual(registry.queries, 2)
+        self.assertIs(newGraph._buildState.rows, graph._buildState.rows)
+        self.assertEqual(len(newGraph), 3)
+        for newNodes, nodes in zip(newGraph, graph):
+            self.assertIs(newNodes.quanta, nodes.quanta)
+
+        # changed quantum dimensions of the first task, it and the task which
+        # depends on it are re-made from the same query results
+        pipeline[0] = self._makeTaskDef("input", "output1", "task1", ["Instrument"])
+        newGraph = gbuilder.updateGraph(graph, pipeline)
+        self.assertEqual(registry.queries, 2)
+        self.assertIs(newGraph._buildState.rows, graph._buildState.rows)
+        self.assertEqual([len(nodes.quanta) for nodes in newGraph], [1, 3, 3])
+        self.assertIsNot(newGraph[0].quanta, graph[0].quanta)
+        self.assertIsNot(newGraph[1].quanta, graph[1].quanta)
+        self.assertIs(newGraph[2].quanta, graph[2].quanta)
+
+        # updated graph can be updated again, new output dataset type needs
+        # a new query and all quanta are re-made
+        graph = newGraph
+        pipeline[2] = self._makeTaskDef("input", "output4", "task3")
+        newGraph = gbuilder.updateGraph(graph, pipeline)
+        self.assertEqual(registry.queries, 3)
+        self.assertIsNot(newGraph._buildState.rows, graph._buildState.rows)
+        self.assertEqual([len(nodes.quanta) for nodes in newGraph], [1, 3, 3])
+        for newNodes, nodes in zip(newGraph, graph):
+            self.assertIsNot(newNodes.quanta, nodes.quanta)
+
+    def testConfigNotFrozen(self):
+        """Test that makeGraph does not freeze pipeline configurations
+        """
+        registry = RegistryMock([1], {("input", 1): 1}, {"coll": {"initInput": 1}})
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry)
+        pipeline = self._makePipeline()
+        gbuilder.makeGraph(pipeline, DatasetOriginInfoDef(["coll"], "out"), None)
+        pipeline[0].config.output.name = "output2"
+        self.assertEqual(TaskOne.getOutputDatasetTypes(pipeline[0].config)["output"].name, "output2")
+
+    def testSkipExisting(self):
+        """Test for skipping quanta whose outputs exist
+        """
+        initDatasets = {"coll": {"initInput": 1}}
+        coll = DatasetOriginInfoDef(["coll"], "out")
+        datasets = {("input", visit): visit for visit in range(1, 5)}
+        datasets.update({("output", 1): 11, ("output", 2): 12})
+        registry = RegistryMock(list(range(1, 5)), datasets, initDatasets)
+
+        # quanta of visits 1 and 2 are skipped
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry, skipExisting=True)
+        graph = gbuilder.makeGraph(self._makePipeline(), coll, None)
+        visits = [ref.dataId["visit"] for quantum in graph[0].quanta
+                  for refs in quantum.outputs.values() for ref in refs]
+        self.assertCountEqual(visits, [3, 4])
+
+        # without skipExisting existing outputs are an error
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry, skipExisting=False)
+        with self.assertRaises(OutputExistsError):
+            gbuilder.makeGraph(self._makePipeline(), coll, None)
+
+        # per-instrument quantum with some of its outputs existing
+        gbuilder = GraphBuilder(TaskFactoryMock(), registry, skipExisting=True)
+        with self.assertRaises(OutputExistsError):
+            gbuilder.makeGraph(self._makePipeline(["Instrument"]), coll, None)
+
+        # per-instrument quantum with all outputs existing is skipped
+        datasets.update({("output", 3): 13, ("output", 4): 14})
+        graph = gbuilder.makeGraph(self._makePipeline(["Instrument"]), coll, None)
+        self.assertEqual(len(graph[0].quanta), 0)
+
+
 @unittest.skip("Registry missing, Will be fixed in DM-16833")
 class GraphBuilderTestCase(unittest.TestCase):
     """A test case for GraphBuilder class
@@ -0,0 +1,467 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for LocalQuantumGraphExecutor.
+"""
+
+from itertools import chain
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+import lsst.utils.tests
+from lsst.daf.butler import DatasetRef, Quantum, Run, DimensionUniverse
+import lsst.pex.config as pexConfig
+import lsst.pipe.base as pipeBase
+
+
+class ButlerMock():
+    """Mock version of butler, only usable for this test
+    """
+    def __init__(self):
+        self.datasets = {}
+        self.nget = 0
+        self.registry = SimpleNamespace(dimensions=DimensionUniverse.fromConfig())
+
+    @staticmethod
+    def key(dataId):
+        """Make a dict key out of dataId.
+        """
+        return (dataId["instrument"], dataId["visit"])
+
+    def get(self, datasetRefOrType, dataId=None):
+        if isinstance(datasetRefOrType, DatasetRef):
+            dataId = datasetRefOrType.dataId
+            dsTypeName = datasetRefOrType.datasetType.name
+        else:
+            dsTypeName = datasetRefOrType
+        self.nget += 1
+        return self.datasets[dsTypeName][self.key(dataId)]
+
+    def put(self, inMemoryDataset, dsTypeName, dataId, producer=None):
+        dsdata = self.datasets.setdefault(dsTypeName, {})
+        dsdata[self.key(dataId)] = inMemoryDataset
+
+
+class FileButlerMock():
+    """Mock version of butler which keeps datasets in files, it can be
+    pickled and shared by multiple processes.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.registry = SimpleNamespace(dimensions=DimensionUniverse.fromConfig())
+
+    def __getstate__(self):
+        return self.directory
+
+    def __setstate__(self, directory):
+        self.__init__(directory)
+
+    def _path(self, dsTypeName, dataId):
+        return os.path.join(self.directory, "{}-{}-{}.pickle".format(dsTypeName, *ButlerMock.key(dataId)))
+
+    @property
+    def datasets(self):
+        """All datasets, indexed like `ButlerMock.datasets`.
+        """
+        datasets = {}
+        for fileName in os.listdir(self.directory):
+            dsTypeName, instrument, visit = fileName[:-len(".pickle")].split("-")
+            with open(os.path.join(self.directory, fileName), "rb") as dsFile:
+                datasets.setdefault(dsTypeName, {})[(instrument, int(visit))] = pickle.load(dsFile)
+        return datasets
+
+    def get(self, datasetRefOrType, dataId=None):
+        if isinstance(datasetRefOrType, DatasetRef):
+            dataId = datasetRefOrType.dataId
+            dsTypeName = datasetRefOrType.datasetType.name
+        else:
+            dsTypeName = datasetRefOrType
+        with open(self._path(dsTypeName, dataId), "rb") as dsFile:
+            return pickle.load(dsFile)
+
+    def put(self, inMemoryDataset, dsTypeName, dataId, producer=None):
+        with open(self._path(dsTypeName, dataId), "wb") as dsFile:
+            pickle.dump(inMemoryDataset, dsFile)
+
+
+class AddConfig(pipeBase.PipelineTaskConfig):
+    addend = pexConfig.Field(doc="amount to add", dtype=int, default=3)
+    input = pipeBase.InputDatasetField(name="add_input",
+                                       dimensions=["instrument", "visit"],
+                                       storageClass="Catalog",
+                                       scalar=True,
+                                       doc="Input dataset type for this task")
+    output = pipeBase.OutputDatasetField(name="add_output",
+                                         dimensions=["instrument", "visit"],
+                                         storageClass="Catalog",
+                                         scalar=True,
+                                         doc="Output dataset type for this task")
+    resources = pexConfig.ConfigField(dtype=pipeBase.ResourceConfig, doc="resource configuration")
+
+    def setDefaults(self):
+        self.quantum.dimensions = ["instrument", "visit"]
+
+
+class AddTask(pipeBase.PipelineTask):
+    ConfigClass = AddConfig
+    _DefaultName = "add_task"
+
+    def run(self, input):
+        return pipeBase.Struct(output=input + self.config.addend)
+
+
+class FailTask(AddTask):
+    _DefaultName = "fail_task"
+
+    def run(self, input):
+        if input == 103:
+            raise RuntimeError("FailTask intentional error")
+        return super().run(input)
+
+
+class SleepTask(AddTask):
+    _DefaultName = "sleep_task"
+
+    def run(self, input):
+        time.sleep(10)
+        return super().run(input)
+
+
+class AppendTask(AddTask):
+    """Task which modifies its input list.
+    """
+    _DefaultName = "append_task"
+
+    def run(self, input):
+        input.append(self.config.addend)
+        return pipeBase.Struct(output=input)
+
+
+class TimedTask(AddTask):
+    """Task which saves start and end time of each quantum in butler.
+    """
+    _DefaultName = "timed_task"
+
+    def runQuantum(self, quantum, butler):
+        startTime = time.time()
+        time.sleep(0.1)
+        super().runQuantum(quantum, butler)
+        for ref in chain.from_iterable(quantum.outputs.values()):
+            butler.put((startTime, time.time()), "time_" + ref.datasetType.name, ref.dataId)
+
+
+class TaskFactoryMock(pipeBase.TaskFactory):
+    def loadTaskClass(self, taskName):
+        if taskName == "AddTask":
+            return AddTask, "AddTask"
+
+    def makeTask(self, taskClass, config, overrides, butler):
+        if config is None:
+            config = taskClass.ConfigClass()
+        return taskClass(config=config)
+
+
+class FileTaskFactoryMock(TaskFactoryMock):
+    """Task factory which records every task instance it makes in a file,
+    with process ID and input dataset type of the task.
+    """
+    def __init__(self, fileName):
+        self.fileName = fileName
+
+    def makeTask(self, taskClass, config, overrides, butler):
+        with open(self.fileName, "a") as logFile:
+            print(os.getpid(), config.input.name, file=logFile)
+        return super().makeTask(taskClass, config, overrides, butler)
+
+    def getTasks(self):
+        """Return list of (process ID, input name) for all made tasks.
+        """
+        with open(self.fileName) as logFile:
+            return [tuple(line.split()) for line in logFile]
+
+
+class LocalQuantumGraphExecutorTestCase(unittest.TestCase):
+    """A test case for LocalQuantumGraphExecutor
+    """
+
+    nQuanta = 5
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.butlerDir = os.path.join(self.tmpDir, "butler")
+        os.mkdir(self.butlerDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+    def _makeTaskNodes(self, taskDef, universe):
+        """Make QuantumGraphTaskNodes for one task.
+        """
+        run = Run(collection=1, environment=None, pipeline=None)
+        inputs = pipeBase.DatasetTypeDescriptor.fromConfig(taskDef.config.input)
+        outputs = pipeBase.DatasetTypeDescriptor.fromConfig(taskDef.config.output)
+        dstype0 = inputs.makeDatasetType(universe)
+        dstype1 = outputs.makeDatasetType(universe)
+        quanta = []
+        for visit in range(self.nQuanta):
+            quantum = Quantum(run=run, task=None)
+            quantum.addPredictedInput(DatasetRef(dstype0, dict(instrument="X", visit=visit)))
+            quantum.addOutput(DatasetRef(dstype1, dict(instrument="X", visit=visit)))
+            quanta.append(quantum)
+        return pipeBase.QuantumGraphTaskNodes(taskDef, quanta)
+
+    def _makeGraph(self, butler, taskClasses=(AddTask, AddTask, AddTask), memoryMB=None):
+        """Make a graph for a chain of three tasks.
+        """
+        taskDefs = []
+        for i, taskClass in enumerate(taskClasses):
+            config = AddConfig()
+            config.input.name = "ds{}".format(i)
+            config.output.name = "ds{}".format(i + 1)
+            config.resources.minMemoryMB = memoryMB
+            taskDefs.append(pipeBase.TaskDef(taskClass.__name__, config, taskClass, "task{}".format(i)))
+        graph = pipeBase.QuantumGraph(self._makeTaskNodes(taskDef, butler.registry.dimensions)
+                                      for taskDef in taskDefs)
+        for visit in range(self.nQuanta):
+            butler.put(visit * 100, "ds0", dict(instrument="X", visit=visit))
+        return graph
+
+    def _checkOutputs(self, butler):
+        self.assertEqual(len(butler.datasets["ds3"]), self.nQuanta)
+        for visit in range(self.nQuanta):
+            self.assertEqual(butler.datasets["ds3"][("X", visit)], visit * 100 + 9)
+
+    def _maxConcurrency(self, butler):
+        """Return maximum number of quanta of `TimedTask` which were executed
+        at the same time.
+        """
+        events = []
+        for name, times in butler.datasets.items():
+            if name.startswith("time_"):
+                for startTime, endTime in times.values():
+                    events += [(startTime, 1), (endTime, -1)]
+        count = maxCount = 0
+        for _, delta in sorted(events):
+            count += delta
+            maxCount = max(count, maxCount)
+        return maxCount
+
+    def testExecute(self):
+        """Test that all intermediates go through butler by default.
+        """
+        butler = ButlerMock()
+        graph = self._makeGraph(butler)
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler)
+        reports = executor.execute(graph)
+        self.assertEqual(len(reports), 3 * self.nQuanta)
+        for report in reports:
+            self.assertEqual(report.status, "success")
+            self.assertGreaterEqual(report.wallTime, 0.)
+        self._checkOutputs(butler)
+        for name in ("ds1", "ds2"):
+            self.assertEqual(len(butler.datasets[name]), self.nQuanta)
+        self.assertEqual(butler.nget, 3 * self.nQuanta)
+
+    def testExecuteInMemory(self):
+        """Test that intermediates are handed over in memory.
+        """
+        butler = ButlerMock()
+        graph = self._makeGraph(butler)
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, inMemory=True,
+                                                      persistDatasetTypes=["ds1"])
+        executor.execute(graph)
+        self._checkOutputs(butler)
+        self.assertEqual(len(butler.datasets["ds1"]), self.nQuanta)
+        self.assertNotIn("ds2", butler.datasets)
+        # only inputs of the first task are read from butler
+        self.assertEqual(butler.nget, self.nQuanta)
+
+    def testExecuteInMemoryCopy(self):
+        """Test that datasets with more than one consumer can be copied.
+        """
+        # first task output is consumed by two other tasks
+        taskDefs = []
+        for i, (inputName, outputName) in enumerate([("ds0", "ds1"), ("ds1", "ds2"), ("ds1", "ds3")]):
+            config = AddConfig()
+            config.input.name = inputName
+            config.output.name = outputName
+            taskDefs.append(pipeBase.TaskDef("AppendTask", config, AppendTask, "task{}".format(i)))
+
+        for copyShared, expected in ((False, [3, 3, 3]), (True, [3, 3])):
+            butler = ButlerMock()
+            universe = butler.registry.dimensions
+            graph = pipeBase.QuantumGraph(self._makeTaskNodes(taskDef, universe) for taskDef in taskDefs)
+            for visit in range(self.nQuanta):
+                butler.put([visit], "ds0", dict(instrument="X", visit=visit))
+            executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, inMemory=True,
+                                                          copyShared=copyShared)
+            executor.execute(graph)
+            for visit in range(self.nQuanta):
+                self.assertEqual(butler.datasets["ds2"][("X", visit)], [visit] + expected)
+                self.assertEqual(butler.datasets["ds3"][("X", visit)], [visit] + expected)
+
+    def testFailure(self):
+        """Test that failures are propagated to dependent quanta.
+        """
+        butler = ButlerMock()
+        graph = self._makeGraph(butler, taskClasses=(AddTask, FailTask, AddTask))
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler)
+        reports = executor.execute(graph)
+        statuses = {}
+        for report in reports:
+            statuses.setdefault(report.status, []).append(report.label)
+        # visit 1 fails in second task, its third task is skipped
+        self.assertEqual(statuses["failed"], ["task1"])
+        self.assertEqual(statuses["skipped"], ["task2"])
+        self.assertEqual(len(butler.datasets["ds3"]), self.nQuanta - 1)
+
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, doRaise=True)
+        with self.assertRaises(RuntimeError):
+            executor.execute(graph)
+
+    def testExecuteParallel(self):
+        """Test that quanta are executed after their dependencies and tasks
+        are made once per worker process.
+        """
+        butler = FileButlerMock(self.butlerDir)
+        graph = self._makeGraph(butler)
+        taskFactory = FileTaskFactoryMock(os.path.join(self.tmpDir, "tasks.log"))
+        executor = pipeBase.LocalQuantumGraphExecutor(taskFactory, butler, numProcesses=2)
+        reports = executor.execute(graph)
+        self.assertEqual(len(reports), 3 * self.nQuanta)
+        for report in reports:
+            self.assertEqual(report.status, "success")
+            self.assertGreaterEqual(report.wallTime, 0.)
+        # each quantum reads its input written by quantum it depends on
+        self._checkOutputs(butler)
+        for name in ("ds1", "ds2"):
+            self.assertEqual(len(butler.datasets[name]), self.nQuanta)
+
+        # nothing is executed in parent process, every worker makes each
+        # task at most once
+        tasks = taskFactory.getTasks()
+        self.assertNotIn(str(os.getpid()), set(pid for pid, _ in tasks))
+        self.assertEqual(len(tasks), len(set(tasks)))
+        self.assertLessEqual(len(set(pid for pid, _ in tasks)), 2)
+        self.assertEqual(set(name for _, name in tasks), {"ds0", "ds1", "ds2"})
+
+    def testFailureParallel(self):
+        """Test that failures are propagated to dependent quanta.
+        """
+        butler = FileButlerMock(self.butlerDir)
+        graph = self._makeGraph(butler, taskClasses=(AddTask, FailTask, AddTask))
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, numProcesses=2)
+        reports = executor.execute(graph)
+        statuses = {}
+        for report in reports:
+            statuses.setdefault(report.status, []).append(report.label)
+        self.assertEqual(statuses["failed"], ["task1"])
+        self.assertEqual(statuses["skipped"], ["task2"])
+        self.assertEqual(len(statuses["success"]), 3 * self.nQuanta - 2)
+        self.assertEqual(len(butler.datasets["ds3"]), self.nQuanta - 1)
+
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, numProcesses=2,
+                                                      doRaise=True)
+        with self.assertRaises(RuntimeError):
+            executor.execute(graph)
+
+    def testTimeout(self):
+        """Test that waiting for a quantum is limited by timeout.
+        """
+        butler = FileButlerMock(self.butlerDir)
+        graph = self._makeGraph(butler, taskClasses=(AddTask, SleepTask, AddTask))
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, numProcesses=2,
+                                                      timeout=0.5)
+        startTime = time.time()
+        with self.assertRaises(RuntimeError):
+            executor.execute(graph)
+        # workers are terminated, not waited for
+        self.assertLess(time.time() - startTime, 10.)
+
+    def testMemoryBudget(self):
+        """Test that memory needed by tasks limits number of concurrent
+        quanta.
+        """
+        taskClasses = (TimedTask, TimedTask, TimedTask)
+        for maxMemoryMB, maxConcurrency in ((1000, 1), (1200, 2)):
+            butler = FileButlerMock(tempfile.mkdtemp(dir=self.tmpDir))
+            graph = self._makeGraph(butler, taskClasses=taskClasses, memoryMB=600)
+            executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, numProcesses=2,
+                                                          maxMemoryMB=maxMemoryMB)
+            reports = executor.execute(graph)
+            self.assertEqual([report.status for report in reports], ["success"] * 3 * self.nQuanta)
+            self._checkOutputs(butler)
+            self.assertEqual(self._maxConcurrency(butler), maxConcurrency)
+
+    def testExceedBudget(self):
+        """Test that quanta which do not fit into budget are executed alone.
+        """
+        butler = FileButlerMock(self.butlerDir)
+        graph = self._makeGraph(butler, taskClasses=(TimedTask, TimedTask, TimedTask), memoryMB=2000)
+        executor = pipeBase.LocalQuantumGraphExecutor(TaskFactoryMock(), butler, numProcesses=2,
+                                                      maxMemoryMB=1000)
+        with self.assertLogs("pipe.base.localExecutor", level="WARNING") as logs:
+            reports = executor.execute(graph)
+        self.assertEqual(len(logs.records), 3 * self.nQuanta)
+        self.assertEqual([report.status for report in reports], ["success"] * 3 * self.nQuanta)
+        self._checkOutputs(butler)
+        self.assertEqual(self._maxConcurrency(butler), 1)
+
+
+class InMemoryDatasetCacheTestCase(unittest.TestCase):
+    """A test case for InMemoryDatasetCache
+    """
+
+    def testRefCount(self):
+        cache = pipeBase.InMemoryDatasetCache()
+        cache.put("a", 1)
+        self.assertNotIn("a", cache)
+
+        cache.addConsumer("a")
+        cache.addConsumer("a")
+        cache.put("a", 1)
+        self.assertIn("a", cache)
+        self.assertEqual(cache.get("a"), 1)
+        cache.release("a")
+        self.assertIn("a", cache)
+        cache.release("a")
+        self.assertNotIn("a", cache)
+        self.assertEqual(len(cache), 0)
+        with self.assertRaises(KeyError):
+            cache.get("a")
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
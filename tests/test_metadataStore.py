@@ -0,0 +1,104 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for MetadataStore.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lsst.daf.base as dafBase
+import lsst.utils.tests
+from lsst.pipe.base import MetadataStore
+
+
+def _makeMetadata(value):
+    metadata = dafBase.PropertySet()
+    metadata.set("task.value", value)
+    return metadata
+
+
+class MetadataStoreTestCase(unittest.TestCase):
+    """A test case for MetadataStore
+    """
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, "metadata.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+    def testPutGet(self):
+        """Test writing and reading records
+        """
+        with MetadataStore(self.path, commitInterval=2) as store:
+            for visit in range(5):
+                store.put("task_metadata", {"visit": visit, "ccd": 1}, _makeMetadata(visit))
+            # key does not depend on order of data ID keys
+            self.assertEqual(store.get("task_metadata", {"ccd": 1, "visit": 3}).getScalar("task.value"), 3)
+            with self.assertRaises(KeyError):
+                store.get("other_metadata", {"ccd": 1, "visit": 3})
+        # records are persisted and replaced on rewrite
+        with MetadataStore(self.path) as store:
+            self.assertEqual(len(store), 5)
+            store.put("task_metadata", MetadataStore.makeKey({"visit": 0, "ccd": 1}), _makeMetadata(10))
+            self.assertEqual(len(store), 5)
+            self.assertEqual(store.get("task_metadata", {"visit": 0, "ccd": 1}).getScalar("task.value"), 10)
+            self.assertIn(("task_metadata", {"visit": 4, "ccd": 1}), store.keys("task_metadata"))
+            self.assertEqual(store.keys("other_metadata"), [])
+
+    def testMultipleDataIds(self):
+        """Test keys made of multiple data IDs
+        """
+        dataIds = [{"visit": 1}, {"visit": 2}]
+        with MetadataStore(self.path) as store:
+            store.put("task_metadata", dataIds, _makeMetadata(1))
+            self.assertEqual(store.keys(), [("task_metadata", dataIds)])
+            self.assertEqual(store.get("task_metadata", dataIds).getScalar("task.value"), 1)
+
+    def testMerge(self):
+        """Test merging stores
+        """
+        otherPath = os.path.join(self.tmpDir, "other.sqlite3")
+        with MetadataStore(otherPath) as other:
+            other.put("task_metadata", {"visit": 1}, _makeMetadata(1))
+            other.put("task_metadata", {"visit": 2}, _makeMetadata(2))
+        with MetadataStore(self.path) as store:
+            store.put("task_metadata", {"visit": 1}, _makeMetadata(0))
+            store.merge(otherPath)
+            self.assertEqual(len(store), 2)
+            self.assertEqual(store.get("task_metadata", {"visit": 1}).getScalar("task.value"), 1)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,138 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for task metrics classes and MetricsSink.
+"""
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import lsst.utils.tests
+import lsst.pipe.base as pipeBase
+
+
+class TaskMetricsTestCase(unittest.TestCase):
+    """A test case for TaskMetrics
+    """
+
+    def _makeMetrics(self):
+        metrics = pipeBase.TaskMetrics()
+        metrics.counter("numSources").inc(10)
+        metrics.counter("numSources").inc()
+        metrics.gauge("background").set(3.5)
+        histogram = metrics.histogram("iterations", buckets=[5, 1])
+        for value in (0, 1, 3, 100):
+            histogram.observe(value)
+        return metrics
+
+    def testMetrics(self):
+        metrics = self._makeMetrics()
+        self.assertEqual(len(metrics), 3)
+        self.assertEqual(metrics.counter("numSources").value, 11)
+        self.assertEqual(metrics.gauge("background").value, 3.5)
+        histogram = metrics.histogram("iterations", buckets=[1, 5])
+        self.assertEqual(histogram.buckets, (1., 5.))
+        self.assertEqual(list(histogram.counts), [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.sum, 104.)
+        with self.assertRaises(TypeError):
+            metrics.gauge("numSources")
+        with self.assertRaises(ValueError):
+            metrics.counter("numSources").inc(-1)
+
+    def testMerge(self):
+        metrics = self._makeMetrics()
+        metrics.merge(pickle.loads(pickle.dumps(self._makeMetrics())))
+        self.assertEqual(metrics.counter("numSources").value, 22)
+        self.assertEqual(metrics.gauge("background").value, 3.5)
+        self.assertEqual(list(metrics.histogram("iterations", buckets=[1, 5]).counts), [4, 2, 2])
+        with self.assertRaises(ValueError):
+            metrics.histogram("iterations", [1, 5]).merge(pipeBase.Histogram([1, 10]))
+
+
+class MetricsSinkTestCase(unittest.TestCase):
+    """A test case for MetricsSink
+    """
+
+    def _makeTimingTree(self):
+        timingTree = pipeBase.TimingTree()
+        with timingTree.measure("task.run"):
+            for i in range(3):
+                with timingTree.measure("task.sub.run"):
+                    pass
+        return timingTree
+
+    def testMetrics(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "metrics.prom")
+            sink = pipeBase.MetricsSink(path, "task", buckets=(1., 0.001), minInterval=3600.)
+            sink.update(pipeBase.Struct(exitStatus=0, timingTree=self._makeTimingTree()))
+            self.assertTrue(os.path.exists(path))
+            sink.update(pipeBase.Struct(exitStatus=1, timingTree=self._makeTimingTree()))
+            sink.update(pipeBase.Struct(exitStatus=0))
+            # not written again within minInterval
+            with open(path) as metricsFile:
+                self.assertIn('pipe_base_targets_total{task="task",status="success"} 1\n',
+                              metricsFile.read())
+            sink.write()
+            with open(path) as metricsFile:
+                lines = metricsFile.read().splitlines()
+            # no temporary files are left
+            self.assertEqual(os.listdir(tmpDir), ["metrics.prom"])
+
+        self.assertEqual(lines[-1], "# EOF")
+        self.assertIn('pipe_base_targets_total{task="task",status="success"} 2', lines)
+        self.assertIn('pipe_base_targets_total{task="task",status="failure"} 1', lines)
+        self.assertIn('pipe_base_method_calls_total{task="task",method="task.sub.run"} 6', lines)
+        self.assertIn('pipe_base_method_duration_seconds_count{task="task",method="task.run"} 2', lines)
+        self.assertIn('pipe_base_method_duration_seconds_bucket{task="task",method="task.run",le="1.0"} 2',
+                      lines)
+        self.assertIn('pipe_base_method_duration_seconds_bucket{task="task",method="task.run",le="+Inf"} 2',
+                      lines)
+        self.assertIn("# TYPE pipe_base_target_duration_seconds histogram", lines)
+
+    def testTaskMetrics(self):
+        metrics = pipeBase.TaskMetrics()
+        metrics.counter("numSources").inc(5)
+        metrics.histogram("iterations", buckets=[1]).observe(3)
+        sink = pipeBase.MetricsSink("unused", "task")
+        for i in range(2):
+            sink.addResult(pipeBase.Struct(exitStatus=0, taskMetrics={"task.sub": metrics}))
+        lines = sink.format().splitlines()
+        self.assertIn('pipe_base_task_counter_total{task="task",subtask="task.sub",metric="numSources"} 10',
+                      lines)
+        self.assertIn('pipe_base_task_histogram_count{task="task",subtask="task.sub",metric="iterations"} 2',
+                      lines)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
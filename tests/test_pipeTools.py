@@ -27,7 +27,7 @@ import unittest
 from lsst.pipe.base import (PipelineTask, PipelineTaskConfig,
                             InputDatasetField, OutputDatasetField,
                             DatasetTypeDescriptor, Pipeline,
-                            TaskDef, pipeTools)
+                            TaskDef, TaskFactory, FusedPipelineTask, pipeTools)
 import lsst.utils.tests
 
 
@@ -104,6 +104,15 @@ class ExamplePipelineTask(PipelineTask):
         return types
 
 
+class TaskFactoryMock(TaskFactory):
+    def loadTaskClass(self, taskName):
+        if taskName == "ExamplePipelineTask":
+            return ExamplePipelineTask, "ExamplePipelineTask"
+
+    def makeTask(self, taskClass, config, overrides, butler):
+        return taskClass(config=config)
+
+
 def _makePipeline(tasks):
     """Generate Pipeline instance.
 
@@ -248,6 +257,14 @@ class PipelineToolsTestCase(unittest.TestCase):
         self.assertEqual(pipeline[2].label, "task2")
         self.assertEqual(pipeline[3].label, "task4")
 
+        # long chain in reverse order
+        nTasks = 200
+        pipeline = _makePipeline([("D{}".format(i), "D{}".format(i + 1), "task{}".format(i))
+                                  for i in reversed(range(nTasks))])
+        pipeline = pipeTools.orderPipeline(pipeline)
+        self.assertEqual([taskDef.label for taskDef in pipeline],
+                         ["task{}".format(i) for i in range(nTasks)])
+
     def testOrderPipelineExceptions(self):
         """Tests for pipeTools.orderPipeline method exceptions
         """
@@ -278,6 +295,86 @@ class PipelineToolsTestCase(unittest.TestCase):
         with self.assertRaises(pipeTools.PipelineDataCycleError):
             pipeline = pipeTools.orderPipeline(pipeline)
 
+    def testFusePipeline(self):
+        """Tests for pipeTools.fusePipeline method
+        """
+        def dsNames(dsTypes):
+            return set(dsTypeDescr.name for dsTypeDescr in dsTypes.values())
+
+        def makePipeline(tasks):
+            pipeline = _makePipeline(tasks)
+            for taskDef in pipeline:
+                taskDef.config.quantum.dimensions = ["Visit", "Detector"]
+            return pipeline
+
+        # simple chain is fused into one task
+        pipeline = makePipeline([("A", "B", "task1"),
+                                 ("B", "C", "task2"),
+                                 ("C", "D", "task3")])
+        fused = pipeTools.fusePipeline(pipeline)
+        self.assertEqual(len(fused), 1)
+        taskDef = fused[0]
+        self.assertIs(taskDef.taskClass, FusedPipelineTask)
+        self.assertEqual(taskDef.label, "task1+task2+task3")
+        self.assertEqual(list(taskDef.config.quantum.dimensions), ["Visit", "Detector"])
+        self.assertEqual(dsNames(taskDef.taskClass.getInputDatasetTypes(taskDef.config)), {"A"})
+        self.assertEqual(dsNames(taskDef.taskClass.getOutputDatasetTypes(taskDef.config)), {"D"})
+        members = FusedPipelineTask.getMembers(taskDef.config)
+        self.assertEqual([member.label for member in members], ["task1", "task2", "task3"])
+        self.assertEqual(members[1].config.input1.name, "B")
+
+        # requested intermediates are outputs
+        fused = pipeTools.fusePipeline(pipeline, keepOutputs=["B"])
+        self.assertEqual(len(fused), 1)
+        self.assertEqual(dsNames(fused[0].taskClass.getOutputDatasetTypes(fused[0].config)), {"B", "D"})
+
+        # branches are not fused, intermediate consumed by other task is kept
+        pipeline = makePipeline([("A", ("B", "C"), "task1"),
+                                 ("B", "D", "task2"),
+                                 (("C", "B"), "E", "task3")])
+        fused = pipeTools.fusePipeline(pipeline)
+        self.assertEqual([taskDef.label for taskDef in fused], ["task1+task2", "task3"])
+        self.assertEqual(dsNames(fused[0].taskClass.getOutputDatasetTypes(fused[0].config)), {"B", "C", "D"})
+        self.assertIs(fused[1], pipeline[2])
+
+        # different quantum dimensions are not fused
+        pipeline = makePipeline([("A", "B", "task1"),
+                                 ("B", "C", "task2")])
+        pipeline[1].config.quantum.dimensions = ["Visit"]
+        fused = pipeTools.fusePipeline(pipeline)
+        self.assertEqual([taskDef.label for taskDef in fused], ["task1", "task2"])
+
+        # task classes are loaded into copies of task definitions
+        pipeline = makePipeline([("A", "B", "task1", None),
+                                 ("B", "C", "task2", None)])
+        fused = pipeTools.fusePipeline(pipeline, TaskFactoryMock())
+        self.assertEqual(len(fused), 1)
+        self.assertEqual([taskDef.taskClass for taskDef in pipeline], [None, None])
+
+    def testPrunePipeline(self):
+        """Tests for pipeTools.prunePipeline method
+        """
+        pipeline = _makePipeline([(("D", "E"), "F", "task4"),
+                                  ("A", ("B", "C"), "task1"),
+                                  ("B", "D", "task2"),
+                                  ("C", "E", "task3"),
+                                  ("A", "G", "task5")])
+        pruned = pipeTools.prunePipeline(pipeline, ["D"])
+        self.assertEqual([taskDef.label for taskDef in pruned], ["task1", "task2"])
+        self.assertIs(pruned[0], pipeline[1])
+
+        pruned = pipeTools.prunePipeline(pipeline, ["F", "G"])
+        self.assertEqual([taskDef.label for taskDef in pruned], ["task1", "task2", "task3", "task4", "task5"])
+
+        pruned = pipeTools.prunePipeline(pipeline, ["C", "G"])
+        self.assertEqual([taskDef.label for taskDef in pruned], ["task1", "task5"])
+
+        pruned = pipeTools.prunePipeline(pipeline, [])
+        self.assertEqual(len(pruned), 0)
+
+        with self.assertRaises(pipeTools.MissingTargetError):
+            pipeTools.prunePipeline(pipeline, ["A"])
+
 
 class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
     pass
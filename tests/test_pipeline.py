@@ -22,8 +22,11 @@
 """Simple unit test for Pipeline.
 """
 
-import unittest
+import os
 import pickle
+import shutil
+import tempfile
+import unittest
 
 import lsst.pex.config as pexConfig
 from lsst.pipe.base import Struct, PipelineTask, PipelineTaskConfig, Pipeline, TaskDef
@@ -121,6 +124,42 @@ class TaskTestCase(unittest.TestCase):
         self.assertEqual(pipeline[0].taskName, "lsst.pipe.base.tests.Add")
         self.assertEqual(pipeline[1].taskName, "lsst.pipe.base.tests.Mult")
 
+    def testSaveLoad(self):
+        """Test saving and loading pipeline.
+        """
+        config = AddConfig()
+        config.addend = 5.
+        pipeline = Pipeline([TaskDef("lsst.pipe.base.tests.Add", config, AddTask, "add"),
+                             TaskDef("lsst.pipe.base.tests.Mult", MultConfig(), MultTask, "mult")])
+        tmpDir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpDir, "pipeline.json")
+            pipeline.save(filename)
+            pipeline = Pipeline.load(filename)
+            self.assertIsInstance(pipeline, Pipeline)
+            self.assertEqual([taskDef.label for taskDef in pipeline], ["add", "mult"])
+            self.assertEqual(pipeline[0].taskName, "lsst.pipe.base.tests.Add")
+            self.assertIsNone(pipeline[0].taskClass)
+
+            # saving a loaded pipeline does not need configs
+            pipeline.save(filename)
+            pipeline = Pipeline.load(filename)
+            self.assertIsInstance(pipeline[0].config, AddConfig)
+            self.assertEqual(pipeline[0].config.addend, 5.)
+            self.assertIsInstance(pipeline[1].config, MultConfig)
+            self.assertEqual(pipeline[1].config.multiplicand, 2.5)
+            # loaded configurations are frozen
+            with self.assertRaises(pexConfig.FieldValidationError):
+                pipeline[0].config.addend = 1.
+
+            # only differences from defaults are saved
+            with open(filename) as input:
+                text = input.read()
+            self.assertIn("addend", text)
+            self.assertNotIn("multiplicand", text)
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
 
 class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
     pass
@@ -258,6 +258,28 @@ class PipelineBuilderTestCase(unittest.TestCase):
         with self.assertRaises(LookupError):
             builder.configOverride("label", "field=value")
 
+    def test_FrozenConfig(self):
+        """Test that configurations of returned pipeline are frozen
+        """
+        builder = PipelineBuilder(TaskFactoryMock())
+        builder.addTask("TaskOne", "task")
+        pipeline = builder.pipeline()
+        config = pipeline[0].config
+        with self.assertRaises(pexConfig.FieldValidationError):
+            config.field = "value"
+
+        # dataset types of frozen configuration are served from cache
+        initInputs = TaskOne.getInitInputDatasetTypes(config)
+        self.assertEqual(initInputs["schema"].name, "schema")
+        self.assertIs(TaskOne.getInitInputDatasetTypes(config)["schema"], initInputs["schema"])
+
+        # overrides are applied to a copy of frozen configuration
+        builder.configOverride("task", "field=value")
+        pipeline = builder.pipeline()
+        self.assertIsNot(pipeline[0].config, config)
+        self.assertEqual(pipeline[0].config.field, "value")
+        self.assertIsNone(config.field)
+
     def test_ConfigFileTask(self):
         """Simple test case for config overrides in file
         """
@@ -29,6 +29,7 @@ import lsst.utils.tests
 from lsst.daf.butler import DatasetRef, Quantum, Run, DimensionUniverse
 import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipeBase
+from lsst.pipe.base import pipelineTask
 
 
 class ButlerMock():
@@ -104,6 +105,17 @@ class AddTask2(pipeBase.PipelineTask):
         return pipeBase.Struct(output=output)
 
 
+# example task which yields its outputs one by one
+class AddTask3(pipeBase.PipelineTask):
+    ConfigClass = AddConfig
+    _DefaultName = "add_task"
+
+    def adaptArgsAndRun(self, inputData, inputDataIds, outputDataIds, butler):
+        for val, dataId in zip(inputData["input"], outputDataIds["output"]):
+            if self.config.addend >= 0:
+                yield "output", dataId, val + self.config.addend
+
+
 class DatasetTypeDescriptorTestCase(unittest.TestCase):
     """A test case for DatasetTypeDescriptor
     """
@@ -159,6 +171,43 @@ class PipelineTaskTestCase(unittest.TestCase):
     """A test case for PipelineTask
     """
 
+    def testDatasetTypesCache(self):
+        """Test caching of dataset types
+        """
+        config = AddConfig()
+        inputs = AddTask.getInputDatasetTypes(config)
+        self.assertEqual(inputs["input"].name, "add_input")
+        self.assertIs(AddTask.getInputDatasetTypes(config)["input"], inputs["input"])
+        # changes of mutable configs are seen
+        config.input.name = "other_input"
+        self.assertEqual(AddTask.getInputDatasetTypes(config)["input"].name, "other_input")
+
+        config.freeze()
+        inputs = AddTask.getInputDatasetTypes(config)
+        self.assertEqual(inputs["input"].name, "other_input")
+        # cached descriptors are shared, dictionaries are not
+        inputs2 = AddTask.getInputDatasetTypes(config)
+        self.assertIs(inputs2["input"], inputs["input"])
+        inputs2.clear()
+        self.assertEqual(list(AddTask.getInputDatasetTypes(config)), ["input"])
+
+        # equal config shares cache, different config does not
+        config2 = AddConfig()
+        config2.input.name = "other_input"
+        config2.freeze()
+        self.assertIs(AddTask.getInputDatasetTypes(config2)["input"], inputs["input"])
+        config3 = AddConfig()
+        config3.freeze()
+        self.assertEqual(AddTask.getInputDatasetTypes(config3)["input"].name, "add_input")
+        self.assertEqual(AddTask.getOutputDatasetTypes(config3)["output"].name, "add_output")
+
+        # cache size is limited
+        for i in range(pipelineTask._DATASET_TYPES_CACHE_SIZE + 10):
+            config = AddConfig()
+            config.input.name = "input{}".format(i)
+            AddTask.getInputDatasetTypes(config)
+        self.assertEqual(len(pipelineTask._datasetTypesCache), pipelineTask._DATASET_TYPES_CACHE_SIZE)
+
     def _makeDSRefVisit(self, dstype, visitId):
         return DatasetRef(datasetType=dstype,
                           dataId=dict(camera="X",
@@ -214,6 +263,36 @@ class PipelineTaskTestCase(unittest.TestCase):
             ref = quantum.outputs[outputName][0]
             self.assertEqual(dsdata[butler.key(ref.dataId)], 100 + i + 3)
 
+    def testRunQuantumStream(self):
+        """Test for runQuantum() with task yielding its outputs.
+        """
+        butler = ButlerMock()
+        task = AddTask3(config=AddConfig())
+
+        quanta = self._makeQuanta(task.config)
+        descriptor = pipeBase.DatasetTypeDescriptor.fromConfig(task.config.input)
+        dstype0 = descriptor.makeDatasetType(butler.registry.dimensions)
+        for i, quantum in enumerate(quanta):
+            ref = quantum.predictedInputs[dstype0.name][0]
+            butler.put(100 + i, dstype0.name, ref.dataId)
+
+        for quantum in quanta:
+            task.runQuantum(quantum, butler)
+
+        outputName = task.config.output.name
+        dsdata = butler.datasets[outputName]
+        self.assertEqual(len(dsdata), len(quanta))
+        for i, quantum in enumerate(quanta):
+            ref = quantum.outputs[outputName][0]
+            self.assertEqual(dsdata[butler.key(ref.dataId)], 100 + i + 3)
+
+        # task which produces nothing
+        config = AddConfig()
+        config.addend = -1
+        task = AddTask3(config=config)
+        with self.assertRaises(pipeBase.StreamedOutputError):
+            task.runQuantum(quanta[0], butler)
+
     def testChain2(self):
         """Test for two-task chain.
         """
@@ -0,0 +1,83 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for SamplingProfiler.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+import lsst.utils.tests
+import lsst.pipe.base as pipeBase
+
+
+def busyLoop(seconds):
+    """Spin for a given time.
+    """
+    end = time.perf_counter() + seconds
+    count = 0
+    while time.perf_counter() < end:
+        count += 1
+    return count
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+    """A test case for SamplingProfiler
+    """
+
+    def testSampling(self):
+        with pipeBase.SamplingProfiler(interval=0.001) as profiler:
+            busyLoop(0.2)
+        self.assertGreater(len(profiler.samples), 0)
+        self.assertTrue(any("busyLoop" in stack.split(";")[-1] for stack in profiler.samples))
+        self.assertIn("busyLoop", profiler.formatSummary())
+
+        # no more samples after stop
+        nSamples = sum(profiler.samples.values())
+        busyLoop(0.05)
+        self.assertEqual(sum(profiler.samples.values()), nSamples)
+
+    def testReadWrite(self):
+        with pipeBase.SamplingProfiler(interval=0.001) as profiler:
+            busyLoop(0.05)
+        with tempfile.TemporaryDirectory() as tmpDir:
+            filename = os.path.join(tmpDir, "profile.txt")
+            profiler.writeCollapsedStacks(filename)
+            profiler2 = pipeBase.SamplingProfiler.readCollapsedStacks(filename)
+        self.assertEqual(profiler2.samples, profiler.samples)
+        profiler2.merge(profiler)
+        for stack, count in profiler.samples.items():
+            self.assertEqual(profiler2.samples[stack], 2 * count)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,123 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for QueryCache.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lsst.utils.tests
+from lsst.pipe.base import QueryCache
+
+
+class RegistryMock:
+    """Registry with a configuration which only defines database.
+    """
+    def __init__(self, db):
+        self.config = {"db": db}
+
+
+class QueryCacheTestCase(unittest.TestCase):
+    """A test case for QueryCache
+    """
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.tmpDir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir, ignore_errors=True)
+
+    def testMakeKey(self):
+        """Test that keys depend on values of all parameters
+        """
+        key = QueryCache.makeKey(userQuery="visit = 1", required=["raw"])
+        self.assertEqual(key, QueryCache.makeKey(required=["raw"], userQuery="visit = 1"))
+        self.assertNotEqual(key, QueryCache.makeKey(required=["raw"], userQuery="visit = 2"))
+        self.assertNotEqual(key, QueryCache.makeKey(required=["calexp"], userQuery="visit = 1"))
+
+    def testPutGet(self):
+        """Test storing and reading rows
+        """
+        cache = QueryCache(self.cacheDir)
+        key = cache.makeKey(userQuery="")
+        self.assertIsNone(cache.get(key, "1"))
+        cache.put(key, "1", [(1, 2), (3, 4)])
+        self.assertEqual(cache.get(key, "1"), [(1, 2), (3, 4)])
+
+        # registry has changed
+        self.assertIsNone(cache.get(key, "2"))
+        cache.put(key, "2", [(5, 6)])
+        self.assertEqual(cache.get(key, "2"), [(5, 6)])
+        self.assertIsNone(cache.get(key, "1"))
+
+        # unknown state is never cached
+        self.assertIsNone(cache.get(key, None))
+        otherKey = cache.makeKey(userQuery="visit = 1")
+        cache.put(otherKey, None, [(7, 8)])
+        self.assertIsNone(cache.get(otherKey, "2"))
+
+        # damaged file is ignored
+        with open(os.path.join(self.cacheDir, key + ".pickle"), "wb") as cacheFile:
+            cacheFile.write(b"garbage")
+        self.assertIsNone(cache.get(key, "2"))
+
+        cache.put(key, "2", [(5, 6)])
+        cache.clear()
+        self.assertIsNone(cache.get(key, "2"))
+        self.assertEqual(os.listdir(self.cacheDir), [])
+
+    def testStateToken(self):
+        """Test default and custom registry state tokens
+        """
+        cache = QueryCache(self.cacheDir)
+        self.assertIsNone(cache.getStateToken(RegistryMock("sqlite:///:memory:")))
+        self.assertIsNone(cache.getStateToken(RegistryMock("postgresql://host/db")))
+
+        dbPath = os.path.join(self.tmpDir, "registry.sqlite3")
+        registry = RegistryMock("sqlite:///" + dbPath)
+        self.assertIsNone(cache.getStateToken(registry))
+        with open(dbPath, "w") as dbFile:
+            dbFile.write("x")
+        token = cache.getStateToken(registry)
+        self.assertIsNotNone(token)
+        with open(dbPath, "a") as dbFile:
+            dbFile.write("y")
+        self.assertNotEqual(cache.getStateToken(registry), token)
+
+        cache = QueryCache(self.cacheDir, stateToken=lambda registry: "state")
+        self.assertEqual(cache.getStateToken(registry), "state")
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,87 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for ResourceBudget.
+"""
+
+import unittest
+
+import lsst.utils.tests
+import lsst.pex.config as pexConfig
+import lsst.pipe.base as pipeBase
+
+
+class ResourceTaskConfig(pipeBase.PipelineTaskConfig):
+    resources = pexConfig.ConfigField(dtype=pipeBase.ResourceConfig, doc="resource configuration")
+
+
+class ResourceBudgetTestCase(unittest.TestCase):
+    """A test case for ResourceBudget
+    """
+
+    def testRequirements(self):
+        """Test for ResourceBudget.getRequirements method
+        """
+        self.assertEqual(pipeBase.ResourceBudget.getRequirements(pipeBase.PipelineTaskConfig()), (1, 0))
+        config = ResourceTaskConfig()
+        self.assertEqual(pipeBase.ResourceBudget.getRequirements(config), (1, 0))
+        config.resources.minNumCores = 2
+        config.resources.minMemoryMB = 1000
+        self.assertEqual(pipeBase.ResourceBudget.getRequirements(config), (2, 1000))
+
+    def testBudget(self):
+        """Test for ResourceBudget acquire/release
+        """
+        budget = pipeBase.ResourceBudget(4, 4000)
+        self.assertTrue(budget.isIdle())
+        self.assertTrue(budget.fits(4, 4000))
+        self.assertFalse(budget.fits(5, 0))
+        self.assertFalse(budget.fits(1, 5000))
+        budget.acquire(2, 3000)
+        self.assertFalse(budget.isIdle())
+        self.assertTrue(budget.fits(2, 1000))
+        self.assertFalse(budget.fits(1, 1001))
+        budget.release(2, 3000)
+        self.assertTrue(budget.isIdle())
+
+        budget = pipeBase.ResourceBudget(4)
+        self.assertTrue(budget.fits(1, 10**9))
+
+    def testMaxConcurrent(self):
+        """Test for ResourceBudget.maxConcurrent method
+        """
+        self.assertEqual(pipeBase.ResourceBudget(8).maxConcurrent(1, 1000), 8)
+        self.assertEqual(pipeBase.ResourceBudget(8).maxConcurrent(3, 0), 2)
+        self.assertEqual(pipeBase.ResourceBudget(8, 3000).maxConcurrent(1, 1000), 3)
+        self.assertEqual(pipeBase.ResourceBudget(8, 500).maxConcurrent(1, 1000), 1)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
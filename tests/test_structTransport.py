@@ -0,0 +1,97 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for Struct transport methods.
+"""
+
+import multiprocessing
+import pickle
+import unittest
+
+import numpy as np
+
+import lsst.utils.tests
+import lsst.pipe.base as pipeBase
+
+
+def _makeSharedStruct(value):
+    """Make struct in a worker process.
+    """
+    return pipeBase.SharedMemoryStruct(pipeBase.Struct(array=np.full(100000, value, dtype=np.float64)))
+
+
+class StructTransportTestCase(unittest.TestCase):
+    """A test case for dumpStruct/loadStruct and SharedMemoryStruct
+    """
+
+    def setUp(self):
+        self.struct = pipeBase.Struct(array=np.arange(100000, dtype=np.float64), name="value")
+
+    def _checkStruct(self, struct):
+        self.assertEqual(struct.name, "value")
+        np.testing.assert_array_equal(struct.array, self.struct.array)
+
+    def testDumpLoad(self):
+        payload, buffers = pipeBase.dumpStruct(self.struct)
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            # array data is not in the pickle
+            self.assertEqual(len(buffers), 1)
+            self.assertLess(len(payload), self.struct.array.nbytes)
+        self._checkStruct(pipeBase.loadStruct(payload, buffers))
+
+    @unittest.skipUnless(pipeBase.SharedMemoryStruct.isSupported(), "shared memory is not supported")
+    def testSharedMemory(self):
+        shmStruct = pipeBase.SharedMemoryStruct(self.struct)
+        # this is what is sent between processes
+        shmStruct = pickle.loads(pickle.dumps(shmStruct))
+        struct = shmStruct.unpack()
+        self._checkStruct(struct)
+        # array is writeable and independent of shared memory
+        struct.array[0] = -1.
+        self.assertEqual(struct.array[0], -1.)
+
+    @unittest.skipUnless(pipeBase.SharedMemoryStruct.isSupported(), "shared memory is not supported")
+    def testSharedMemoryPool(self):
+        """Test that structs can be unpacked after worker processes exit
+        """
+        nValues = 12
+        pool = multiprocessing.Pool(processes=2, maxtasksperchild=1)
+        try:
+            results = pool.map_async(_makeSharedStruct, range(nValues)).get(60)
+        finally:
+            pool.close()
+            pool.join()
+        for value, result in enumerate(results):
+            struct = result.unpack()
+            np.testing.assert_array_equal(struct.array, np.full(100000, value, dtype=np.float64))
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
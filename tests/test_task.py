@@ -19,6 +19,7 @@
 # the GNU General Public License along with this program.  If not,
 # see <http://www.lsstcorp.org/LegalNotices/>.
 #
+import concurrent.futures
 import time
 import unittest
 import numbers
@@ -105,6 +106,22 @@ class AddMultTask(pipeBase.Task):
             raise RuntimeError("failCtx intentional error")
 
 
+class ThreadedAddTask(pipeBase.Task):
+    """Run add subtask in a thread pool"""
+    ConfigClass = AddMultConfig
+    _DefaultName = "threadedAdd"
+
+    def __init__(self, **keyArgs):
+        pipeBase.Task.__init__(self, **keyArgs)
+        self.makeSubtask("add")
+
+    @pipeBase.timeMethod
+    def run(self, values):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(self.add.run, values))
+        return pipeBase.Struct(values=[result.val for result in results])
+
+
 class AddTwiceTask(AddTask):
     """Variant of AddTask that adds twice the addend"""
 
@@ -188,6 +205,55 @@ class TaskTestCase(unittest.TestCase):
         self.assertEqual(fullMetadata.getPropertySet("addMult:add").nameCount(), 0)
         self.assertEqual(fullMetadata.getPropertySet("addMult:mult").nameCount(), 0)
 
+    def testMetrics(self):
+        """Test that task metrics are saved to metadata
+        """
+        addMultTask = AddMultTask()
+        for i in range(5):
+            addMultTask.add.metrics.counter("numCalls").inc()
+        addMultTask.metrics.histogram("values", buckets=[0, 10]).observe(5)
+        self.assertNotIn("numCalls", addMultTask.add.metadata.names())
+        self.assertEqual(set(addMultTask.getFullMetrics().keys()), {"addMult", "addMult.add"})
+        fullMetadata = addMultTask.getFullMetadata()
+        self.assertEqual(fullMetadata.getPropertySet("addMult:add").getScalar("numCalls"), 5)
+        metadata = fullMetadata.getPropertySet("addMult")
+        self.assertEqual(list(metadata.getArray("valuesHistCounts")), [0, 1, 0])
+        self.assertEqual(metadata.getScalar("valuesHistCount"), 1)
+        # metadata is updated, not appended to
+        addMultTask.add.metrics.counter("numCalls").inc()
+        fullMetadata = addMultTask.getFullMetadata()
+        self.assertEqual(fullMetadata.getPropertySet("addMult:add").getArray("numCalls"), [6])
+        addMultTask.emptyMetadata()
+        self.assertEqual(addMultTask.getFullMetrics(), {})
+
+    def testClone(self):
+        """Test that clones have fresh state and their own subtasks
+        """
+        addMultTask = AddMultTask()
+        addMultTask.metadata.set("constructed", True)
+        self.assertIsNone(addMultTask.clone().getTimingTree())
+        addMultTask.enableTimingTree()
+        clone = addMultTask.clone()
+        self.assertIsInstance(clone, AddMultTask)
+        self.assertIsNot(clone.add, addMultTask.add)
+        self.assertIs(clone.add._parentTask, clone)
+        self.assertIs(clone.config, addMultTask.config)
+        self.assertEqual(set(clone.getTaskDict().keys()), set(addMultTask.getTaskDict().keys()))
+        for task in clone.getTaskDict().values():
+            self.assertIs(clone.getTaskDict()[task.getFullName()], task)
+            self.assertIs(task.getTimingTree(), clone.getTimingTree())
+        self.assertIsNot(clone.getTimingTree(), addMultTask.getTimingTree())
+
+        ret = clone.run(val=1.1)
+        self.assertAlmostEqual(ret.val, AddMultTask().run(val=1.1).val)
+        self.assertTrue(clone.metadata.getScalar("constructed"))
+        self.assertIn("runEndCpuTime", clone.add.metadata.names())
+        self.assertNotIn("runEndCpuTime", addMultTask.add.metadata.names())
+        self.assertEqual(len(addMultTask.getTimingTree().root.children), 0)
+
+        with self.assertRaises(RuntimeError):
+            addMultTask.add.clone()
+
     def testReplace(self):
         """Test replacing one subtask with another
         """
@@ -261,6 +327,80 @@ class TaskTestCase(unittest.TestCase):
         )
         self.assertLessEqual(addMultTask.add.metadata.getScalar("runEndCpuTime"), currCpuTime)
 
+    def testFastTiming(self):
+        """Test that timing samples are buffered in fast timing mode
+        """
+        addMultTask = AddMultTask()
+        addMultTask.enableFastTiming()
+        for val in range(3):
+            addMultTask.run(val=val)
+        # nothing is in metadata until buffers are flushed
+        self.assertNotIn("runStartCpuTime", addMultTask.metadata.names())
+        self.assertEqual(len(addMultTask._timingBuffer), 12)
+        fullMetadata = addMultTask.getFullMetadata()
+        self.assertEqual(len(addMultTask._timingBuffer), 0)
+        for taskName in ("addMult", "addMult:add"):
+            metadata = fullMetadata.getPropertySet(taskName)
+            for when in ("Start", "End"):
+                self.assertIsInstance(metadata.getScalar("run" + when + "Utc"), str)
+                self.assertEqual(len(metadata.getArray("run" + when + "CpuTime")), 3)
+            # resource usage is not measured in fast timing mode
+            self.assertNotIn("runStartMaxResidentSetSize", metadata.names())
+        self.assertLessEqual(
+            addMultTask.metadata.getArray("runStartCpuTime")[-1],
+            addMultTask.metadata.getArray("runEndCpuTime")[-1],
+        )
+
+        # disabling fast timing restores default behavior
+        addMultTask.enableFastTiming(False)
+        addMultTask.emptyMetadata()
+        addMultTask.run(val=1.1)
+        self.assertIn("runStartMaxResidentSetSize", addMultTask.metadata.names())
+
+    def testThreadSafeMetadata(self):
+        """Test timing and metadata of a subtask run in multiple threads
+        """
+        task = ThreadedAddTask()
+        task.enableThreadSafeMetadata()
+        task.enableTimingTree()
+        self.assertIsInstance(task.add.metadata, pipeBase.ThreadSafeMetadata)
+        nValues = 50
+        result = task.run(values=list(range(nValues)))
+        self.assertEqual(len(result.values), nValues)
+
+        fullMetadata = task.getFullMetadata()
+        addMetadata = fullMetadata.getPropertySet("threadedAdd:add")
+        self.assertEqual(len(addMetadata.getArray("add")), nValues)
+        self.assertEqual(len(addMetadata.getArray("runStartCpuTime")), nValues)
+        self.assertEqual(len(addMetadata.getArray("runEndCpuTime")), nValues)
+        self.assertEqual(task.add.metadata.getArray("add"), addMetadata.getArray("add"))
+
+        # calls from the pool threads are children of the method which
+        # started them
+        runNode = task.getTimingTree().root.children["threadedAdd.run"]
+        self.assertEqual(runNode.calls, 1)
+        self.assertEqual(runNode.children["threadedAdd.add.run"].calls, nValues)
+
+        # updates from other threads are checked for type immediately
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(task.metadata.addLongLong, "value", 1.5)
+            with self.assertRaises(TypeError):
+                future.result()
+
+        # buffers of finished threads are dropped after their updates are
+        # applied
+        for i in range(3):
+            task.run(values=list(range(nValues)))
+            addMetadata = task.getFullMetadata().getPropertySet("threadedAdd:add")
+            self.assertEqual(len(addMetadata.getArray("add")), nValues*(i + 2))
+            self.assertEqual(len(task.add.metadata._buffers), 0)
+
+        # subtasks made later and cleared metadata keep the mode
+        task.emptyMetadata()
+        self.assertIsInstance(task.add.metadata, pipeBase.ThreadSafeMetadata)
+        task.enableThreadSafeMetadata(False)
+        self.assertIsInstance(task.add.metadata, dafBase.PropertyList)
+
 
 class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
     pass
@@ -0,0 +1,147 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for TaskFactory.
+"""
+
+import pickle
+import threading
+import time
+import unittest
+
+import lsst.utils.tests
+from lsst.pipe.base import PipelineTask, TaskFactory
+
+
+class TaskOne(PipelineTask):
+    _DefaultName = "taskOne"
+
+
+class TaskTwo(PipelineTask):
+    _DefaultName = "taskTwo"
+
+
+class TaskFactoryMock(TaskFactory):
+    """Task factory which counts imports and simulates slow imports.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.fail = True
+
+    def loadTaskClass(self, taskName):
+        with self.lock:
+            self.calls.append(taskName)
+        time.sleep(0.05)
+        if taskName == "TaskOne":
+            return TaskOne, "test.TaskOne"
+        elif taskName == "TaskTwo":
+            return TaskTwo, "test.TaskTwo"
+        elif taskName == "Flaky" and not self.fail:
+            return TaskOne, "test.Flaky"
+        raise ImportError("Cannot import " + taskName)
+
+    def makeTask(self, taskClass, config, overrides, butler):
+        return taskClass(config=config, butler=butler)
+
+
+class SimpleTaskFactory(TaskFactory):
+    """Task factory without unpicklable members.
+    """
+
+    def loadTaskClass(self, taskName):
+        if taskName == "TaskOne":
+            return TaskOne, "test.TaskOne"
+        raise ImportError("Cannot import " + taskName)
+
+    def makeTask(self, taskClass, config, overrides, butler):
+        return taskClass(config=config, butler=butler)
+
+
+class TaskFactoryTestCase(unittest.TestCase):
+    """A test case for TaskFactory loading of task classes
+    """
+
+    def testLoadTaskClasses(self):
+        """Test loading task classes concurrently and caching them
+        """
+        factory = TaskFactoryMock()
+        classes = factory.loadTaskClasses(["TaskOne", "TaskTwo", "TaskOne"])
+        self.assertEqual(classes, {"TaskOne": (TaskOne, "test.TaskOne"),
+                                   "TaskTwo": (TaskTwo, "test.TaskTwo")})
+        self.assertCountEqual(factory.calls, ["TaskOne", "TaskTwo"])
+        self.assertCountEqual(factory.getImportTimes(), ["TaskOne", "TaskTwo"])
+        self.assertGreater(factory.getImportTimes()["TaskOne"], 0.)
+
+        # cached classes are not imported again
+        classes = factory.loadTaskClasses(["TaskTwo"])
+        self.assertEqual(classes, {"TaskTwo": (TaskTwo, "test.TaskTwo")})
+        self.assertEqual(len(factory.calls), 2)
+
+    def testStartLoading(self):
+        """Test loading task classes in background
+        """
+        factory = TaskFactoryMock()
+        factory.startLoadingTaskClasses(["TaskOne", "TaskTwo"])
+        classes = factory.loadTaskClasses(["TaskTwo", "TaskOne"])
+        self.assertEqual(classes["TaskOne"], (TaskOne, "test.TaskOne"))
+        self.assertCountEqual(factory.calls, ["TaskOne", "TaskTwo"])
+
+    def testErrors(self):
+        """Test that failed imports raise and are not cached
+        """
+        factory = TaskFactoryMock()
+        with self.assertRaises(ImportError):
+            factory.loadTaskClasses(["TaskOne", "Flaky"])
+        # successful loads are still cached
+        factory.loadTaskClasses(["TaskOne"])
+        self.assertEqual(factory.calls.count("TaskOne"), 1)
+        factory.fail = False
+        self.assertEqual(factory.loadTaskClasses(["Flaky"]), {"Flaky": (TaskOne, "test.Flaky")})
+        self.assertEqual(factory.calls.count("Flaky"), 2)
+
+    def testPickle(self):
+        """Test that factory can be pickled after loading classes
+        """
+        factory = SimpleTaskFactory()
+        factory.loadTaskClasses(["TaskOne"])
+        factory2 = pickle.loads(pickle.dumps(factory))
+        self.assertIsInstance(factory2, SimpleTaskFactory)
+        # loading state is not pickled, classes can be loaded again
+        self.assertEqual(factory2.getImportTimes(), {})
+        self.assertEqual(factory2.loadTaskClasses(["TaskOne"]),
+                         {"TaskOne": (TaskOne, "test.TaskOne")})
+        # original factory keeps its state
+        self.assertCountEqual(factory.getImportTimes(), ["TaskOne"])
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,179 @@
+# This file is part of pipe_base.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (http://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple unit test for TimingTree.
+"""
+
+import pickle
+import unittest
+
+import lsst.utils.tests
+import lsst.pex.config as pexConfig
+import lsst.pipe.base as pipeBase
+
+
+class AddConfig(pexConfig.Config):
+    addend = pexConfig.Field(doc="amount to add", dtype=float, default=3.1)
+
+
+class AddTask(pipeBase.Task):
+    ConfigClass = AddConfig
+
+    @pipeBase.timeMethod
+    def run(self, val):
+        return pipeBase.Struct(val=val + self.config.addend)
+
+
+class AllocateTask(pipeBase.Task):
+    ConfigClass = pexConfig.Config
+    _DefaultName = "allocate"
+
+    @pipeBase.timeMethod
+    def run(self, size):
+        with self.timer("temporary"):
+            temporary = bytearray(size)
+            del temporary
+        return bytearray(size // 10)
+
+
+class RepeatConfig(pexConfig.Config):
+    add = AddTask.makeField("add task")
+
+
+class RepeatTask(pipeBase.Task):
+    ConfigClass = RepeatConfig
+    _DefaultName = "repeat"
+
+    def __init__(self, **keyArgs):
+        pipeBase.Task.__init__(self, **keyArgs)
+        self.makeSubtask("add")
+
+    @pipeBase.timeMethod
+    def run(self, val, count):
+        with self.timer("loop"):
+            for i in range(count):
+                val = self.add.run(val).val
+        return pipeBase.Struct(val=val)
+
+
+class TimingTreeTestCase(unittest.TestCase):
+    """A test case for TimingTree
+    """
+
+    def testTaskTree(self):
+        """Test that task methods make a call tree
+        """
+        task = RepeatTask()
+        task.enableTimingTree()
+        self.assertIs(task.getTimingTree(), task.add.getTimingTree())
+        task.run(0., 5)
+        task.run(0., 3)
+        paths = {path: node for path, node in task.getTimingTree().walk()}
+        self.assertEqual(list(paths.keys()), [("repeat.run",),
+                                              ("repeat.run", "repeat.loop"),
+                                              ("repeat.run", "repeat.loop", "repeat.add.run")])
+        self.assertEqual(paths[("repeat.run",)].calls, 2)
+        self.assertEqual(paths[("repeat.run", "repeat.loop", "repeat.add.run")].calls, 8)
+        for node in paths.values():
+            self.assertGreaterEqual(node.wallTime, node.exclusiveWallTime)
+            self.assertGreaterEqual(node.exclusiveWallTime, 0.)
+
+        lines = task.getTimingTree().toCollapsedStacks()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[-1].startswith("repeat.run;repeat.loop;repeat.add.run "))
+
+    def testDisabled(self):
+        """Test that timing tree is only recorded when enabled
+        """
+        task = RepeatTask()
+        self.assertIsNone(task.getTimingTree())
+        task.run(0., 2)
+        self.assertIn("runEndCpuTime", task.add.metadata.names())
+
+        task.enableTimingTree()
+        timingTree = task.getTimingTree()
+        task.run(0., 2)
+        task.enableTimingTree()
+        self.assertIs(task.add.getTimingTree(), timingTree)
+        self.assertEqual(timingTree.root.children["repeat.run"].calls, 1)
+
+        task.enableTimingTree(False)
+        self.assertIsNone(task.add.getTimingTree())
+        task.run(0., 2)
+        self.assertEqual(timingTree.root.children["repeat.run"].calls, 1)
+
+    def testMerge(self):
+        """Test merging of pickled trees
+        """
+        tree = pipeBase.TimingTree()
+        for i in range(2):
+            task = RepeatTask()
+            task.enableTimingTree()
+            task.run(0., 2)
+            tree.merge(pickle.loads(pickle.dumps(task.getTimingTree())))
+        node = tree.root.children["repeat.run"]
+        self.assertEqual(node.calls, 2)
+        self.assertEqual(node.children["repeat.loop"].children["repeat.add.run"].calls, 4)
+
+    def testMemoryTracking(self):
+        """Test that allocated memory is measured per method
+        """
+        size = 10000000
+        task = AllocateTask()
+        task.enableTimingTree()
+        task.enableMemoryTracking()
+        try:
+            task.run(size)
+        finally:
+            task.enableMemoryTracking(False)
+        self.assertGreaterEqual(task.metadata.getScalar("temporaryPeakAllocated"), size)
+        self.assertLess(task.metadata.getScalar("temporaryNetAllocated"), size // 10)
+        self.assertGreaterEqual(task.metadata.getScalar("runPeakAllocated"), size)
+        self.assertGreaterEqual(task.metadata.getScalar("runNetAllocated"), size // 10)
+        self.assertLess(task.metadata.getScalar("runNetAllocated"), size)
+        node = task.getTimingTree().root.children["allocate.run"]
+        self.assertGreaterEqual(node.peakAllocated, size)
+        self.assertGreaterEqual(node.children["allocate.temporary"].peakAllocated, size)
+
+    def testFailure(self):
+        """Test that calls are finished when timed code fails
+        """
+        tree = pipeBase.TimingTree()
+        with self.assertRaises(RuntimeError):
+            with tree.measure("outer"):
+                with tree.measure("inner"):
+                    raise RuntimeError("intentional error")
+        self.assertEqual(tree.root.children["outer"].calls, 1)
+        self.assertEqual(tree.root.children["outer"].children["inner"].calls, 1)
+        self.assertEqual(len(tree._stack), 0)
+
+
+class MyMemoryTestCase(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()